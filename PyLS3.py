@@ -1,24 +1,39 @@
 #!/usr/bin/python3
 import asyncio
-from bleak import BleakScanner, BleakClient
-import serial_asyncio
-import serial.tools.list_ports
-from collections import deque
-from datetime import datetime, timedelta
-from typing import Any, Awaitable
+import numpy as np
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Awaitable
 from abc import ABC, abstractmethod
 import yaml
 import argparse
 import ast
 import os
 import re
+import time
+import hashlib
+import pickle
 import logging
-from PyLS3_plot import plot_csv
-from aioconsole import aprint, ainput
+from PyLS3_frame import FRAME_LENGTH, FrameDecoder, frames_measured_value, frames_to_columns
+from PyLS3_capture import CaptureBuffer, PreCaptureBuffer, first_true_index, frames_to_samples, samples_to_csv_lines
+from PyLS3_persistence import PersistencePipeline
+from PyLS3_pipeline import ReceivePipeline
+from PyLS3_stats import RxStatistics
+from PyLS3_trigger import TriggerEngine
+from PyLS3_timing import ClockAnchor, FrameClock
+from PyLS3_capturefile import CAPTURE_FILE_EXTENSION, CaptureStreamWriter, capture_file_save
+from PyLS3_discovery import DeviceDiscovery
+from PyLS3_logdownload import LogManifest, LogReceiver
+from PyLS3_commands import ACK_STATE, CommandTable
+from PyLS3_settings import MESSAGE_CODE_FIELDS, Settings
+from PyLS3_server import LiveServer
 import platform
 import warnings
+if TYPE_CHECKING:
+    from bleak import BleakClient       # bleak is imported when a Bluetooth device is connected
 
 
+logger = logging.getLogger("PyLS3")
+
 
 class CustomFormatter(logging.Formatter):
     grey = "\x1b[1;30m"
@@ -157,34 +172,135 @@ def yaml_save(data: dict, file: str) -> None:
         yaml.dump(data, outfile, sort_keys=False, width=float("inf"), indent=4, Dumper=Dumper)
 
 
-def load_PyLS3_Conf(args):
-    # Load configuration files
-    PyLS3_AppCfg = yaml_load(args.appcfg)
-    PyLS3_UserCfg = yaml_load(args.usercfg)
-    # PyLS3_Conf = {**PyLS3_AppCfg, **PyLS3_UserCfg}   # UserCfg overrides AppCfg
-    PyLS3_Conf = deep_merge(PyLS3_AppCfg, PyLS3_UserCfg)
-    if args.conf:
-        args_dict = gen_args_dict(args.conf)
-        PyLS3_Conf = deep_merge(PyLS3_Conf, args_dict)
-        del args_dict
-    return PyLS3_Conf
+CONF_CACHE_FILE = '.PyLS3_Conf.cache'         # next to the AppCfg
+CONF_CACHE_VERSION = 1
+CONF_BACKUP_MARKER = '.PyLS3_Conf.last_backup'  # in Path: Backup
+
+
+def file_sha256(file: str) -> str:
+    with open(file, 'rb') as infile:
+        return hashlib.sha256(infile.read()).hexdigest()
 
 
-def csv_save(device_name, data) -> str:
+def conf_cache_load(cache_file: str, files: list, conf_args: list):
     """
-    Save data to an csv File
+    :param cache_file: cache file
+    :param files: configuration files
+    :param conf_args: -c args
+    :return: cache (dict) if it's valid for the files (mtime and size, or sha256 if they changed) and the args, else None
+    """
+    try:
+        with open(cache_file, 'rb') as infile:
+            cache = pickle.load(infile)
+        if cache['version'] != CONF_CACHE_VERSION or cache['conf_args'] != conf_args or list(cache['files']) != files:
+            return None
+        for file in files:
+            mtime_ns, size, sha256 = cache['files'][file]
+            stat = os.stat(file)
+            if (stat.st_mtime_ns, stat.st_size) != (mtime_ns, size):
+                if file_sha256(file) != sha256:
+                    return None
+                # touched, but not changed
+                cache['files'][file] = (stat.st_mtime_ns, stat.st_size, sha256)
+                cache['touched'] = True
+        return cache
+    except Exception as e:
+        logger.debug(f"Configuration cache '{cache_file}' not used: {e}")
+        return None
+
+
+def load_PyLS3_Conf(args, with_sources: bool = False):
+    """
+    Load the configuration files and merge them (UserCfg overrides AppCfg and args override both).
+    The merged configuration is cached (CONF_CACHE_FILE), the yaml files are only parsed again if they have changed.
+    :param args: args with appcfg, usercfg, conf
+    :param with_sources: also return the AppCfg, UserCfg and the key of the configuration (e.g. for the backups)
+    :return: PyLS3_Conf | PyLS3_Conf, PyLS3_AppCfg, PyLS3_UserCfg, key
+    """
+    files = [args.appcfg, args.usercfg]
+    conf_args = list(args.conf or [])
+    cache_file = os.path.join(os.path.dirname(args.appcfg), CONF_CACHE_FILE)
+    cache = conf_cache_load(cache_file, files, conf_args)
+    if cache is None or cache.get('touched'):
+        if cache is None:
+            # Load configuration files
+            PyLS3_AppCfg = yaml_load(args.appcfg)
+            PyLS3_UserCfg = yaml_load(args.usercfg)
+            # PyLS3_Conf = {**PyLS3_AppCfg, **PyLS3_UserCfg}   # UserCfg overrides AppCfg
+            PyLS3_Conf = deep_merge(PyLS3_AppCfg, PyLS3_UserCfg)
+            if args.conf:
+                args_dict = gen_args_dict(args.conf)
+                PyLS3_Conf = deep_merge(PyLS3_Conf, args_dict)
+                del args_dict
+            sources = dict()
+            for file in files:
+                stat = os.stat(file)
+                sources[file] = (stat.st_mtime_ns, stat.st_size, file_sha256(file))
+            key = hashlib.sha256(repr(([sources[f][2] for f in files], conf_args)).encode('utf-8')).hexdigest()
+            cache = {'version': CONF_CACHE_VERSION, 'files': sources, 'conf_args': conf_args, 'key': key,
+                     'AppCfg': PyLS3_AppCfg, 'UserCfg': PyLS3_UserCfg, 'Conf': PyLS3_Conf}
+        cache.pop('touched', None)
+        try:
+            with open(f"{cache_file}.tmp", 'wb') as outfile:
+                pickle.dump(cache, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{cache_file}.tmp", cache_file)
+        except OSError as e:
+            logger.debug(f"Configuration cache '{cache_file}' not saved: {e}")
+    if with_sources:
+        return cache['Conf'], cache['AppCfg'], cache['UserCfg'], cache['key']
+    return cache['Conf']
+
+
+def conf_backup(PyLS3_Conf: dict, PyLS3_AppCfg: dict, PyLS3_UserCfg: dict, key: str, args) -> bool:
+    """
+    Save a backup of PyLS3_AppCfg, PyLS3_UserCfg and the merged PyLS3_Conf, if the configuration has changed since the last backup
+    :param key: key of the configuration (see load_PyLS3_Conf)
+    :return: True if the backup was saved
+    """
+    marker_name, marker_dir, marker = norm_file_and_path(f"{PyLS3_Conf['Path']['Backup']}/{CONF_BACKUP_MARKER}")
+    try:
+        with open(marker, 'r') as infile:
+            if infile.read().strip() == key:
+                logger.debug("Configuration unchanged since the last backup")
+                return False
+    except OSError:
+        pass
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    yaml_save(PyLS3_AppCfg, f"{PyLS3_Conf['Path']['Backup']}/{timestamp}_{os.path.basename(args.appcfg)}")
+    yaml_save(PyLS3_UserCfg, f"{PyLS3_Conf['Path']['Backup']}/{timestamp}_{os.path.basename(args.usercfg)}")
+    yaml_save(PyLS3_Conf, f"{PyLS3_Conf['Path']['Backup']}/{timestamp}_PyLS3_Conf.yml")
+    with open(marker, 'w') as outfile:
+        outfile.write(key)
+    return True
+
+
+def capture_filename(device_name: str, timestamp: datetime = None, extension: str = '.csv') -> str:
+    """
+    Creates the filename for a capture (the data directory is created)
     :param device_name:
-    :param data:
-    :return:
+    :param timestamp: timestamp for the filename (default: now)
+    :param extension: file extension
+    :return: filename
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    dir_name = os.path.join(script_dir, PyLS3_Conf['Path']['Data'])
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    file_name = f"{timestamp}_{device_name}.csv"
+    dir_name = os.path.join(script_dir, Connection.settings.conf['Path']['Data'])
+    timestamp = (timestamp or datetime.now()).strftime('%Y%m%d_%H%M%S')
+    file_name = f"{timestamp}_{device_name}{extension}"
     file = os.path.join(dir_name, file_name)
     # file_name, dir_name, file = norm_file_and_path(file)
     make_dir(dir_name)
+    return file
+
 
+def csv_save(device_name, data, timestamp: datetime = None) -> str:
+    """
+    Save data to an csv File
+    :param device_name:
+    :param data:
+    :param timestamp: timestamp for the filename (default: now)
+    :return:
+    """
+    file = capture_filename(device_name, timestamp, '.csv')
     with open(file, 'w') as outfile:
         for line in data:
             outfile.write(line + "\n")
@@ -193,24 +309,51 @@ def csv_save(device_name, data) -> str:
     return file
 
 
+def capture_csv_save(device_name: str, samples: np.ndarray, timestamp: datetime = None, message_code: dict = None) -> str:
+    """
+    Serialize captured samples and save them to an csv File
+    :param device_name:
+    :param samples: structured array (PyLS3_capture.SAMPLE_DTYPE)
+    :param timestamp: timestamp for the filename (default: now)
+    :param message_code: PyLS3_Conf['MessageCode'] (default: Connection.settings)
+    :return: csv filename
+    """
+    message_code = message_code or Connection.settings.message_codes.conf
+    return csv_save(device_name, samples_to_csv_lines(samples, device_name, message_code), timestamp)
+
+
+def capture_binary_save(device_name: str, samples: np.ndarray, timestamp: datetime = None, message_code: dict = None) -> str:
+    """
+    Save captured samples to a binary capture file (see PyLS3_capturefile)
+    :param device_name:
+    :param samples: structured array (PyLS3_capture.SAMPLE_DTYPE)
+    :param timestamp: timestamp for the filename (default: now)
+    :param message_code: PyLS3_Conf['MessageCode'] (default: Connection.settings)
+    :return: capture filename
+    """
+    file = capture_filename(device_name, timestamp, CAPTURE_FILE_EXTENSION)
+    return capture_file_save(file, device_name, samples, message_code or Connection.settings.message_codes.conf)
+
+
 def csv_save_file(data: Any, file: str, Override: bool = "True"):
     """
     Save data to an csv File
     :param data:
     :param file:
-    :return:
+    :return: filename
     """
     file_name, dir_name, file = norm_file_and_path(file)
 
     if os.path.isfile(file) and not Override:
         logger.warning(f"INFO> File '{file}' already exists, skipping.")
-        return
+        return file
 
     make_dir(dir_name)
     with open(file, 'w') as outfile:
         for line in data:
             outfile.write(line + "\n")
         outfile.close()
+    return file
 
 
 def hex_to_string(hex) -> str:
@@ -301,67 +444,6 @@ def gen_args_dict(conf_string_list):
     return args_dict
 
 
-def LS3crc(command: str) -> str:
-    """
-    Calculate CRC for Linescale3 Commands
-    :param command: LS3 command without crc
-    :return: LS3 CRC
-    """
-    crc = 0
-    command = command.replace(" ", "")          # Remove space
-    n = 2
-    # for i in command.split():
-    for i in range(0, len(command), n):
-        v = command[i:i+n]
-        crc += int(f'0x{v}', 16)
-    h = hex(crc)
-    h = h[2:]
-    return str(h)
-
-
-# command_without_crc = '41 0D 0A'
-# command_with_crc = LS3command_crc(command_without_crc)
-# print(command_without_crc, ' - ', command_with_crc)
-def LS3command_crc(command: str):
-    """
-    Generates the LS3 command with CRC for commands without crc
-    Calculate CRC for Linescale3 Commands
-    :param command: LS3 command without crc
-    :return: LS3 command with crc
-    """
-    crc = LS3crc(command)
-    return f'{command} {crc}'.upper()
-
-
-def LS3xyget(value):
-    """
-    Splits a number in 2 pieces
-    :param value:
-    :return:
-    """
-    value = f'{value:02d}'
-    return split(value)
-
-
-# LS3ReadLogxy()
-def LS3ReadLogxy():
-    """
-    Creates the LS3 commands for reading the onboard logging Data
-    :return: Commands in dict
-    """
-    for i in range(100):
-        x, y = LS3xyget(i)
-        command_without_crc = f"52 3{x} 3{y} 0D 0A"
-        command_with_crc = LS3command_crc(command_without_crc)
-        # print(f"ReadLog{i + 1} = {command_with_crc}")
-        PyLS3_Conf['Commands'][f"ReadLog{i + 1}"] = dict()
-        PyLS3_Conf['Commands'][f"ReadLog{i + 1}"]['Hex_Code'] = command_with_crc
-        PyLS3_Conf['Commands'][f"ReadLog{i + 1}"]['Description'] = f"Read the {i}th log command"
-        PyLS3_Conf['Commands'][f"ReadLog{i + 1}"]['SupportedProtocol'] = dict()
-        PyLS3_Conf['Commands'][f"ReadLog{i + 1}"]['SupportedProtocol']['Bluetooth'] = False
-        PyLS3_Conf['Commands'][f"ReadLog{i + 1}"]['SupportedProtocol']['USB'] = True
-
-
 async def run_sequence(*functions: Awaitable[Any]) -> None:
     for function in functions:
         await function
@@ -375,29 +457,58 @@ class Connection(ABC):
     devices_active = 0
     devices_registered = list()
     device_object_list = list()
-
-    def __init__(self):
-        self.device_name = str()
+    # the class attributes are shared by all connections of PyLS3.py, a connection could have its own (e.g. LS3Client)
+    persistence = None          # PersistencePipeline (capture files and plots are saved in the background)
+    combined_trigger = None     # TriggerEngine shared by all devices (TriggerMode: combined)
+    discovery = None            # DeviceDiscovery shared by all connection managers
+    commands = None             # CommandTable compiled from PyLS3_Conf['Commands']
+    settings = None             # Settings of all connections (built once from PyLS3_Conf, see PyLS3_settings)
+    live_server = None          # LiveServer (fan-out of the decoded samples to TCP/WebSocket clients)
+
+    def __init__(self, device_name: str = '', settings: Settings = None):
+        """
+        :param device_name: name of the device
+        :param settings: Settings (default: Connection.settings)
+        """
+        self.device_name = device_name
+        if settings is not None:
+            self.settings = settings
         self.connected = False
         # self.init_defaults()
 
     def init_defaults(self):
         Connection.device_object_list.append(self)
+        # resolved once: settings of this device and the message code lookups
+        self.device_settings = self.settings.device(self.device_name)
+        self.message_codes = self.settings.message_codes
         # defaults for all Connections (can't use init for serial connection)
         self.rx_data_onboardlogging = False
         self.device_force_close = False
+        self.connection_event = asyncio.Event()  # set on connection lost and ForceClose (wakes the connection manager)
 
         # RX Buffer
-        self.last_packet_time = datetime.now()
+        self.last_packet_ns = time.perf_counter_ns()
+        self.clock = ClockAnchor()              # perf_counter_ns -> wall clock
+        self.frame_clock = FrameClock()         # time of each frame
         self.rx_data_counter = 0
-        self.rx_dataq = bytes()
-        self.capture_data = []
+        self.rx_frame_event = asyncio.Event()   # set for every decoded packet (command acknowledgement)
+        self.log_receiver = None                # OnboardLogging (LogReceiver of the running ReadLog command)
+        self.frame_decoder = FrameDecoder()     # live data
+        self.sample_listeners = []              # called with every decoded batch of samples (e.g. PyLS3_client.LS3Client)
+        if Connection.live_server is not None:
+            self.sample_listeners.append(Connection.live_server.listener(self.device_name))
+        self.receive_pipeline = None            # ReceivePipeline (Settings.pipeline)
+        self.rx_statistics = RxStatistics(self.settings.statistics_window_s, self.settings.statistics_rate_warning)
+        self.capture_data = CaptureBuffer()
         self.capture_activated = False
         self.capture_running = False
         self.capture_stop_trigger = False
         self.capture_save_ongoing = False
         self.capture_starttime = 0
-        self.precapture_data = deque([], maxlen=0)
+        self.capture_start_ns = 0
+        self.precapture_data = PreCaptureBuffer(maxlen=0)
+        self.trigger_configure()
+        self.capture_stream = None              # streaming capture mode (CaptureStreamWriter)
         self.rx_timestamps = []
         self.rx_delays = []
 
@@ -413,6 +524,7 @@ class Connection(ABC):
         self.measure_mode_parsed = str()
         self.unit_value_parsed = str()
         self.speed_value_parsed = str()
+        self.speed_hz = 0
 
     @abstractmethod
     def connection_lost(self) -> None:
@@ -427,400 +539,572 @@ class Connection(ABC):
         pass
 
     async def cmd_send(self, command: str):
-        connectiontype = PyLS3_Conf['UseDevices'][self.device_name]['ConnectionType']
-        while True:
-            # Wait cmd
-            if re.search('Wait([0-9]+)', command):
-                wait_time = int(re.search('Wait([0-9]+)', command).group(1))
-                logger.info(f"{self.device_name}: Wait {wait_time}s start")
-                await asyncio.sleep(wait_time)
-                logger.info(f"{self.device_name}: Wait {wait_time} finished")
-                break
+        if self.commands is None:
+            # own table from the settings of this connection
+            self.commands = CommandTable(self.settings.conf['Commands'])
+        cmd = self.commands.get(command)
+        if cmd is None:
+            logger.error(f"{self.device_name}: Command '{command}' not defined!")
+            return
 
-            # RawCMD
-            elif re.search('RawCMD_([^_]+)_([TF])', command):
-                match = re.search('RawCMD_([^_]+)_([TF])', command)
-                hex_code = match.group(1)
-                if match.group(2).upper() == "T":
-                    hex_code = LS3command_crc(hex_code)
-                bytes_to_send = bytes.fromhex(hex_code)
-                logger.info(f"{self.device_name}: Sending command RawCMD '{hex_code}' '{bytes_to_send}'")
-                await self.data_send(bytes_to_send)
-                break
+        # Wait cmd
+        if cmd.name == 'Wait':
+            logger.info(f"{self.device_name}: Wait {cmd.argument}s start")
+            await asyncio.sleep(cmd.argument)
+            logger.info(f"{self.device_name}: Wait {cmd.argument} finished")
+            return
 
-            try:
-                PyLS3_Conf['Commands'][command]
-            except KeyError:
-                logger.error(f"{self.device_name}: Command '{command}' not defined!")
-                break
+        # RawCMD
+        if cmd.name == 'RawCMD':
+            logger.info(f"{self.device_name}: Sending command RawCMD '{cmd.argument}' '{cmd.code}'")
+            await self.data_send(cmd.code)
+            return
 
-            if not PyLS3_Conf['Commands'][command]['SupportedProtocol'][connectiontype]:
-                logger.warning(f"{self.device_name}: Command '{command}' not Supported via {connectiontype}")
-                break
+        connectiontype = self.device_settings.connection_type
+        if not cmd.supported(connectiontype):
+            logger.warning(f"{self.device_name}: Command '{command}' not Supported via {connectiontype}")
+            return
 
-            if command == 'ForceClose':
-                await self.cmd_send('StopCaptureNow')
-                await self.cmd_send('DeactivateLogging')
-                await self.cleanup()
-                self.device_force_close = True
-                break
+        # special commands
+        handler = self.CMD_HANDLERS.get(cmd.name)
+        if handler is not None:
+            await handler(self)
+            return
 
-            elif command == 'SaveOnboardLogging':
-                await self.cmd_send('DeactivateLogging')
-                self.rx_data_onboardlogging = True
-                await asyncio.sleep(0.5)
-                stop_saveonboardlogging = False         # True if OnboardLogging Data has no Data
-
-                # set Version specific values
-                ls3os_versionspecific = find_nearest_lowerequal(PyLS3_Conf['LS3OS']['VersionSpecific'], PyLS3_Conf['Device'][self.device_name]['Version'])
-                onboardlogging_row_index_list = PyLS3_Conf['LS3OS']['VersionSpecific'][ls3os_versionspecific]['OnboardLogging_row_index_list']
-                csv_date_index = onboardlogging_row_index_list.index('Date') + 1
-                csv_time_index = onboardlogging_row_index_list.index('Time') + 1
-                min_index = max(csv_date_index, csv_time_index) + 1
-
-                for i in range(1, 101):
-                    self.rx_dataq = bytes()
-                    self.capture_data = []
-                    await self.cmd_send(f"ReadLog{i}")
-
-                    while True:
-                        rx_data_list = self.rx_dataq.decode("ASCII").split('\r\n')
-                        if rx_data_list.__len__() >= 2 and rx_data_list[-2] == 'End':
-                            if rx_data_list.__len__() >= min_index:
-                                # save csv
-                                csv_date = rx_data_list[csv_date_index]
-                                try:
-                                    csv_date_obj = datetime.strptime(csv_date, PyLS3_Conf['OnboardLogging']['CSVDateFormatFromLS3'])
-                                except Exception as e:
-                                    logger.error(f"Wrong Date-Format in OnboardLogging Data. Check version settings. Expection: {e} Using 1.1.1970")
-                                    logger.debug(f"{self.rx_dataq}")  # Todo to remove
-                                    csv_date_obj = datetime.fromtimestamp(0)
-                                csv_date_str = csv_date_obj.strftime(PyLS3_Conf['OnboardLogging']['CSVDateFormatSave'])
-
-                                csv_time = rx_data_list[csv_time_index]
-                                try:
-                                    csv_time_obj = datetime.strptime(csv_time, PyLS3_Conf['OnboardLogging']['CSVTimeFormatFromLS3'])
-                                except Exception as e:
-                                    logger.error(f"Wrong Time-Format in OnboardLogging Data. Check version settings. Expection: {e}")
-                                    logger.debug(f"{self.rx_dataq}")  # Todo to remove
-                                    csv_time_obj = datetime.fromtimestamp(i)
-                                csv_time_str = csv_time_obj.strftime(PyLS3_Conf['OnboardLogging']['CSVTimeFormatSave'])
-
-                                ls_folder = f"LS{''.join(PyLS3_Conf['Device'][self.device_name]['MAC'].split(':')[3:])}"
-                                csv_file = f"{PyLS3_Conf['Path']['OnboardLogging']}/{ls_folder}/{csv_date_str}/{csv_time_str}.CSV"
-                                logger.info(f"{self.device_name}: SaveOnboardLogging ReadLog{i} to file {csv_file}")
-                                csv_save_file(rx_data_list[1:-2], csv_file, PyLS3_Conf['OnboardLogging']['CSVOverride'])
-                                if PyLS3_Conf['OnboardLogging']['AutoGeneratePlot']:
-                                    coro = plot_csv(csv_file, csv_type='onboardlogging', show_plot=False, save_image=True, override_image=PyLS3_Conf['OnboardLogging']['CSVOverride'], row_index_list=onboardlogging_row_index_list)
-                                    task = asyncio.create_task(coro)
-                                    # await task
-
-                            else:
-                                logger.info(f"{self.device_name}: SaveOnboardLogging ReadLog{i} is empty. Leaving SaveOnboardLogging")
-                                stop_saveonboardlogging = True
-                            break
-                        await asyncio.sleep(1)
-                    if stop_saveonboardlogging:
-                        break
-                self.rx_dataq = bytes()
-                self.capture_data = []
-                self.rx_data_onboardlogging = False
-                await self.cmd_send('ActivateLogging')
-                break
+        attempt = 0
+        ack_timeout = self.settings.command_ack.timeout_s
+        while True:
+            logger.info(f"{self.device_name}: Sending command '{command}'")
+            last_state = self.cmd_ack_state()
+            await self.data_send(cmd.code)
 
-            elif command == 'StartCapture':
-                logger.info(f"{self.device_name}: Capture starting (manual)")
-                self.capture_activated = True
-                self.capture_running = True
-                self.capture_starttime = datetime.now()
-                # self.capture_stop_trigger = False
+            # wait for the acknowledgement in the received data (or repeat the command)
+            if await self.cmd_ack(cmd, last_state, ack_timeout):
                 break
-
-            elif command == 'StopCapture':
-                logger.info(f"{self.device_name}: Capture stopping (manual)")
-                self.capture_stop_trigger = True
+            attempt += 1
+            if attempt > self.settings.command_ack.retries:
+                logger.error(f"{self.device_name}: Command '{command}' not acknowledged")
                 break
+            logger.info(f"{self.device_name}: Repeat {command}...")
+            ack_timeout *= self.settings.command_ack.backoff
+
+    async def cmd_force_close(self):
+        await self.cmd_send('StopCaptureNow')
+        await self.cmd_send('DeactivateLogging')
+        self.device_force_close = True
+        await self.cleanup()
+        self.connection_event.set()
+
+    async def cmd_save_onboardlogging(self):
+        await self.cmd_send('DeactivateLogging')
+        self.rx_data_onboardlogging = True
+        await self.onboardlogging_download()
+        self.log_receiver = None
+        self.frame_decoder.reset()
+        self.rx_data_onboardlogging = False
+        await self.cmd_send('ActivateLogging')
 
-            elif command == 'StopCaptureNow':
-                logger.info(f"{self.device_name}: Capture stopping (manual)")
-                self.capture_stop_trigger = True
-                self.capture_running = False
-                break
+    async def cmd_start_capture(self):
+        logger.info(f"{self.device_name}: Capture starting (manual)")
+        self.capture_activated = True
+        self.capture_start()
+        # self.capture_stop_trigger = False
 
-            elif command == 'ActivateCapture':
-                logger.info(f"{self.device_name}: Capture activated (manual)")
-                self.capture_activated = True
-                break
+    async def cmd_stop_capture(self):
+        logger.info(f"{self.device_name}: Capture stopping (manual)")
+        self.capture_stop_trigger = True
 
-            elif command == 'DeactivateCapture':
-                logger.info(f"{self.device_name}: Capture deactivated (manual)")
-                self.capture_activated = False
-                break
+    async def cmd_stop_capture_now(self):
+        logger.info(f"{self.device_name}: Capture stopping (manual)")
+        self.capture_stop_trigger = True
+        self.capture_running = False
 
-            logger.info(f"{self.device_name}: Sending command '{command}'")
-            bytes_to_send = bytes.fromhex(PyLS3_Conf['Commands'][command]['Hex_Code'])
-            await self.data_send(bytes_to_send)
-
-            last_rx_data_counter = self.rx_data_counter
-            last_measure_mode_parsed = self.measure_mode_parsed
-            await asyncio.sleep(2.0)
-            if command == 'ActivateLogging':
-                if self.rx_data_counter == last_rx_data_counter:
-                    logger.info(f"{self.device_name}: Repeat {command}...")
-                    continue
-            elif command == 'DectivateLogging':
-                if self.rx_data_counter > last_rx_data_counter:
-                    logger.info(f"{self.device_name}: Repeat {command}...")
-                    continue
-            elif command == 'UnitSwitchTokN':
-                if not self.unit_value_parsed == "kN":
-                    logger.info(f"{self.device_name}: Repeat {command}...")
-                    continue
-            elif command == 'UnitSwitchTokgf':
-                if not self.unit_value_parsed == "kgf":
-                    logger.info(f"{self.device_name}: Repeat {command}...")
-                    continue
-            elif command == 'UnitSwitchTolbf':
-                if not self.unit_value_parsed == "lbf":
-                    logger.info(f"{self.device_name}: Repeat {command}...")
-                    continue
-            elif command == 'Speed10':
-                if not self.speed_value_parsed == "10":
-                    logger.info(f"{self.device_name}: Repeat {command}...")
-                    continue
-            elif command == 'Speed40':
-                if not self.speed_value_parsed == "40":
-                    logger.info(f"{self.device_name}: Repeat {command}...")
-                    continue
-            elif command == 'Speed640':
-                if not self.speed_value_parsed == "640":
-                    logger.info(f"{self.device_name}: Repeat {command}...")
-                    continue
-            elif command == 'Speed1280':
-                if not self.speed_value_parsed == "1280":
-                    logger.info(f"{self.device_name}: Repeat {command}...")
-                    continue
+    async def cmd_activate_capture(self):
+        logger.info(f"{self.device_name}: Capture activated (manual)")
+        self.capture_activated = True
 
-            elif command == 'ModeABS':
-                if not self.measure_mode_parsed == "ABS":
-                    logger.info(f"{self.device_name}: Repeat {command}...")
-                    continue
+    async def cmd_deactivate_capture(self):
+        logger.info(f"{self.device_name}: Capture deactivated (manual)")
+        self.capture_activated = False
 
-            elif command == 'ModeREL':
-                if not self.measure_mode_parsed == "REL":
-                    logger.info(f"{self.device_name}: Repeat {command}...")
-                    continue
-            elif command == 'ModeToggleABS_REL':
-                if self.measure_mode_parsed == last_measure_mode_parsed:
-                    logger.info(f"{self.device_name}: Repeat {command}...")
+    # special commands (no Hex_Code) -> handler
+    CMD_HANDLERS = {
+        'ForceClose': cmd_force_close,
+        'SaveOnboardLogging': cmd_save_onboardlogging,
+        'StartCapture': cmd_start_capture,
+        'StopCapture': cmd_stop_capture,
+        'StopCaptureNow': cmd_stop_capture_now,
+        'ActivateCapture': cmd_activate_capture,
+        'DeactivateCapture': cmd_deactivate_capture,
+    }
+
+    async def onboardlogging_download(self):
+        """
+        Download the OnboardLogging (ReadLog1..ReadLog100) till an empty log is read.
+        The next ReadLog command is sent as soon as the 'End' of a log is received, the files are written
+        and plotted by the persistence pipeline.
+        With OnboardLogging: Sync only new logs are saved (see LogManifest), the sync stops early or starts at the last log
+        of the previous sync, depending on the order of the logs on the device. A log is recorded in the manifest when
+        its file is written, so the next ReadLog command is sent after the write (the plot is still created in the background).
+        """
+        connectiontype = self.device_settings.connection_type
+        onboardlogging_row_index_list = list(self.device_settings.onboardlogging_row_index_list)
+        onboardlogging_conf = self.settings.conf['OnboardLogging']
+        # echo of the command, rows till Date and Time, End
+        min_lines = max(onboardlogging_row_index_list.index('Date'), onboardlogging_row_index_list.index('Time')) + 3
+        manifest = None
+        start_index = 1
+        if onboardlogging_conf['Sync']:
+            # same folder as the log csv files (see csv_save_file)
+            manifest_file = norm_file_and_path(f"{self.device_settings.onboardlogging_folder}/manifest.json")[2]
+            manifest = LogManifest(manifest_file, self.device_settings.mac)
+            start_index = manifest.start_index()
+            stop_at_known = manifest.stop_at_known(start_index)
+        download_start = time.perf_counter()
+        download_bytes = 0
+        logs = 0
+        logs_known = 0
+        log_times = dict()      # index -> datetime of the log (order of the logs)
+
+        i = start_index
+        while i <= 100:
+            command = f"ReadLog{i}"
+            read_log = self.commands.get(command)
+            if not read_log.supported(connectiontype):
+                logger.warning(f"{self.device_name}: Command '{command}' not Supported via {connectiontype}")
+                break
+            for attempt in range(self.settings.command_ack.retries + 1):
+                self.log_receiver = LogReceiver()
+                logger.debug(f"{self.device_name}: Sending command '{command}'")
+                await self.data_send(read_log.code)
+                if await self.log_receiver.wait(onboardlogging_conf['ReadLogTimeout_s']):
+                    break
+                logger.info(f"{self.device_name}: SaveOnboardLogging {command} incomplete ({self.log_receiver.nbytes} bytes), repeat {command}...")
+            else:
+                logger.error(f"{self.device_name}: SaveOnboardLogging {command} not received. Leaving SaveOnboardLogging")
+                return
+
+            receiver = self.log_receiver
+            download_bytes += receiver.nbytes
+            if len(receiver.lines) < min_lines:
+                if i != 1 and i == start_index:
+                    logger.info(f"{self.device_name}: SaveOnboardLogging {command} (last log of the previous sync) is empty. Sync from ReadLog1")
+                    i = start_index = 1
                     continue
-            # The Rest of the commands has not return ('MenuButton', 'ClearPeak', 'ZeroButton', 'ResetABS')
-            # Break Loop if everything is ok
-            break
+                logger.info(f"{self.device_name}: SaveOnboardLogging {command} is empty. Leaving SaveOnboardLogging")
+                break
+            header = self.onboardlogging_header(receiver.lines, onboardlogging_row_index_list)
+            log_times[i] = header['datetime']
+            logger.info(f"{self.device_name}: SaveOnboardLogging {command} received ({len(receiver.lines) - 2} lines, {receiver.nbytes} bytes "
+                        f"in {receiver.duration:.2f}s, {receiver.byte_rate:.0f} bytes/s)")
+
+            if manifest is None:
+                logs += 1
+                self.onboardlogging_save(i, receiver.lines, onboardlogging_row_index_list)
+                i += 1
+                continue
+
+            key = manifest.log_key(header)
+            if i != 1 and i == start_index and key not in manifest:
+                logger.info(f"{self.device_name}: SaveOnboardLogging {command} is not the last log of the previous sync. Sync from ReadLog1")
+                i = start_index = 1
+                continue
+            if key in manifest:
+                logs_known += 1
+                logger.info(f"{self.device_name}: SaveOnboardLogging {command} already downloaded ({manifest.logs[key]['file']})")
+                if stop_at_known:
+                    logger.info(f"{self.device_name}: SaveOnboardLogging all newer logs are downloaded")
+                    break
+            else:
+                logs += 1
+                written = asyncio.get_running_loop().create_future()
+                csv_file = self.onboardlogging_save(i, receiver.lines, onboardlogging_row_index_list, written)
+                try:
+                    await written
+                    manifest.add(key, i, csv_file, receiver.nbytes)
+                except Exception as e:
+                    logger.error(f"{self.device_name}: SaveOnboardLogging {command} not saved, it is not recorded in the manifest: {e}")
+            if manifest.order is None and None not in (log_times.get(1), log_times.get(2)) and log_times[1] != log_times[2]:
+                manifest.order = 'newest-first' if log_times[1] > log_times[2] else 'oldest-first'
+                logger.info(f"{self.device_name}: SaveOnboardLogging order of the logs: {manifest.order}")
+            manifest.progress(i)
+            i += 1
+
+        if manifest is not None:
+            manifest.finish()
+        download_time = time.perf_counter() - download_start
+        logger.info(f"{self.device_name}: SaveOnboardLogging finished, {logs} new logs, {logs_known} known logs ({download_bytes} bytes) in {download_time:.1f}s "
+                    f"({download_bytes / download_time if download_time else 0.0:.0f} bytes/s)")
+
+    def onboardlogging_header(self, rx_data_list: list, onboardlogging_row_index_list: list) -> dict:
+        """
+        :param rx_data_list: received lines of a log (first line: echo of the command)
+        :param onboardlogging_row_index_list: version specific row names
+        :return: header rows (row name -> value) and 'datetime' (None if Date/Time could not be parsed)
+        """
+        onboardlogging_conf = self.settings.conf['OnboardLogging']
+        header = {row: rx_data_list[index + 1] for index, row in enumerate(onboardlogging_row_index_list)
+                  if row != 'DataStart' and index + 1 < len(rx_data_list) - 1}
+        try:
+            header['datetime'] = datetime.strptime(f"{header['Date']} {header['Time']}",
+                                                   f"{onboardlogging_conf['CSVDateFormatFromLS3']} {onboardlogging_conf['CSVTimeFormatFromLS3']}")
+        except (KeyError, ValueError):
+            header['datetime'] = None
+        return header
+
+    def onboardlogging_save(self, log_number: int, rx_data_list: list, onboardlogging_row_index_list: list,
+                            written: asyncio.Future = None) -> str:
+        """
+        Hand over one log to the persistence pipeline
+        :param log_number: number of the ReadLog command
+        :param rx_data_list: received lines (first line: echo of the command, last line: 'End')
+        :param onboardlogging_row_index_list: version specific row names
+        :param written: if set, gets the filename when the file is written or the exception of the write
+        :return: csv filename
+        """
+        onboardlogging_conf = self.settings.conf['OnboardLogging']
+        csv_date = rx_data_list[onboardlogging_row_index_list.index('Date') + 1]
+        try:
+            csv_date_obj = datetime.strptime(csv_date, onboardlogging_conf['CSVDateFormatFromLS3'])
+        except Exception as e:
+            logger.error(f"Wrong Date-Format in OnboardLogging Data. Check version settings. Expection: {e} Using 1.1.1970")
+            csv_date_obj = datetime.fromtimestamp(0)
+        csv_date_str = csv_date_obj.strftime(onboardlogging_conf['CSVDateFormatSave'])
+
+        csv_time = rx_data_list[onboardlogging_row_index_list.index('Time') + 1]
+        try:
+            csv_time_obj = datetime.strptime(csv_time, onboardlogging_conf['CSVTimeFormatFromLS3'])
+        except Exception as e:
+            logger.error(f"Wrong Time-Format in OnboardLogging Data. Check version settings. Expection: {e}")
+            csv_time_obj = datetime.fromtimestamp(log_number)
+        csv_time_str = csv_time_obj.strftime(onboardlogging_conf['CSVTimeFormatSave'])
+
+        csv_file = f"{self.device_settings.onboardlogging_folder}/{csv_date_str}/{csv_time_str}.CSV"
+        logger.info(f"{self.device_name}: SaveOnboardLogging ReadLog{log_number} to file {csv_file}")
+        save_args = (rx_data_list[1:-1], csv_file, onboardlogging_conf['CSVOverride'])
+        plot_kwargs = None
+        if onboardlogging_conf['AutoGeneratePlot']:
+            plot_kwargs = dict(csv_type='onboardlogging', show_plot=False, save_image=True, override_image=onboardlogging_conf['CSVOverride'],
+                               row_index_list=onboardlogging_row_index_list)
+        if self.persistence:
+            self.persistence.submit(f"{self.device_name}: OnboardLogging ReadLog{log_number}", csv_save_file, save_args, plot_kwargs, written)
+        else:
+            csv_save_file(*save_args)
+            if written is not None:
+                written.set_result(csv_file)
+            if plot_kwargs is not None:
+                from PyLS3_plot import create_plot
+                create_plot(csv_file, **plot_kwargs)
+        return csv_file
+
+    def cmd_ack_state(self) -> dict:
+        """
+        :return: state of the device which could be checked by the command acknowledgements
+        """
+        return {'Frames': self.rx_data_counter, **{k: getattr(self, a) for k, a in ACK_STATE.items()}}
+
+    async def cmd_ack(self, cmd, last_state: dict, timeout: float) -> bool:
+        """
+        Wait till the decoded frames show the acknowledgement of a command
+        :param cmd: Command (see PyLS3_commands)
+        :param last_state: cmd_ack_state() before the command was sent
+        :param timeout: max. time in seconds
+        :return: True if acknowledged
+        """
+        if not cmd.has_ack:
+            await asyncio.sleep(self.settings.command_ack.no_ack_delay_s)
+            return True
+        loop = asyncio.get_running_loop()
+        if cmd.quiet:
+            # acknowledged when no frame has been received for QuietTime_s
+            quiet_time = self.settings.command_ack.quiet_time_s
+            deadline = loop.time() + timeout + quiet_time
+            while loop.time() < deadline:
+                rx_data_counter = self.rx_data_counter
+                await asyncio.sleep(quiet_time)
+                if self.rx_data_counter == rx_data_counter:
+                    return True
+            return False
+        deadline = loop.time() + timeout
+        while not cmd.ack(self, last_state):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            self.rx_frame_event.clear()
+            try:
+                await asyncio.wait_for(self.rx_frame_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return cmd.ack(self, last_state)
+        return True
 
     def rx_data_handler(self, data: Any):
         # logger.debug(f"DEBUG> data = {data}")
         if self.rx_data_onboardlogging:
-            self.rx_dataq += data
+            if self.log_receiver is not None:
+                self.log_receiver.feed(data)
+        elif self.settings.pipeline.enabled:
+            # staged: only timestamp and queue the data here
+            if self.receive_pipeline is None:
+                self.receive_pipeline_create()
+            self.receive_pipeline.ingest(time.perf_counter_ns(), data)
         else:
-            # get timestamps
-            present_time = datetime.now()
-            rx_timestamp = present_time.timestamp()
-            rx_delays = (present_time - self.last_packet_time).microseconds
-            self.last_packet_time = present_time
-            # Decode Data
-            self.rx_dataq += data
-
-            # check dataq for corrupt entries
-            while True:
-                # One Log line has 20 Byte
-                if len(self.rx_dataq) >= 20:
-                    # control_index must be 18
-                    control_index = self.rx_dataq.find(b'\r')
-                    if control_index == -1:
-                        # corrupt data
-                        self.rx_dataq = bytes()
-                        break
-                    elif control_index < 19:
-                        # Correct data
-                        self.rx_dataq = self.rx_dataq[control_index + 1:]
-                        continue
-                    elif control_index > 19:
-                        # Correct data
-                        self.rx_dataq = self.rx_dataq[control_index - 19:]
+            result = self.rx_decode(time.perf_counter_ns(), data)
+            if result is not None:
+                self.capture_update(*result)
+
+    def rx_decode(self, arrival_ns: int, data: bytes):
+        """
+        Decode stage: all complete frames of the received data at once
+        :param arrival_ns: receive time (perf_counter_ns)
+        :param data: received bytes
+        :return: samples, measured values, frame times (perf_counter_ns) (None if there is no complete frame)
+        """
+        rx_delays = (arrival_ns - self.last_packet_ns) // 1000
+        self.last_packet_ns = arrival_ns
+        frames = self.frame_decoder.feed(data)
+        if frames.size:
+            self.rx_state_update(frames[-1:])
+        if self.rx_statistics.update(arrival_ns / 1e9, len(data), frames.size, self.speed_hz):
+            logger.warning(f"{self.device_name}: Sample rate {self.rx_statistics.sample_rate:.1f}Hz is below the configured {self.speed_hz}Hz "
+                           f"({self.rx_statistics.byte_rate:.0f} bytes/s, est. lost frames {self.rx_statistics.lost_frames})")
+        if not frames.size:
+            return None
+        self.rx_data_counter += frames.size
+        self.rx_frame_event.set()
+        # time of each frame (reconstructed from the device speed, corrected by the drift estimator)
+        if self.speed_hz != self.frame_clock.speed:
+            self.frame_clock.reset(self.speed_hz, self.device_settings.timing_correction_factor)
+        frame_ns = self.frame_clock.timestamps(arrival_ns, frames.size)
+        measured_values = frames_measured_value(frames)
+        samples = frames_to_samples(frames, self.clock.to_wall(frame_ns), rx_delays, measured_values)
+        return samples, measured_values, frame_ns
+
+    def rx_status(self) -> dict:
+        """
+        :return: receive statistics inc. the resync counters of the frame decoder
+        """
+        return {**self.rx_statistics.status(),
+                'resync_events': self.frame_decoder.resync_events,
+                'bytes_discarded': self.frame_decoder.bytes_discarded,
+                'corrupt_frames_est': self.frame_decoder.bytes_discarded // FRAME_LENGTH,
+                'timing_factor_est': round(self.frame_clock.factor, 6),
+                'timing_resyncs': self.frame_clock.resyncs}
+
+    def receive_pipeline_create(self):
+        """
+        Per device receive pipeline (ingest -> decode -> capture), created in the running event loop
+        """
+        pipeline = self.settings.pipeline
+        self.receive_pipeline = ReceivePipeline(self.device_name, self.rx_decode, self.capture_update, pipeline.queue_size,
+                                                pipeline.overflow_policy, *self.rx_flow_control())
+
+    def rx_flow_control(self) -> tuple:
+        """
+        :return: pause, resume functions for the overflow policy block (None, None if the connection can't pause)
+        """
+        return None, None
+
+    async def receive_pipeline_close(self):
+        if self.receive_pipeline is not None:
+            await self.receive_pipeline.close()
+            self.receive_pipeline = None
+
+    def capture_update(self, samples: np.ndarray, measured_values: np.ndarray, frame_ns: np.ndarray):
+        """
+        Capture state machine, evaluated over the whole batch: the trigger points are found with array comparisons
+        and the samples are added to the capture buffers in slices
+        :param samples: structured array (PyLS3_capture.SAMPLE_DTYPE)
+        :param measured_values: float64 array of the measured values
+        :param frame_ns: int64 array with the time of each sample (perf_counter_ns)
+        """
+        for listener in self.sample_listeners:
+            listener(samples)
+        if self.trigger_engine:
+            start_mask, stop_mask = self.trigger_engine.update(self.device_name, measured_values)
+        else:
+            start_mask = measured_values >= self.trigger_start
+            stop_mask = measured_values <= self.trigger_stop
+        i = 0
+        while i < samples.size and self.capture_activated:
+            if not self.capture_running and not self.capture_stop_trigger:
+                # Check StartTrigger
+                j = first_true_index(start_mask[i:])
+                if j == -1:
+                    self.precapture_data.append(samples[i:])  # save to precapture
+                    break
+                j += i
+                self.precapture_data.append(samples[i:j])  # save to precapture
+                logger.info(f"{self.device_name}: Capture starting")
+                self.capture_start(int(frame_ns[j]))
+                self.capture_append(samples[j:j + 1])  # save to log
+                i = j + 1
+            elif self.capture_running:
+                # MaxCaptureTime_s cutoff (0 = unlimited in streaming mode)
+                m = -1
+                if self.trigger_max_ns or not self.capture_stream:
+                    m = first_true_index(frame_ns[i:] >= self.capture_start_ns + self.trigger_max_ns)
+                # StopTrigger (k0) and the first sample after MinCaptureTime_s (k)
+                k0 = i if self.capture_stop_trigger else first_true_index(stop_mask[i:])
+                if k0 != -1 and not self.capture_stop_trigger:
+                    k0 += i
+                if m != -1:
+                    m += i
+                    if k0 == -1 or m <= k0:
+                        self.capture_append(samples[i:m + 1])  # save to log
+                        self.capture_stop_trigger = True
+                        self.capture_running = False
+                        logger.info(f"{self.device_name}: Capture stopping (MaxCaptureTime_s exceeded)")
+                        i = m + 1
                         continue
-                    else:
-                        # Correct control_index
-                        data = self.rx_dataq[0:20]
-                        self.rx_dataq = self.rx_dataq[20:]
-                        self.rx_data_counter += 1
-                        self.working_mode = data.decode("ASCII")[0]
-                        self.measured_value = data.decode("ASCII")[1:7]
-                        self.measure_mode = data.decode("ASCII")[7]
-                        self.reference_zero = data.decode("ASCII")[8:14]
-                        self.electric_quantity = (data[14] - 32) * 2
-                        self.unit_value = data.decode("ASCII")[15]
-                        self.speed_value = data.decode("ASCII")[16]
-                        # self.check_value         = data.decode("ASCII")[17:19]
-                        try:
-                            self.working_mode_parsed = PyLS3_Conf['MessageCode']['WorkingMode'][self.working_mode]
-                            self.measure_mode_parsed = PyLS3_Conf['MessageCode']['MeasureMode'][self.measure_mode]
-                            self.unit_value_parsed = PyLS3_Conf['MessageCode']['UnitValue'][self.unit_value]
-                            self.speed_value_parsed = PyLS3_Conf['MessageCode']['SpeedValue'][self.speed_value]
-                        except Exception as e:
-                            logger.warning(f"Exception {e}\n Data: {data} \n Dataq:{self.rx_dataq}\n----------------------\n")
-
-                        cvs_line = f"{self.device_name}, {present_time}, {rx_timestamp}, {rx_delays}, {self.measured_value}, {self.unit_value_parsed}, {self.reference_zero}, {self.measure_mode_parsed}, {self.speed_value_parsed}Hz, {self.electric_quantity}, {self.working_mode_parsed}"
-                        rx_delays = 0  # in case there are multiple entries in the rx_dataq
-
-                        # Capture?
-                        if not self.capture_activated:
-                            pass
-                        elif not self.capture_running and not self.capture_stop_trigger:
-                            # Check StartTrigger
-                            if float(self.measured_value) >= float(PyLS3_Conf['Capture']['StartTrigger']):
-                                self.capture_running = True
-                                logger.info(f"{self.device_name}: Capture starting")
-                                self.capture_starttime = datetime.now()
-                                self.capture_data.append(cvs_line)  # save to log
-                            else:
-                                self.precapture_data.append(cvs_line)  # save to precapture
-                        elif self.capture_running:
-                            self.capture_data.append(cvs_line)  # save to log
-                            # Check MaxCaptureTime_s
-                            if present_time - self.capture_starttime >= timedelta(seconds=PyLS3_Conf['Capture']['MaxCaptureTime_s']):
-                                self.capture_stop_trigger = True
-                                self.capture_running = False
-                                # print(f"{datetime.now().isoformat()} {self.device_name}: Capture stopping (MaxCaptureTime_s exceeded)")
-                                logger.info(f"{self.device_name}: Capture stopping (MaxCaptureTime_s exceeded)")
-                            elif self.capture_stop_trigger or float(self.measured_value) <= float(PyLS3_Conf['Capture']['StopTrigger']):
-                                if not self.capture_stop_trigger:
-                                    logger.info(f"{self.device_name}: Capture Stop Trigger set ")
-                                    self.capture_stop_trigger = True
-                                if present_time - self.capture_starttime >= timedelta(seconds=PyLS3_Conf['Capture']['MinCaptureTime_s']):
-                                    self.capture_running = False
-                                    logger.info(f"{self.device_name}: Capture stopping")
-                        else:
-                            self.capture_save_ongoing = True
-                            # write data
-                            logger.info(f"{self.device_name}: Capture saving Data")
-                            save_data = list(self.precapture_data) + self.capture_data
-                            csv_file = csv_save(self.device_name, save_data)
-                            if PyLS3_Conf['Capture']['AutoGeneratePlot']:
-                                coro = plot_csv(csv_file, csv_type='pyls3', show_plot=False, save_image=True)
-                                task = asyncio.create_task(coro)
-                                # await task
-
-                            self.capture_data.clear()
-                            self.precapture_data.clear()
-                            self.capture_save_ongoing = False
-                            self.capture_stop_trigger = False
-                            logger.info(f"{self.device_name}: Capture Stop Trigger unset")
-                            logger.info(f"{self.device_name}: Ready (Capture activated)")
-
-                            if PyLS3_Conf['Capture']['CaptureMode'] == "single":
-                                logger.info(f"{self.device_name}: Capture deactivated")
-                                self.capture_activated = False
-                else:
+                if k0 == -1:
+                    self.capture_append(samples[i:])  # save to log
                     break
+                if not self.capture_stop_trigger:
+                    logger.info(f"{self.device_name}: Capture Stop Trigger set ")
+                    self.capture_stop_trigger = True
+                k = first_true_index(frame_ns[k0:] >= self.capture_start_ns + self.trigger_min_ns)
+                if k == -1 and m == -1:
+                    self.capture_append(samples[i:])  # save to log
+                    break
+                if k == -1 or (m != -1 and m <= k0 + k):
+                    # MinCaptureTime_s not reached, but MaxCaptureTime_s
+                    self.capture_append(samples[i:m + 1])  # save to log
+                    self.capture_running = False
+                    logger.info(f"{self.device_name}: Capture stopping (MaxCaptureTime_s exceeded)")
+                    i = m + 1
+                    continue
+                k += k0
+                self.capture_append(samples[i:k + 1])  # save to log
+                self.capture_running = False
+                logger.info(f"{self.device_name}: Capture stopping")
+                i = k + 1
+            else:
+                self.capture_save_ongoing = True
+                # write data (in the background)
+                logger.info(f"{self.device_name}: Capture saving Data")
+                if self.capture_stream:
+                    self.capture_stream_close()
+                else:
+                    save_data = np.concatenate((self.precapture_data.to_samples(), self.capture_data.to_samples()))
+                    self.capture_save(save_data)
+
+                self.capture_data.clear()
+                self.precapture_data.clear()
+                self.capture_save_ongoing = False
+                self.capture_stop_trigger = False
+                logger.info(f"{self.device_name}: Capture Stop Trigger unset")
+                logger.info(f"{self.device_name}: Ready (Capture activated)")
+
+                if self.settings.capture.capture_mode == "single":
+                    logger.info(f"{self.device_name}: Capture deactivated")
+                    self.capture_activated = False
+                i += 1  # the sample is not saved (like before)
+
+    def trigger_configure(self):
+        """
+        Resolve the trigger thresholds and capture times from the configuration (once, not for every sample)
+        """
+        capture = self.settings.capture
+        self.trigger_start = capture.start_trigger
+        self.trigger_stop = capture.stop_trigger
+        self.trigger_min_ns = capture.min_capture_ns
+        self.trigger_max_ns = capture.max_capture_ns
+        # combined: one trigger engine for all devices
+        self.trigger_engine = None
+        if capture.trigger_mode == 'combined':
+            if Connection.combined_trigger is None:
+                Connection.combined_trigger = TriggerEngine(capture.combined_trigger)
+            self.trigger_engine = Connection.combined_trigger
+
+    def capture_start(self, start_ns: int = None):
+        """
+        Start the capture, in streaming mode the capture file is opened and the pre-capture is written to it
+        :param start_ns: start time (perf_counter_ns, default: now)
+        """
+        self.capture_running = True
+        self.capture_start_ns = start_ns or time.perf_counter_ns()
+        # one wall clock anchor per capture
+        self.clock.anchor()
+        self.capture_starttime = datetime.fromtimestamp(self.clock.to_wall(self.capture_start_ns))
+        capture = self.settings.capture
+        if not capture.streaming or self.capture_stream:
+            return
+        extension = CAPTURE_FILE_EXTENSION if capture.file_format == 'binary' else '.csv'
+        chunk_samples = int((self.speed_hz or 1280) * capture.chunk_time_s)
+        self.capture_stream = CaptureStreamWriter(capture_filename(self.device_name, self.capture_starttime, extension), self.device_name,
+                                                  self.message_codes.conf, capture.file_format, chunk_samples, capture.fsync,
+                                                  capture.max_pending_chunks)
+        self.capture_stream.append(self.precapture_data.to_samples())
+        self.precapture_data.clear()
+        logger.info(f"{self.device_name}: Capture streaming to {self.capture_stream.file}")
+
+    def capture_stream_close(self):
+        """
+        Close the capture file of the streaming mode (the rest is written in the background)
+        """
+        stream = self.capture_stream
+        self.capture_stream = None
+        self.capture_persist(stream.close, ())
+
+    def capture_save(self, samples: np.ndarray):
+        """
+        Hand over the captured samples to the persistence pipeline (saved without pipeline, if it is not running)
+        :param samples: structured array (PyLS3_capture.SAMPLE_DTYPE)
+        """
+        if self.settings.capture.file_format == 'binary':
+            save = capture_binary_save
+        else:
+            save = capture_csv_save
+        self.capture_persist(save, (self.device_name, samples, datetime.now(), self.message_codes.conf))
+
+    def capture_persist(self, save, save_args: tuple):
+        """
+        :param save: function writing the capture file, returns the filename
+        :param save_args: arguments for save
+        """
+        plot_kwargs = None
+        if self.settings.capture.auto_generate_plot:
+            plot_kwargs = dict(csv_type='pyls3', show_plot=False, save_image=True)
+        if self.persistence:
+            self.persistence.submit(f"{self.device_name}: Capture", save, save_args, plot_kwargs)
+        else:
+            csv_file = save(*save_args)
+            if plot_kwargs is not None:
+                from PyLS3_plot import create_plot
+                create_plot(csv_file, **plot_kwargs)
+
+    def rx_state_update(self, frames: np.ndarray):
+        """
+        Set the current device state (mode, unit, speed, ...) from the last received frame
+        :param frames: structured array (PyLS3_frame.FRAME_DTYPE) with one frame
+        """
+        (self.working_mode, self.measured_value, self.measure_mode, self.reference_zero,
+         self.electric_quantity, self.unit_value, self.speed_value) = (c[0] for c in frames_to_columns(frames))
+        # the raw code bytes index the lookups of the message codes
+        working_mode, measure_mode, unit_value, speed_value = (int(frames[f].view(np.uint8)[0]) for f in MESSAGE_CODE_FIELDS.values())
+        codes = self.message_codes
+        parsed = (codes.working_mode[working_mode], codes.measure_mode[measure_mode], codes.unit_value[unit_value], codes.speed_value[speed_value])
+        if None in parsed:
+            logger.warning(f"Unknown message code\n Data: {frames} \n Buffer:{self.frame_decoder.buffer}\n----------------------\n")
+            return
+        self.working_mode_parsed, self.measure_mode_parsed, self.unit_value_parsed, self.speed_value_parsed = parsed
+        self.speed_hz = codes.speed_hz[speed_value]
 
-            # # check dataq for corrupt entries
-            # while True:
-            #     if len(self.rx_dataq) >= 20:
-            #         # control_index must be 18
-            #         control_index = self.rx_dataq.find(b'\r')
-            #         if control_index == -1:
-            #             # corrupt data
-            #             self.rx_dataq = bytes()
-            #             break
-            #         elif control_index < 19:
-            #             self.rx_dataq = self.rx_dataq[control_index + 1:]
-            #         elif control_index > 19:
-            #             self.rx_dataq = self.rx_dataq[control_index - 19:]
-            #         else:
-            #             break
-            #     else:
-            #         break
-            #
-            # # split data to 20 byte, leave rest in queue
-            # full_data_entries = len(self.rx_dataq) // 20 * 20
-            #
-            # for i in range(0, full_data_entries, 20):
-            #     self.rx_data_counter += 1
-            #     data = self.rx_dataq[i:i+20]
-            #     self.working_mode = data.decode("ASCII")[0]
-            #     self.measured_value = data.decode("ASCII")[1:7]
-            #     self.measure_mode = data.decode("ASCII")[7]
-            #     self.reference_zero = data.decode("ASCII")[8:14]
-            #     self.electric_quantity = (data[14] - 32) * 2
-            #     self.unit_value = data.decode("ASCII")[15]
-            #     self.speed_value = data.decode("ASCII")[16]
-            #     # self.check_value         = data.decode("ASCII")[17:19]
-            #     try:
-            #         self.working_mode_parsed = PyLS3_Conf['MessageCode']['WorkingMode'][self.working_mode]
-            #         self.measure_mode_parsed = PyLS3_Conf['MessageCode']['MeasureMode'][self.measure_mode]
-            #         self.unit_value_parsed = PyLS3_Conf['MessageCode']['UnitValue'][self.unit_value]
-            #         self.speed_value_parsed = PyLS3_Conf['MessageCode']['SpeedValue'][self.speed_value]
-            #     except Exception as e:
-            #         logger.warning(f"Exception {e}\n Data: {data} \n Dataq:{self.rx_dataq}\n----------------------\n")
-            #
-            #     cvs_line = f"{self.device_name}, {present_time}, {rx_timestamp}, {rx_delays}, {self.measured_value}, {self.unit_value_parsed}, {self.reference_zero}, {self.measure_mode_parsed}, {self.speed_value_parsed}Hz, {self.electric_quantity}, {self.working_mode_parsed}"
-            #     rx_delays = 0       # in case there are multiple in the rx_dataq
-            #
-            #     # Capture?
-            #     if not self.capture_activated:
-            #         pass
-            #     elif not self.capture_running and not self.capture_stop_trigger:
-            #         # Check StartTrigger
-            #         if float(self.measured_value) >= float(PyLS3_Conf['Capture']['StartTrigger']):
-            #             self.capture_running = True
-            #             logger.info(f"{self.device_name}: Capture starting")
-            #             self.capture_starttime = datetime.now()
-            #             self.capture_data.append(cvs_line)  # save to log
-            #         else:
-            #             self.precapture_data.append(cvs_line)   # save to precapture
-            #     elif self.capture_running:
-            #         self.capture_data.append(cvs_line)  # save to log
-            #         # Check MaxCaptureTime_s
-            #         if present_time - self.capture_starttime >= timedelta(seconds=PyLS3_Conf['Capture']['MaxCaptureTime_s']):
-            #             self.capture_stop_trigger = True
-            #             self.capture_running = False
-            #             # print(f"{datetime.now().isoformat()} {self.device_name}: Capture stopping (MaxCaptureTime_s exceeded)")
-            #             logger.info(f"{self.device_name}: Capture stopping (MaxCaptureTime_s exceeded)")
-            #         elif self.capture_stop_trigger or float(self.measured_value) <= float(PyLS3_Conf['Capture']['StopTrigger']):
-            #             if not self.capture_stop_trigger:
-            #                 logger.info(f"{self.device_name}: Capture Stop Trigger set ")
-            #                 self.capture_stop_trigger = True
-            #             if present_time - self.capture_starttime >= timedelta(seconds=PyLS3_Conf['Capture']['MinCaptureTime_s']):
-            #                 self.capture_running = False
-            #                 logger.info(f"{self.device_name}: Capture stopping")
-            #     else:
-            #         self.capture_save_ongoing = True
-            #         # write data
-            #         logger.info(f"{self.device_name}: Capture saving Data")
-            #         save_data = list(self.precapture_data) + self.capture_data
-            #         csv_file = csv_save(self.device_name, save_data)
-            #         if PyLS3_Conf['Capture']['AutoGeneratePlot']:
-            #             coro = plot_csv(csv_file, csv_type='pyls3', show_plot=False, save_image=True)
-            #             task = asyncio.create_task(coro)
-            #             # await task
-            #
-            #         self.capture_data.clear()
-            #         self.precapture_data.clear()
-            #         self.capture_save_ongoing = False
-            #         self.capture_stop_trigger = False
-            #         logger.info(f"{self.device_name}: Capture Stop Trigger unset")
-            #         logger.info(f"{self.device_name}: Ready (Capture activated)")
-            #
-            #         if PyLS3_Conf['Capture']['CaptureMode'] == "single":
-            #             logger.info(f"{self.device_name}: Capture deactivated")
-            #             self.capture_activated = False
-            #
-            # self.rx_dataq = self.rx_dataq[full_data_entries:]           # remove processed data from queue
+    def capture_append(self, samples: np.ndarray):
+        if not samples.size:
+            return
+        if self.capture_stream:
+            self.capture_stream.append(samples)
+        else:
+            self.capture_data.append(samples)
 
     def precapture_queue_initilize(self):
-        maxlentries = int(self.speed_value_parsed) * PyLS3_Conf['Capture']['PreCaptureTime_s']
-        self.precapture_data = deque([], maxlen=maxlentries)
+        self.trigger_configure()
+        capture = self.settings.capture
+        maxlentries = int(int(self.speed_value_parsed) * capture.precapture_time_s)
+        self.precapture_data = PreCaptureBuffer(maxlen=maxlentries)
+        if not capture.streaming:
+            self.capture_data.reserve(int(int(self.speed_value_parsed) * capture.max_capture_time_s))
 
     def precapture_queue_clear(self):
         self.precapture_data.clear()
@@ -842,14 +1126,19 @@ class SerialConnection(asyncio.Protocol, Connection):
         # input_str = '41 0D 0A 58'  # start logging
         input_str = '45 0D 0A 5C'       # stop  logging
         bytes_to_send = bytes.fromhex(input_str)
-        transport.serial.rts = False  # You can manipulate Serial object via transport
+        try:
+            transport.serial.rts = False  # You can manipulate Serial object via transport
+        except OSError:
+            pass    # port without RTS (e.g. pseudo terminal of PyLS3_simulator)
         transport.write(bytes_to_send)  # Write serial data via transport
 
     def connection_lost(self, exc):
         logger.warning(f"{self.device_name}: Serial port closed")
         self.connected = False
+        self.connection_event.set()
         Connection.devices_active -= 1
-        Connection.devices_registered.remove(self.device_name)
+        if self.device_name in Connection.devices_registered:
+            Connection.devices_registered.remove(self.device_name)
         # self.transport.loop.stop()
         # self.transport.close()
 
@@ -867,8 +1156,14 @@ class SerialConnection(asyncio.Protocol, Connection):
         logger.debug(self.transport.get_write_buffer_size())
         logger.debug('resume writing')
 
+    def rx_flow_control(self) -> tuple:
+        return self.transport.pause_reading, self.transport.resume_reading
+
     async def cleanup(self):
         # await self.cmd_send('DeactivateLogging')
+        await self.receive_pipeline_close()
+        if self.capture_stream:
+            self.capture_stream_close()
         if self in Connection.device_object_list:
             Connection.device_object_list.remove(self)
         # self.device_configured = False
@@ -885,7 +1180,8 @@ class BluetoothConnection(Connection):
     read_characteristic – the characteristic on the remote device containing data we are interested in.
     write_characteristic – the characteristic on the remote device which we can write data.
     """
-    client: BleakClient = None
+    client = None   # BleakClient
+    ble_client_factory = None   # creates the client instead of bleak.BleakClient (e.g. PyLS3_simulator.SimulatedBleakClient)
 
     def __init__(
             self,
@@ -894,9 +1190,12 @@ class BluetoothConnection(Connection):
             device_address: str,
             read_characteristic: str,
             write_characteristic: str,
+            settings: Settings = None,
     ):
         # self.loop = loop
         self.device_name = device_name
+        if settings is not None:
+            self.settings = settings
         self.device_address = device_address
         self.read_characteristic = read_characteristic
         self.write_characteristic = write_characteristic
@@ -910,23 +1209,23 @@ class BluetoothConnection(Connection):
         while True:
             if self.device_force_close:
                 break
-            if self.client:
-                await self.connect()
-            else:
+            if not self.client:
                 await self.device_find()
-            await asyncio.sleep(10.0)
+            if not await self.connect() and not self.device_force_close:
+                await asyncio.sleep(self.settings.reconnect_delay_s)
 
     async def device_find(self):
         logger.info(f"{self.device_name}: Searching device {self.device_address}")
-        device = await BleakScanner.find_device_by_address(self.device_address, timeout=20.0)
-        if not device:
-            logger.info(f"{self.device_name}: A device with address {self.device_address} could not be found.")
-        else:
-            logger.info(f"{self.device_name}: Connecting to device ({self.device_address})")
-            self.client = BleakClient(device)
+        device = await self.discovery.wait_ble(self.device_name, self.device_address)
+        logger.info(f"{self.device_name}: Connecting to device ({self.device_address})")
+        if self.ble_client_factory is not None:
+            self.client = self.ble_client_factory(device, disconnected_callback=self.connection_lost)
+            return
+        from bleak import BleakClient
+        self.client = BleakClient(device, disconnected_callback=self.connection_lost)
 
     async def device_configure(self):
-        for c in PyLS3_Conf['UseDevices'][self.device_name]['InitialCommands']:
+        for c in self.device_settings.initial_commands:
             if not self.device_force_close:
                 logger.info(f"{self.device_name}: Configure sending command '{c}'")
                 await self.cmd_send(c)
@@ -937,36 +1236,57 @@ class BluetoothConnection(Connection):
             self.capture_activated = True
             logger.info(f"{self.device_name}: Ready (Capture activated)")
 
-    async def connect(self):
+    async def connect(self) -> bool:
+        """
+        Connect and configure the device, returns when the connection is lost (or closed)
+        :return: True if the device was connected
+        """
         if self.connected:
-            return
+            await self.connection_event.wait()
+            return True
+        if not await self.open():
+            return False
+        try:
+            await self.cmd_send('ActivateLogging')
+            await self.device_configure()
+        except Exception as e:
+            logger.error(f"Exception: {self.device_name} Bl configure: {e}")
+            if not self.connected:
+                return False
+        await self.connection_event.wait()
+        return True
+
+    async def open(self) -> bool:
+        """
+        Connect the device (found by device_find) and start the notifications
+        :return: True if the device is connected
+        """
         try:
+            self.connection_event.clear()
             await self.client.connect()
             self.connected = self.client.is_connected
             if self.connected:
                 logger.info(f"{self.device_name}: Connected to device ({self.device_address})")
                 Connection.devices_registered.append(self.device_name)
                 Connection.devices_active += 1
-                self.client.set_disconnected_callback(self.connection_lost)
                 await self.client.start_notify(
                     self.read_characteristic, self.data_received,
                 )
-                await self.cmd_send('ActivateLogging')
-                await self.device_configure()
-                while True:
-                    if not self.connected:
-                        break
-                    await asyncio.sleep(5.0)
+                return True
             else:
                 logger.warning(f"Failed to connect to {self.device_name} ({self.device_address})")
         except Exception as e:
             logger.error(f"Exception: {self.device_name} Bl connect: {e}")
+            if not self.connected:
+                self.client = None
+        return False
 
-    def connection_lost(self, client: BleakClient):
+    def connection_lost(self, client: 'BleakClient'):
         logger.warning(f"Disconnected from {self.device_name}!")
         self.device_configured = False
         self.connected = False
         self.client = None
+        self.connection_event.set()
         Connection.devices_active -= 1
         if self.device_name in Connection.devices_registered:
             Connection.devices_registered.remove(self.device_name)
@@ -978,6 +1298,9 @@ class BluetoothConnection(Connection):
         await self.client.write_gatt_char(self.write_characteristic, data)
 
     async def cleanup(self):
+        await self.receive_pipeline_close()
+        if self.capture_stream:
+            self.capture_stream_close()
         if self.client:
             await self.client.stop_notify(self.read_characteristic)
             await self.client.disconnect()
@@ -1021,9 +1344,12 @@ class SerialConnectionManager:
             self,
             loop,
             device_name: str,
+            settings: Settings = None,
     ):
         self.loop = loop
         self.device_name = device_name
+        self.settings = settings or Connection.settings
+        self.device_settings = self.settings.device(device_name)
 
         self.device_found = False
         self.device_client = None
@@ -1047,6 +1373,8 @@ class SerialConnectionManager:
             elif not self.device_client:
                 logger.info(f"{self.device_name}: Create Client for device")
                 await self.device_create_client()
+                if not self.device_client:
+                    await asyncio.sleep(self.settings.reconnect_delay_s)
             elif not self.device_connected:
                 logger.info(f"{self.device_name}: Connect to device")
                 await self.device_connect()
@@ -1057,38 +1385,30 @@ class SerialConnectionManager:
                 logger.info(f"{self.device_name}: Configure device")
                 await self.device_configure()
             else:
-                pass
+                # ready, wake up on connection lost or ForceClose
+                await self.device_object.connection_event.wait()
             if self.device_connected:
                 await self.device_check_connected()
-            await asyncio.sleep(5)
 
     async def device_find(self):
-        if PyLS3_Conf['UseDevices'][self.device_name]['ConnectionType'] == 'Bluetooth':
+        if self.device_settings.connection_type == 'Bluetooth':
             pass
-        elif PyLS3_Conf['UseDevices'][self.device_name]['ConnectionType'] == 'USB':
-            com_ports = list(comport.device for comport in serial.tools.list_ports.comports())
-            if PyLS3_Conf['Device'][self.device_name]['USB'] in com_ports:
-                self.device_found = True
-                logger.debug(f"{self.device_name}: Serial Port '{PyLS3_Conf['Device'][self.device_name]['USB']}' found in Serial-Port List '{com_ports}'")
-            else:
-                self.device_found = False
-                logger.info(f"{self.device_name}: Serial Port '{PyLS3_Conf['Device'][self.device_name]['USB']}' not found in Serial-Port List '{com_ports}'")
+        elif self.device_settings.connection_type == 'USB':
+            await Connection.discovery.wait_port(self.device_name, self.device_settings.usb)
+            self.device_found = True
 
     async def device_create_client(self):
         if self.device_name in Connection.devices_registered:
             Connection.devices_registered.remove(self.device_name)
-        try:
-            usb_speed = PyLS3_Conf['Device'][self.device_name]['USB_Speed']
-        except KeyError:
-            usb_speed = 230400
+        usb_speed = self.device_settings.usb_speed
 
         try:
-            coro = serial_asyncio.create_serial_connection(self.loop, SerialConnection, PyLS3_Conf['Device'][self.device_name]['USB'], usb_speed, bytesize=8, parity='N', stopbits=1, timeout=None, xonxoff=0, rtscts=0)
+            import serial_asyncio
+            coro = serial_asyncio.create_serial_connection(self.loop, lambda: SerialConnection(self.device_name, self.settings), self.device_settings.usb, usb_speed, bytesize=8, parity='N', stopbits=1, timeout=None, xonxoff=0, rtscts=0)
             task = asyncio.create_task(coro)
             transport, protocol = await task
             self.device_object = protocol
             self.device_client = 'DummySerial'
-            self.device_object.device_name = self.device_name
             Connection.devices_registered.append(self.device_name)
         except Exception as e:
             logger.error(f"Exception {e}")
@@ -1111,7 +1431,7 @@ class SerialConnectionManager:
         self.device_reading_active = True
 
     async def device_configure(self):
-        for c in PyLS3_Conf['UseDevices'][self.device_name]['InitialCommands']:
+        for c in self.device_settings.initial_commands:
             if not self.device_object.device_force_close:
                 logger.info(f"{self.device_name}: Configure sending command '{c}'")
                 await self.device_object.cmd_send(c)
@@ -1135,12 +1455,13 @@ class SerialConnectionManager:
 
 
 async def user_console():
+    from aioconsole import aprint, ainput
     logger.info(f"User-Console: started")
     logger.info(f"User-Console: the console is only displayed again after enter has been pressed (this may take a few seconds)!")
     run_user_console = True
     while run_user_console:
         await aprint(f"User-Console: Currently registered devices: {Connection.devices_registered}")
-        await aprint("User-Console: Please enter: 'q | quit' 'l | list_cmd' \"send <command> [<device>]\" ")
+        await aprint("User-Console: Please enter: 'q | quit' 'l | list_cmd' 's | status' \"send <command> [<device>]\" ")
         input_str = await ainput("Please enter value: ")
 
         if input_str in ('quit', 'q',):
@@ -1149,9 +1470,17 @@ async def user_console():
                 await c.cmd_send('ForceClose')
                 # await asyncio.wait_for(c.cmd_send('ForceClose'), timeout=1.0)
                 run_user_console = False
+        elif input_str in ('s', 'status'):
+            await aprint(f"User-Console: Persistence: {Connection.persistence.status()}")
+            if Connection.live_server is not None:
+                await aprint(f"User-Console: Live server: {Connection.live_server.status()}")
+            for c in Connection.device_object_list:
+                await aprint(f"User-Console: {c.device_name}: Receive: {c.rx_status()}")
+                if c.receive_pipeline is not None:
+                    await aprint(f"User-Console: {c.device_name}: Receive pipeline: {c.receive_pipeline.status()}")
         elif input_str in ('l', 'list_cmd'):
-            for c in PyLS3_Conf['Commands']:
-                print(f"{c}: {PyLS3_Conf['Commands'][c]}")
+            for c in Connection.commands:
+                print(f"{c.name}: {c.description} {c.code.hex(' ').upper()}")
         elif (input_str.split().__len__() == 2 or input_str.split().__len__() == 3) and input_str.split()[0] == 'send':
             cmd = input_str.split()[1]
             for c in Connection.device_object_list:
@@ -1170,23 +1499,45 @@ async def main():
     # Dict for all tasks
     task = dict()
 
+    # start background saving of captures
+    settings = Connection.settings
+    Connection.persistence = PersistencePipeline(**{k: settings.conf['Persistence'][v] for k, v in (('queue_size', 'QueueSize'), ('file_workers', 'FileWorkers'), ('plot_workers', 'PlotWorkers'))})
+    await Connection.persistence.start()
+
+    # compile the commands once
+    Connection.commands = CommandTable(settings.conf['Commands'])
+
+    # one discovery (BLE scan, serial port list) for all connection managers
+    Connection.discovery = DeviceDiscovery(settings.conf['Discovery']['ScanTimeout_s'], settings.conf['Discovery']['PortInterval_s'])
+    Connection.discovery.start()
+
+    # live data for other programs
+    server = settings.server
+    if server.enabled:
+        Connection.live_server = LiveServer(list(settings.devices), settings.message_codes.conf, server.host, server.tcp_port,
+                                            server.websocket_port, server.client_queue_size, server.decimation)
+        await Connection.live_server.start()
+
     # start user_console
     if not args.no_user_console:
         task['con'] = asyncio.create_task(user_console())
 
     # Start connection to all Devices
     manager = dict()
-    # for num, d in enumerate(PyLS3_Conf['UseDevices']):
-    for d in PyLS3_Conf['UseDevices']:
-        if PyLS3_Conf['UseDevices'][d]['ConnectionType'] == 'Bluetooth':
-            manager[d] = BluetoothConnection(d, PyLS3_Conf['Device'][d]['MAC'], PyLS3_Conf['Bluetooth']['UART_TX_CHAR_UUID'], PyLS3_Conf['Bluetooth']['UART_RX_CHAR_UUID'])
-        elif PyLS3_Conf['UseDevices'][d]['ConnectionType'] == 'USB':
+    for d, device in settings.devices.items():
+        if device.connection_type == 'Bluetooth':
+            manager[d] = BluetoothConnection(d, device.mac, settings.conf['Bluetooth']['UART_TX_CHAR_UUID'], settings.conf['Bluetooth']['UART_RX_CHAR_UUID'])
+        elif device.connection_type == 'USB':
             manager[d] = SerialConnectionManager(loop=loop, device_name=d)
         else:
             continue
         task[d] = asyncio.create_task(manager[d].manager())
     for d in task:
         await task[d]
+    await Connection.discovery.close()
+    if Connection.live_server is not None:
+        await Connection.live_server.close()
+    await Connection.persistence.close()
     logger.info("PyLS3 is closing. Good bye!!!")
 
 
@@ -1239,22 +1590,17 @@ if __name__ == "__main__":
     # logger.critical('TEST')
     # exit()
 
-    # Load configuration files, maybe move somewhere else
-    PyLS3_AppCfg = yaml_load(args.appcfg)
-    PyLS3_UserCfg = yaml_load(args.usercfg)
-    # PyLS3_Conf = {**PyLS3_AppCfg, **PyLS3_UserCfg}   # UserCfg overrides AppCfg
-    PyLS3_Conf = deep_merge(PyLS3_AppCfg, PyLS3_UserCfg)
-    if args.conf:
-        args_dict = gen_args_dict(args.conf)
-        PyLS3_Conf = deep_merge(PyLS3_Conf, args_dict)
-        del args_dict
-    # LS3ReadLogxy()  # Generate the log-read commands are included in AppCfg
+    # Load configuration files (cached)
+    PyLS3_Conf, PyLS3_AppCfg, PyLS3_UserCfg, conf_key = load_PyLS3_Conf(args, with_sources=True)
     if not args.not_save_cfg:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        yaml_save(PyLS3_AppCfg, f"{PyLS3_Conf['Path']['Backup']}/{timestamp}_{args.appcfg}")
-        yaml_save(PyLS3_UserCfg, f"{PyLS3_Conf['Path']['Backup']}/{timestamp}_{args.usercfg}")
-        yaml_save(PyLS3_Conf, f"{PyLS3_Conf['Path']['Backup']}/{timestamp}_PyLS3_Conf.yml")
+        conf_backup(PyLS3_Conf, PyLS3_AppCfg, PyLS3_UserCfg, conf_key, args)
     del PyLS3_AppCfg
     del PyLS3_UserCfg
+    # validated settings for the connections (built once)
+    try:
+        Connection.settings = Settings.from_conf(PyLS3_Conf)
+    except (KeyError, TypeError, ValueError) as e:
+        logger.critical(f"Configuration not valid: {e}")
+        raise SystemExit(1)
     # run main
     asyncio.run(main())
@@ -0,0 +1,248 @@
+#!/usr/bin/python3
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from PyLS3_frame import FRAME_LENGTH, frames_measured_value
+
+
+# One decoded LS3 sample (the message codes are stored as raw ASCII byte, they are parsed at save time)
+SAMPLE_DTYPE = np.dtype([
+    ('rx_timestamp', 'f8'),
+    ('rx_delays', 'i4'),
+    ('measured_value', 'f4'),
+    ('reference_zero', 'f4'),
+    ('working_mode', 'u1'),
+    ('measure_mode', 'u1'),
+    ('unit_value', 'u1'),
+    ('speed_value', 'u1'),
+    ('electric_quantity', 'i2'),
+])
+# below this number of frames one array from python tuples is faster than the conversion per field (e.g. one BLE notification)
+_SCALAR_SAMPLES = 8
+
+
+def frames_to_samples(frames: np.ndarray, rx_timestamp: float, rx_delays: int = 0, measured_value: np.ndarray = None) -> np.ndarray:
+    """
+    Converts decoded frames to samples
+    :param frames: structured array (PyLS3_frame.FRAME_DTYPE)
+    :param rx_timestamp: receive timestamp for all frames
+    :param rx_delays: delay since the last packet (only set for the first frame, like the csv files before)
+    :param measured_value: already converted measured values (optional)
+    :return: structured array (SAMPLE_DTYPE)
+    """
+    if 0 < frames.size < _SCALAR_SAMPLES:
+        return _frames_to_samples_scalar(frames, rx_timestamp, rx_delays, measured_value)
+    samples = np.empty(frames.size, dtype=SAMPLE_DTYPE)
+    samples['rx_timestamp'] = rx_timestamp
+    samples['rx_delays'] = 0
+    if frames.size:
+        samples['rx_delays'][0] = rx_delays
+    samples['measured_value'] = frames_measured_value(frames) if measured_value is None else measured_value
+    samples['reference_zero'] = _bytes_to_float(frames['reference_zero'])
+    samples['working_mode'] = frames['working_mode'].view(np.uint8)
+    samples['measure_mode'] = frames['measure_mode'].view(np.uint8)
+    samples['unit_value'] = frames['unit_value'].view(np.uint8)
+    samples['speed_value'] = frames['speed_value'].view(np.uint8)
+    samples['electric_quantity'] = (frames['electric_quantity'].astype(np.int16) - 32) * 2
+    return samples
+
+
+def _frames_to_samples_scalar(frames: np.ndarray, rx_timestamp, rx_delays: int, measured_value: np.ndarray) -> np.ndarray:
+    """
+    frames_to_samples for a few frames, same values as the conversion per field
+    """
+    raw = frames.tobytes()
+    count = frames.size
+    timestamps = rx_timestamp.tolist() if isinstance(rx_timestamp, np.ndarray) else [rx_timestamp] * count
+    values = (frames_measured_value(frames) if measured_value is None else measured_value).tolist()
+    rows = []
+    for i in range(count):
+        f = raw[i * FRAME_LENGTH:(i + 1) * FRAME_LENGTH]
+        rows.append((timestamps[i], rx_delays if i == 0 else 0, values[i], _to_float(f[8:14].rstrip(b'\x00')),
+                     f[0], f[7], f[15], f[16], (f[14] - 32) * 2))
+    return np.array(rows, dtype=SAMPLE_DTYPE)
+
+
+class CaptureBuffer:
+    """
+    Columnar capture store: one preallocated typed array per SAMPLE_DTYPE field.
+    The arrays are doubled when they are full.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.columns = {k: np.empty(max(capacity, 1), dtype=SAMPLE_DTYPE[k]) for k in SAMPLE_DTYPE.names}
+        self.length = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def capacity(self) -> int:
+        return self.columns[SAMPLE_DTYPE.names[0]].size
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self.columns.values())
+
+    def reserve(self, capacity: int) -> None:
+        if capacity <= self.capacity:
+            return
+        for k, column in self.columns.items():
+            new_column = np.empty(capacity, dtype=column.dtype)
+            new_column[:self.length] = column[:self.length]
+            self.columns[k] = new_column
+
+    def append(self, samples: np.ndarray) -> None:
+        """
+        Append samples
+        :param samples: structured array (SAMPLE_DTYPE)
+        """
+        n = samples.size
+        if self.length + n > self.capacity:
+            self.reserve(max(self.capacity * 2, self.length + n))
+        for k, column in self.columns.items():
+            column[self.length:self.length + n] = samples[k]
+        self.length += n
+
+    def clear(self) -> None:
+        self.length = 0
+
+    def to_samples(self) -> np.ndarray:
+        """
+        :return: copy of all samples as structured array (SAMPLE_DTYPE)
+        """
+        samples = np.empty(self.length, dtype=SAMPLE_DTYPE)
+        for k, column in self.columns.items():
+            samples[k] = column[:self.length]
+        return samples
+
+
+class PreCaptureBuffer(CaptureBuffer):
+    """
+    Ring buffer variant of the CaptureBuffer for the pre-capture window.
+    When maxlen is reached the oldest samples are overwritten (like deque(maxlen=maxlen)).
+    """
+
+    def __init__(self, maxlen: int = 0):
+        super().__init__(capacity=maxlen)
+        self.maxlen = maxlen
+        self.start = 0
+
+    def append(self, samples: np.ndarray) -> None:
+        if not self.maxlen:
+            return
+        if samples.size > self.maxlen:
+            samples = samples[-self.maxlen:]
+        n = samples.size
+        # write position behind the newest sample
+        end = (self.start + self.length) % self.maxlen
+        first = min(n, self.maxlen - end)
+        for k, column in self.columns.items():
+            column[end:end + first] = samples[k][:first]
+            column[:n - first] = samples[k][first:]
+        overflow = self.length + n - self.maxlen
+        if overflow > 0:
+            self.start = (self.start + overflow) % self.maxlen
+            self.length = self.maxlen
+        else:
+            self.length += n
+
+    def clear(self) -> None:
+        self.start = 0
+        self.length = 0
+
+    def to_samples(self) -> np.ndarray:
+        samples = np.empty(self.length, dtype=SAMPLE_DTYPE)
+        if not self.length:
+            return samples
+        index = (np.arange(self.length) + self.start) % self.maxlen
+        for k, column in self.columns.items():
+            samples[k] = column[index]
+        return samples
+
+
+def first_true_index(mask: np.ndarray) -> int:
+    """
+    :param mask: bool array
+    :return: index of the first True value, -1 if there is none
+    """
+    index = int(np.argmax(mask)) if mask.size else 0
+    return index if mask.size and mask[index] else -1
+
+
+def decode_message_code(codes: np.ndarray, message_code: dict) -> list:
+    """
+    Converts raw message code bytes to the parsed values (e.g. ord('N') -> 'kN')
+    :param codes: uint8 array
+    :param message_code: dict, e.g. PyLS3_Conf['MessageCode']['UnitValue']
+    :return: list of str (unknown codes are returned as character)
+    """
+    lookup = np.array([chr(c) for c in range(256)], dtype=object)
+    for k, v in message_code.items():
+        lookup[ord(k)] = str(v)
+    return lookup[codes].tolist()
+
+
+def samples_to_csv_lines(samples: np.ndarray, device_name: str, message_code: dict):
+    """
+    Serializes samples to the PyLS3 csv lines (header_list in PyLS3_plot)
+    :param samples: structured array (SAMPLE_DTYPE)
+    :param device_name: name of the device
+    :param message_code: PyLS3_Conf['MessageCode']
+    :return: generator of csv lines
+    """
+    present_time = timestamps_to_strings(samples['rx_timestamp'])
+    unit_value = decode_message_code(samples['unit_value'], message_code['UnitValue'])
+    measure_mode = decode_message_code(samples['measure_mode'], message_code['MeasureMode'])
+    speed_value = decode_message_code(samples['speed_value'], message_code['SpeedValue'])
+    working_mode = decode_message_code(samples['working_mode'], message_code['WorkingMode'])
+    columns = zip(present_time, samples['rx_timestamp'].tolist(), samples['rx_delays'].tolist(),
+                  samples['measured_value'].astype(str).tolist(), unit_value, samples['reference_zero'].astype(str).tolist(),
+                  measure_mode, speed_value, samples['electric_quantity'].tolist(), working_mode)
+    for (p, t, d, v, u, r, m, s, e, w) in columns:
+        yield f"{device_name}, {p}, {t}, {d}, {v}, {u}, {r}, {m}, {s}Hz, {e}, {w}"
+
+
+def timestamps_to_strings(timestamps: np.ndarray) -> list:
+    """
+    Same as str(datetime.fromtimestamp(t)) for each timestamp, but converted with numpy instead of one datetime per sample
+    :param timestamps: float array (seconds)
+    :return: list of str (local time)
+    """
+    if not timestamps.size:
+        return []
+    offsets = {_utc_offset(float(timestamps[0])), _utc_offset(float(timestamps[-1]))}
+    if len(offsets) > 1:
+        # daylight saving time changed during the capture
+        return [str(datetime.fromtimestamp(t)) for t in timestamps.tolist()]
+    # rounded like datetime.fromtimestamp (fraction of the second)
+    seconds = np.floor(timestamps)
+    microseconds = seconds.astype(np.int64) * 1000000 + np.round((timestamps - seconds) * 1e6).astype(np.int64)
+    local = (microseconds + offsets.pop()).astype('datetime64[us]')
+    return [f"{t[:10]} {t[11:19]}" if t.endswith('.000000') else f"{t[:10]} {t[11:]}" for t in np.datetime_as_string(local).tolist()]
+
+
+def _utc_offset(timestamp: float) -> int:
+    """
+    :return: offset of the local time to utc in microseconds
+    """
+    return (datetime.fromtimestamp(timestamp) - datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)) // timedelta(microseconds=1)
+
+
+def _to_float(value: bytes) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+
+def _bytes_to_float(values: np.ndarray) -> np.ndarray:
+    try:
+        return values.astype(np.float32)
+    except ValueError:
+        result = np.empty(values.size, dtype=np.float32)
+        for i, v in enumerate(values.tolist()):
+            try:
+                result[i] = float(v)
+            except ValueError:
+                result[i] = np.nan
+        return result
@@ -0,0 +1,339 @@
+#!/usr/bin/python3
+import argparse
+import csv
+import json
+import logging
+import os
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+from PyLS3_capture import SAMPLE_DTYPE, CaptureBuffer, decode_message_code, samples_to_csv_lines
+
+
+logger = logging.getLogger("PyLS3")
+
+# Binary capture file:
+#   fixed header (_HEADER) | message codes as json | padding to CAPTURE_FILE_ALIGN | samples (SAMPLE_DTYPE records)
+# The number of samples is taken from the file size, so a file which is still written (or was not closed) could be read.
+CAPTURE_FILE_MAGIC = b'PYLS3CAP'
+CAPTURE_FILE_VERSION = 1
+CAPTURE_FILE_EXTENSION = '.ls3cap'
+CAPTURE_FILE_ALIGN = 64
+# magic, version, header_size, start_timestamp, device_name, unit, measure_mode, speed (Hz), json length
+_HEADER = struct.Struct('<8sHId32s8s8sII')
+
+
+def is_capture_file(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() == CAPTURE_FILE_EXTENSION
+
+
+def capture_file_header(device_name: str, samples: np.ndarray, message_code: dict) -> bytes:
+    """
+    Creates the header, the metadata is taken from the first sample
+    :param device_name: name of the device
+    :param samples: structured array (SAMPLE_DTYPE), could be empty
+    :param message_code: PyLS3_Conf['MessageCode']
+    :return: header bytes (inc. padding)
+    """
+    start_timestamp = 0.0
+    unit = measure_mode = ''
+    speed = 0
+    if samples.size:
+        first = samples[:1]
+        start_timestamp = float(first['rx_timestamp'][0])
+        unit = decode_message_code(first['unit_value'], message_code['UnitValue'])[0]
+        measure_mode = decode_message_code(first['measure_mode'], message_code['MeasureMode'])[0]
+        try:
+            speed = int(decode_message_code(first['speed_value'], message_code['SpeedValue'])[0])
+        except ValueError:
+            speed = 0
+    metadata = json.dumps({
+        'message_code': {k: {str(c): str(v) for c, v in message_code[k].items()} for k in ('WorkingMode', 'MeasureMode', 'UnitValue', 'SpeedValue')},
+        'dtype': SAMPLE_DTYPE.descr,
+    }).encode('utf-8')
+    size = _HEADER.size + len(metadata)
+    header_size = -(-size // CAPTURE_FILE_ALIGN) * CAPTURE_FILE_ALIGN
+    header = _HEADER.pack(CAPTURE_FILE_MAGIC, CAPTURE_FILE_VERSION, header_size, start_timestamp, device_name.encode('utf-8')[:32],
+                          unit.encode('utf-8')[:8], measure_mode.encode('utf-8')[:8], speed, len(metadata))
+    return header + metadata + bytes(header_size - size)
+
+
+def capture_file_save(file: str, device_name: str, samples: np.ndarray, message_code: dict) -> str:
+    """
+    Save samples to a binary capture file
+    :param file: filename
+    :param device_name: name of the device
+    :param samples: structured array (SAMPLE_DTYPE)
+    :param message_code: PyLS3_Conf['MessageCode']
+    :return: filename
+    """
+    with open(file, 'wb') as outfile:
+        outfile.write(capture_file_header(device_name, samples, message_code))
+        outfile.write(np.ascontiguousarray(samples, dtype=SAMPLE_DTYPE).tobytes())
+    return file
+
+
+class CaptureFile:
+    """
+    Memory mapped reader for binary capture files (nothing is parsed, the samples are mapped directly)
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as infile:
+            fixed = infile.read(_HEADER.size)
+            if len(fixed) < _HEADER.size or fixed[:8] != CAPTURE_FILE_MAGIC:
+                raise ValueError(f"'{filename}' is not a PyLS3 capture file")
+            (magic, self.version, self.header_size, self.start_timestamp, device_name, unit, measure_mode,
+             self.speed, metadata_length) = _HEADER.unpack(fixed)
+            metadata = json.loads(infile.read(metadata_length).decode('utf-8'))
+        self.device_name = device_name.rstrip(b'\0').decode('utf-8')
+        self.unit = unit.rstrip(b'\0').decode('utf-8')
+        self.measure_mode = measure_mode.rstrip(b'\0').decode('utf-8')
+        self.message_code = metadata['message_code']
+        self.dtype = np.dtype([tuple(d) for d in metadata['dtype']])
+
+        sample_count = (os.path.getsize(filename) - self.header_size) // self.dtype.itemsize
+        if sample_count > 0:
+            self.samples = np.memmap(filename, dtype=self.dtype, mode='r', offset=self.header_size, shape=(sample_count,))
+        else:
+            self.samples = np.empty(0, dtype=self.dtype)
+
+    def __len__(self) -> int:
+        return self.samples.size
+
+    def __getitem__(self, key):
+        return self.samples[key]
+
+    @property
+    def start_time(self) -> datetime:
+        return datetime.fromtimestamp(self.start_timestamp)
+
+    def info(self) -> dict:
+        """
+        :return: the header values named like the pyls3 csv columns (see PyLS3_plot header_list)
+        """
+        return {
+            'device_name': self.device_name,
+            'present_time': str(self.start_time),
+            'rx_timestamp': self.start_timestamp,
+            'unit_value_parsed': self.unit,
+            'speed_value_parsed': f"{self.speed}Hz",
+            'measure_mode_parsed': self.measure_mode,
+        }
+
+    def to_dataframe(self):
+        """
+        :return: pandas DataFrame with the numeric columns (message codes are decoded to categorical columns)
+        """
+        import pandas as pd
+        df = pd.DataFrame({
+            'rx_timestamp': self.samples['rx_timestamp'],
+            'rx_delays': self.samples['rx_delays'],
+            'measured_value': self.samples['measured_value'].astype(np.float64),
+            'reference_zero': self.samples['reference_zero'],
+            'electric_quantity': self.samples['electric_quantity'],
+        })
+        for column, key in (('unit_value', 'UnitValue'), ('measure_mode', 'MeasureMode'), ('working_mode', 'WorkingMode')):
+            df[f'{column}_parsed'] = pd.Categorical(decode_message_code(self.samples[column], self.message_code[key]))
+        df['speed_value_parsed'] = pd.Categorical([f"{s}Hz" for s in decode_message_code(self.samples['speed_value'], self.message_code['SpeedValue'])])
+        df['device_name'] = self.device_name
+        return df
+
+    def csv_lines(self):
+        return samples_to_csv_lines(self.samples, self.device_name, self.message_code)
+
+
+def capture_file_to_csv(file: str, csv_file: str) -> str:
+    """
+    Convert a binary capture file to the pyls3 csv format
+    """
+    capture = CaptureFile(file)
+    with open(csv_file, 'w') as outfile:
+        for line in capture.csv_lines():
+            outfile.write(line + "\n")
+    return csv_file
+
+
+def csv_to_capture_file(csv_file: str, file: str, message_code: dict) -> str:
+    """
+    Convert a pyls3 csv file to a binary capture file
+    :param message_code: PyLS3_Conf['MessageCode'] (used to convert the parsed values back to the message codes)
+    """
+    lookup = {k: {str(v): ord(c) for c, v in message_code[k].items()} for k in ('WorkingMode', 'MeasureMode', 'UnitValue', 'SpeedValue')}
+    device_name = ''
+    rows = []
+    with open(csv_file, 'r', newline='') as infile:
+        for row in csv.reader(infile, skipinitialspace=True):
+            if len(row) < 11:
+                continue
+            device_name = row[0]
+            rows.append((float(row[2]), int(row[3]), float(row[4]), float(row[6]),
+                         lookup['WorkingMode'].get(row[10], 0), lookup['MeasureMode'].get(row[7], 0),
+                         lookup['UnitValue'].get(row[5], 0), lookup['SpeedValue'].get(row[8].replace('Hz', ''), 0), int(row[9])))
+    samples = np.array(rows, dtype=SAMPLE_DTYPE)
+    return capture_file_save(file, device_name, samples, message_code)
+
+
+class CaptureStreamWriter:
+    """
+    Writes a capture to disk while it is recorded (streaming capture mode).
+    Samples are collected in a small CaptureBuffer and written in chunks by a single writer thread,
+    so the memory stays flat and the receive path is not blocked by the file I/O.
+    With fsync every chunk is synced to disk, a crash loses at most one chunk.
+    If the disk can't keep up, max. max_pending chunks wait for the writer, further chunks are dropped (warning).
+    Failed writes are logged with the next chunk, close() raises an OSError if chunks could not be written.
+    """
+
+    def __init__(self, file: str, device_name: str, message_code: dict, file_format: str = 'csv', chunk_samples: int = 1280, fsync: bool = True,
+                 max_pending: int = 8):
+        """
+        :param file: filename
+        :param device_name: name of the device
+        :param message_code: PyLS3_Conf['MessageCode']
+        :param file_format: 'csv' | 'binary'
+        :param chunk_samples: number of samples per chunk
+        :param fsync: fsync after each chunk
+        :param max_pending: max. chunks waiting for the writer thread
+        """
+        self.file = file
+        self.device_name = device_name
+        self.message_code = message_code
+        self.file_format = file_format
+        self.chunk_samples = max(chunk_samples, 1)
+        self.fsync = fsync
+        self.max_pending = max(max_pending, 1)
+        self.buffer = CaptureBuffer(self.chunk_samples)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='PyLS3_stream')
+        self.futures = deque()          # (future, number of samples) of the chunks handed over to the writer thread
+        self.lock = threading.Lock()    # the counters are updated by the writer thread
+        self.outfile = None
+        self.chunks_pending = 0
+        self.chunks_written = 0
+        self.chunks_failed = 0
+        self.chunks_dropped = 0
+        self.drop_warned = False
+        self.samples_written = 0
+        self.samples_lost = 0
+
+    def append(self, samples: np.ndarray) -> None:
+        """
+        Add samples, a chunk is written when chunk_samples are collected
+        :param samples: structured array (SAMPLE_DTYPE)
+        """
+        self.buffer.append(samples)
+        if len(self.buffer) >= self.chunk_samples:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Hand over the collected samples to the writer thread
+        """
+        self.check()
+        if not len(self.buffer):
+            return
+        samples = self.buffer.to_samples()
+        self.buffer.clear()
+        with self.lock:
+            full = self.chunks_pending >= self.max_pending
+            if full:
+                self.chunks_dropped += 1
+                self.samples_lost += samples.size
+            else:
+                self.chunks_pending += 1
+        if full:
+            # warn once per series of dropped chunks
+            if not self.drop_warned:
+                logger.warning(f"{self.device_name}: Capture streaming to {self.file} can't keep up ({self.max_pending} chunks pending), dropping chunks")
+            self.drop_warned = True
+            return
+        self.drop_warned = False
+        self.futures.append((self.executor.submit(self._write, samples), samples.size))
+
+    def check(self) -> None:
+        """
+        Log the errors of the finished writes
+        """
+        while self.futures and self.futures[0][0].done():
+            future, size = self.futures.popleft()
+            if future.exception() is not None:
+                with self.lock:
+                    self.chunks_failed += 1
+                    self.samples_lost += size
+                logger.error(f"{self.device_name}: Capture streaming to {self.file} failed, {size} samples lost: {future.exception()}")
+
+    def close(self) -> str:
+        """
+        Write the rest and close the file (blocking, call it from a worker thread)
+        :return: filename
+        """
+        self.flush()
+        close = self.executor.submit(self._close)
+        self.executor.shutdown(wait=True)
+        self.check()
+        close.result()
+        if self.chunks_failed:
+            raise OSError(f"{self.file}: {self.chunks_failed} chunks could not be written ({self.samples_lost} samples lost)")
+        if self.chunks_dropped:
+            logger.warning(f"{self.device_name}: Capture streaming to {self.file}: {self.chunks_dropped} chunks dropped ({self.samples_lost} samples)")
+        return self.file
+
+    def _write(self, samples: np.ndarray) -> None:
+        try:
+            if self.outfile is None:
+                self._open(samples)
+            if self.file_format == 'binary':
+                self.outfile.write(samples.tobytes())
+            else:
+                self.outfile.write("".join(f"{line}\n" for line in samples_to_csv_lines(samples, self.device_name, self.message_code)).encode('utf-8'))
+            self.outfile.flush()
+            if self.fsync:
+                os.fsync(self.outfile.fileno())
+            with self.lock:
+                self.samples_written += samples.size
+                self.chunks_written += 1
+        finally:
+            with self.lock:
+                self.chunks_pending -= 1
+
+    def _open(self, samples: np.ndarray) -> None:
+        self.outfile = open(self.file, 'wb')
+        if self.file_format == 'binary':
+            self.outfile.write(capture_file_header(self.device_name, samples, self.message_code))
+
+    def _close(self) -> None:
+        if self.outfile is None:
+            self._open(np.empty(0, dtype=SAMPLE_DTYPE))
+        self.outfile.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='PyLS3 Capture File - convert pyls3 csv files to binary capture files and back',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog="Have fun ;)")
+    parser.add_argument('-f', '--filename', required=True, action='append', help=f"pyls3 csv or {CAPTURE_FILE_EXTENSION} file (could be applied multiple times)")
+    parser.add_argument('-ca', '--appcfg', default='PyLS3_AppCfg.yml', help='PyLS3 App configuration File')
+    parser.add_argument('-cu', '--usercfg', default='PyLS3_UserCfg.yml', help='PyLS3 User configuration File (overrides PyLS3 App configurations and args override both)')
+    parser.add_argument("-c", '--conf', default=None, action='append', help='could be applied multiple times (see PyLS3.py)')
+    args = parser.parse_args()
+
+    message_code = None
+    for f in args.filename:
+        if is_capture_file(f):
+            out_file = f"{os.path.splitext(f)[0]}.csv"
+            capture_file_to_csv(f, out_file)
+        else:
+            if not message_code:
+                from PyLS3 import load_PyLS3_Conf
+                message_code = load_PyLS3_Conf(args)['MessageCode']
+            out_file = f"{os.path.splitext(f)[0]}{CAPTURE_FILE_EXTENSION}"
+            csv_to_capture_file(f, out_file, message_code)
+        print(f"INFO> '{f}' converted to '{out_file}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+import asyncio
+import logging
+import numpy as np
+from PyLS3 import BluetoothConnection, Connection, SerialConnection
+from PyLS3_discovery import DeviceDiscovery
+from PyLS3_persistence import PersistencePipeline
+from PyLS3_pipeline import StageQueue
+from PyLS3_settings import Settings
+
+
+logger = logging.getLogger("PyLS3")
+
+
+class LS3Client:
+    """
+    Async client for one LS3, to use the live data in an own program (instead of reading the csv files of PyLS3.py).
+    The decoded samples are delivered batch by batch (one batch per received packet) as read-only structured arrays
+    (PyLS3_capture.SAMPLE_DTYPE), the arrays of the receive path are passed on without copy.
+
+        settings = Settings.from_conf(conf)
+        async with LS3Client('LS3_1', settings) as client:
+            await client.configure(['Speed1280'])
+            async for batch in client.stream():
+                print(batch['measured_value'].max())
+    """
+
+    def __init__(self, device_name: str, settings: Settings, queue_size: int = 256, policy: str = 'drop-oldest'):
+        """
+        :param device_name: name of the device (settings of Device: <device_name>)
+        :param settings: Settings (PyLS3_settings)
+        :param queue_size: max. batches waiting for stream()
+        :param policy: overflow policy if stream() is not consumed fast enough (see PyLS3_pipeline.StageQueue)
+        """
+        self.device_name = device_name
+        self.settings = settings
+        self.device_settings = settings.device(device_name)
+        self.connection = None          # SerialConnection | BluetoothConnection
+        self.transport = None           # serial transport
+        self.discovery = None           # own DeviceDiscovery (if the shared Connection.discovery isn't running)
+        self.persistence = None         # own PersistencePipeline of the connection (if the shared Connection.persistence isn't running)
+        self.batches = StageQueue(f"{device_name}_client", queue_size, policy)
+        self.watch_task = None
+
+    async def __aenter__(self) -> 'LS3Client':
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def connect(self, timeout: float = None) -> None:
+        """
+        Search and connect the device (the data is not activated, see configure)
+        :param timeout: max. seconds till the device is connected (None: wait till it shows up)
+        :raises ConnectionError: if the device could not be connected
+        :raises asyncio.TimeoutError: if the device was not found within timeout
+        """
+        discovery = Connection.discovery
+        if discovery is None:
+            discovery_conf = self.settings.conf['Discovery']
+            discovery = self.discovery = DeviceDiscovery(discovery_conf['ScanTimeout_s'], discovery_conf['PortInterval_s'])
+            discovery.start()
+        if self.device_settings.connection_type == 'Bluetooth':
+            await asyncio.wait_for(self.connect_ble(discovery), timeout)
+        else:
+            await asyncio.wait_for(self.connect_serial(discovery), timeout)
+        self.connection.sample_listeners.append(self.batch_received)
+        self.watch_task = asyncio.create_task(self.watch())
+
+    async def connect_ble(self, discovery: DeviceDiscovery) -> None:
+        bluetooth_conf = self.settings.conf['Bluetooth']
+        connection = BluetoothConnection(self.device_name, self.device_settings.mac, bluetooth_conf['UART_TX_CHAR_UUID'],
+                                         bluetooth_conf['UART_RX_CHAR_UUID'], self.settings)
+        connection.discovery = discovery
+        await connection.device_find()
+        if not await connection.open():
+            raise ConnectionError(f"{self.device_name}: Connect to {self.device_settings.mac} failed")
+        self.connection = connection
+
+    async def connect_serial(self, discovery: DeviceDiscovery) -> None:
+        import serial_asyncio
+        port = await discovery.wait_port(self.device_name, self.device_settings.usb)
+        try:
+            self.transport, self.connection = await serial_asyncio.create_serial_connection(
+                asyncio.get_running_loop(), lambda: SerialConnection(self.device_name, self.settings), port, self.device_settings.usb_speed,
+                bytesize=8, parity='N', stopbits=1, timeout=None, xonxoff=0, rtscts=0)
+        except Exception as e:
+            raise ConnectionError(f"{self.device_name}: Open {port} failed: {e}") from e
+        # connection_made (init of the connection) is called soon after the transport is created
+        await asyncio.sleep(0)
+        try:
+            self.transport.serial.set_buffer_size(rx_size=256000, tx_size=256000)
+        except Exception:
+            pass
+
+    async def configure(self, commands: list = None, capture: bool = False) -> None:
+        """
+        Activate the data and send the commands
+        :param commands: command names (default: InitialCommands of the device)
+        :param capture: also save the captures (Capture settings) like PyLS3.py, the files are written in the background
+        """
+        await self.send('ActivateLogging')
+        if commands is None:
+            commands = self.device_settings.initial_commands
+        for command in commands:
+            await self.send(command)
+        if capture:
+            if self.connection.persistence is None:
+                # the capture files and plots must not be written in the receive path
+                persistence_conf = self.settings.conf['Persistence']
+                self.persistence = self.connection.persistence = PersistencePipeline(
+                    persistence_conf['QueueSize'], persistence_conf['FileWorkers'], persistence_conf['PlotWorkers'])
+                await self.persistence.start()
+            self.connection.precapture_queue_initilize()
+            self.connection.capture_activated = True
+
+    async def send(self, command: str) -> None:
+        """
+        :param command: command name (see PyLS3_AppCfg.yml Commands), acknowledged like in PyLS3.py
+        """
+        if self.connection is None:
+            raise ConnectionError(f"{self.device_name}: Not connected")
+        await self.connection.cmd_send(command)
+
+    def batch_received(self, samples: np.ndarray) -> None:
+        batch = samples.view()
+        batch.flags.writeable = False
+        self.batches.put_nowait(batch)
+
+    async def watch(self) -> None:
+        # end the stream when the connection is lost
+        await self.connection.connection_event.wait()
+        self.batches.put_nowait(None)
+
+    async def stream(self):
+        """
+        Decoded samples till the connection is lost or closed
+        :return: async iterator of read-only structured arrays (PyLS3_capture.SAMPLE_DTYPE)
+        """
+        while True:
+            batch = await self.batches.get()
+            if batch is None:
+                return
+            yield batch
+
+    def status(self) -> dict:
+        """
+        :return: receive statistics and the queue of stream() (drops: batches lost, because stream() was too slow)
+        """
+        if self.connection is None:
+            return {'stream': self.batches.status()}
+        return {**self.connection.rx_status(), 'stream': self.batches.status()}
+
+    async def close(self) -> None:
+        """
+        Deactivate the data and disconnect the device
+        """
+        if self.connection is not None:
+            if self.connection.connected and not self.connection.device_force_close:
+                await self.connection.cmd_send('ForceClose')
+            else:
+                await self.connection.cleanup()
+            if self.transport is not None:
+                self.transport.close()
+                self.transport = None
+            self.connection.sample_listeners.remove(self.batch_received)
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+            self.watch_task = None
+        self.batches.put_nowait(None)
+        if self.persistence is not None:
+            await self.persistence.close()
+            self.connection.persistence = None
+            self.persistence = None
+        if self.discovery is not None:
+            await self.discovery.close()
+            self.discovery = None
@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+import re
+from typing import Callable, NamedTuple, Optional
+
+
+# connection types -> bit of Command.protocols
+PROTOCOLS = {'Bluetooth': 1, 'USB': 2}
+
+# Ack keys of the commands -> state attributes of the Connection
+ACK_STATE = {
+    'WorkingMode': 'working_mode_parsed',
+    'MeasureMode': 'measure_mode_parsed',
+    'UnitValue': 'unit_value_parsed',
+    'SpeedValue': 'speed_value_parsed',
+}
+
+READ_LOG_COUNT = 100
+
+# commands with an argument in the name (checked only if the name is not in the table)
+_WAIT = re.compile('Wait([0-9]+)')
+_RAWCMD = re.compile('RawCMD_([^_]+)_([TF])')
+
+
+def LS3crc(command: str) -> str:
+    """
+    Calculate CRC for Linescale3 Commands
+    :param command: LS3 command without crc
+    :return: LS3 CRC
+    """
+    crc = 0
+    command = command.replace(" ", "")          # Remove space
+    n = 2
+    # for i in command.split():
+    for i in range(0, len(command), n):
+        v = command[i:i+n]
+        crc += int(f'0x{v}', 16)
+    h = hex(crc)
+    h = h[2:]
+    return str(h)
+
+
+# command_without_crc = '41 0D 0A'
+# command_with_crc = LS3command_crc(command_without_crc)
+# print(command_without_crc, ' - ', command_with_crc)
+def LS3command_crc(command: str):
+    """
+    Generates the LS3 command with CRC for commands without crc
+    Calculate CRC for Linescale3 Commands
+    :param command: LS3 command without crc
+    :return: LS3 command with crc
+    """
+    crc = LS3crc(command)
+    return f'{command} {crc}'.upper()
+
+
+def LS3xyget(value):
+    """
+    Splits a number in 2 pieces
+    :param value:
+    :return:
+    """
+    return tuple(f'{value:02d}')
+
+
+def read_log_commands(count: int = READ_LOG_COUNT) -> dict:
+    """
+    Creates the LS3 commands for reading the onboard logging Data (ReadLog1..ReadLog<count>, 'R' + 2 digits + CRLF + CRC)
+    :return: Commands in dict (same layout as Commands in PyLS3_AppCfg.yml)
+    """
+    commands = dict()
+    for i in range(count):
+        x, y = LS3xyget(i)
+        commands[f"ReadLog{i + 1}"] = {
+            'Hex_Code': LS3command_crc(f"52 3{x} 3{y} 0D 0A"),
+            'Description': f"Read the log {i + 1}",
+            'SupportedProtocol': {'Bluetooth': False, 'USB': True},
+        }
+    return commands
+
+
+def ack_predicate(ack: dict) -> Optional[Callable]:
+    """
+    Compiles the Ack of a command (e.g. {UnitValue: kN}, {Frames: True}, {Changed: MeasureMode})
+    :return: predicate(connection, last_state) -> True if the state of the connection matches the Ack
+             (last_state: Connection.cmd_ack_state() before the command was sent), None if nothing has to be checked
+    """
+    checks = []
+    for key, value in ack.items():
+        if key == 'NoFrames':
+            continue
+        elif key == 'Frames':
+            checks.append(lambda connection, last_state: connection.rx_data_counter > last_state['Frames'])
+        elif key == 'Changed':
+            checks.append(lambda connection, last_state, attribute=ACK_STATE[value], key=value: getattr(connection, attribute) != last_state[key])
+        else:
+            checks.append(lambda connection, last_state, attribute=ACK_STATE[key], value=str(value): str(getattr(connection, attribute)) == value)
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    return lambda connection, last_state: all(check(connection, last_state) for check in checks)
+
+
+class Command(NamedTuple):
+    name: str
+    code: bytes                 # bytes to send (empty for special commands)
+    protocols: int              # bitmask of PROTOCOLS
+    ack: Optional[Callable]     # see ack_predicate
+    quiet: bool                 # Ack NoFrames: acknowledged when no frame is received for QuietTime_s
+    has_ack: bool               # False: the command is not acknowledged (NoAckDelay_s)
+    description: str
+    argument: object = None     # Wait: seconds, RawCMD: hex code
+
+    def supported(self, connectiontype: str) -> bool:
+        return bool(self.protocols & PROTOCOLS[connectiontype])
+
+
+def compile_command(name: str, conf: dict) -> Command:
+    """
+    :param name: name of the command
+    :param conf: command configuration (PyLS3_AppCfg.yml Commands)
+    """
+    ack = conf.get('Ack') or {}
+    protocols = 0
+    for connectiontype, bit in PROTOCOLS.items():
+        if conf['SupportedProtocol'].get(connectiontype):
+            protocols |= bit
+    return Command(name, bytes.fromhex(conf['Hex_Code'] or ''), protocols, ack_predicate(ack), bool(ack.get('NoFrames')), bool(ack),
+                   conf.get('Description', ''))
+
+
+class CommandTable:
+    """
+    All commands compiled once (hex codes encoded, protocols as bitmask, Ack as predicate), looked up by name.
+    The ReadLog commands are generated (see read_log_commands), entries in the configuration override them.
+    """
+
+    def __init__(self, commands_conf: dict):
+        """
+        :param commands_conf: PyLS3_Conf['Commands']
+        """
+        self.commands = {name: compile_command(name, conf) for name, conf in {**read_log_commands(), **commands_conf}.items()}
+
+    def __iter__(self):
+        return iter(self.commands.values())
+
+    def get(self, name: str) -> Optional[Command]:
+        """
+        :param name: command name, inc. Wait<seconds> and RawCMD_<hex>_<T|F>
+        :return: Command (None if not defined)
+        """
+        command = self.commands.get(name)
+        if command is not None and command.name not in ('Wait', 'RawCMD'):
+            return command
+        match = _WAIT.search(name)
+        if match:
+            return self.commands['Wait']._replace(argument=int(match.group(1)))
+        match = _RAWCMD.search(name)
+        if match:
+            hex_code = match.group(1)
+            if match.group(2).upper() == "T":
+                hex_code = LS3command_crc(hex_code)
+            return self.commands['RawCMD']._replace(code=bytes.fromhex(hex_code), argument=hex_code)
+        return None
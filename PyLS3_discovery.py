@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+import asyncio
+import logging
+import os
+import serial.tools.list_ports
+
+
+logger = logging.getLogger("PyLS3")
+
+
+class DeviceDiscovery:
+    """
+    Shared discovery of all configured devices.
+    One BLE scan matches the MAC addresses of all waiting devices at once and the serial port list is watched
+    for (hot-plugged) ports. A connection manager waits for its device and is woken as soon as the device is seen.
+    The BLE scan only runs while at least one device is waiting, so it doesn't disturb the connected devices.
+    """
+
+    def __init__(self, scan_timeout: float = 10.0, port_interval: float = 0.5):
+        """
+        :param scan_timeout: the BLE scanner is restarted after scan_timeout seconds (if devices are still missing)
+        :param port_interval: seconds between two checks of the serial port list
+        """
+        self.scan_timeout = scan_timeout
+        self.port_interval = port_interval
+        self.ble_wanted = dict()        # MAC address -> device_name
+        self.port_wanted = dict()       # serial port -> device_name
+        self.found = dict()             # device_name -> BLEDevice | serial port
+        self.events = dict()            # device_name -> asyncio.Event (set when found)
+        self.ble_requested = asyncio.Event()
+        self.ble_all_found = asyncio.Event()
+        self.port_requested = asyncio.Event()
+        self.tasks = []
+
+    def start(self) -> None:
+        self.tasks = [
+            asyncio.create_task(self.ble_scan()),
+            asyncio.create_task(self.port_watch()),
+        ]
+
+    async def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def wait_ble(self, device_name: str, address: str):
+        """
+        Wait till the device is seen by the BLE scan
+        :param device_name: name of the device
+        :param address: MAC address of the device
+        :return: BLEDevice
+        """
+        event = self.events[device_name] = asyncio.Event()
+        self.ble_wanted[address.upper()] = device_name
+        self.ble_all_found.clear()
+        self.ble_requested.set()
+        await event.wait()
+        return self.found.pop(device_name)
+
+    async def wait_port(self, device_name: str, port: str) -> str:
+        """
+        Wait till the serial port is available
+        :param device_name: name of the device
+        :param port: serial port (e.g. COM3, /dev/ttyUSB0)
+        :return: serial port
+        """
+        event = self.events[device_name] = asyncio.Event()
+        self.port_wanted[port] = device_name
+        self.port_requested.set()
+        await event.wait()
+        return self.found.pop(device_name)
+
+    def device_found(self, device_name: str, device) -> None:
+        self.found[device_name] = device
+        self.events.pop(device_name).set()
+
+    def ble_detected(self, device, advertisement_data) -> None:
+        device_name = self.ble_wanted.pop(device.address.upper(), None)
+        if device_name is None:
+            return
+        logger.info(f"{device_name}: Device {device.address} found")
+        self.device_found(device_name, device)
+        if not self.ble_wanted:
+            self.ble_all_found.set()
+
+    async def ble_scan(self) -> None:
+        while True:
+            await self.ble_requested.wait()
+            from bleak import BleakScanner  # only if a Bluetooth device is used
+            self.ble_requested.clear()
+            while self.ble_wanted:
+                logger.info(f"Discovery: Searching {', '.join(f'{n} ({a})' for a, n in self.ble_wanted.items())}")
+                try:
+                    async with BleakScanner(detection_callback=self.ble_detected):
+                        await asyncio.wait_for(self.ble_all_found.wait(), timeout=self.scan_timeout)
+                except asyncio.TimeoutError:
+                    logger.info(f"Discovery: {', '.join(self.ble_wanted.values())} not found yet")
+                except Exception as e:
+                    logger.error(f"Discovery: BLE scan failed: {e}")
+                    await asyncio.sleep(self.scan_timeout)
+
+    async def port_watch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.port_requested.wait()
+            com_ports = await loop.run_in_executor(None, lambda: {comport.device for comport in serial.tools.list_ports.comports()})
+            for port, device_name in list(self.port_wanted.items()):
+                # ports which are not in the list: e.g. /dev/serial/by-id/... links, pseudo terminals
+                if port in com_ports or (os.path.isabs(port) and os.path.exists(port)):
+                    del self.port_wanted[port]
+                    logger.debug(f"{device_name}: Serial Port '{port}' found in Serial-Port List '{sorted(com_ports)}'")
+                    self.device_found(device_name, port)
+            if self.port_wanted:
+                await asyncio.sleep(self.port_interval)
+            else:
+                self.port_requested.clear()
@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+import numpy as np
+
+
+# One LS3 log line has 20 Byte, the last byte is the '\r' control byte
+FRAME_LENGTH = 20
+FRAME_CONTROL_BYTE = 0x0D
+FRAME_CONTROL_INDEX = FRAME_LENGTH - 1
+
+# Layout of one LS3 log line (used as numpy view over the received bytes)
+FRAME_DTYPE = np.dtype([
+    ('working_mode', 'S1'),         # [0]
+    ('measured_value', 'S6'),       # [1:7]
+    ('measure_mode', 'S1'),         # [7]
+    ('reference_zero', 'S6'),       # [8:14]
+    ('electric_quantity', 'u1'),    # [14]
+    ('unit_value', 'S1'),           # [15]
+    ('speed_value', 'S1'),          # [16]
+    ('check_value', 'S2'),          # [17:19]
+    ('control', 'S1'),              # [19] '\r'
+])
+
+_FRAME_OFFSETS = np.arange(-FRAME_CONTROL_INDEX, 1, dtype=np.intp)
+_EMPTY_FRAMES = np.empty(0, dtype=FRAME_DTYPE)
+_SMALL_BUFFER_FRAMES = 32
+# below this number of frames the python conversion to columns is faster than the numpy setup (e.g. one BLE notification)
+_SCALAR_FRAMES = 8
+
+
+class FrameDecoder:
+    """
+    Decodes the LS3 live data stream in batches.
+    All received bytes are collected in a persistent bytearray. Each call of feed() decodes every complete
+    frame in one pass and leaves the incomplete rest in the buffer.
+    The resync rules are the same as the control_index logic of the former rx_data_handler:
+    - '\r' found before index 19: drop everything till the '\r'
+    - '\r' found after index 19: drop the bytes in front, so '\r' is at index 19
+    - no '\r' in 20 or more bytes: drop everything
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.frames_decoded = 0
+        self.resync_events = 0
+        self.bytes_discarded = 0
+
+    def reset(self) -> None:
+        self.buffer.clear()
+
+    def feed(self, data: bytes) -> np.ndarray:
+        """
+        Add received data to the buffer and decode all complete frames
+        :param data: received bytes
+        :return: structured array (FRAME_DTYPE) with one record per frame (could be empty)
+        """
+        # fastest path: nothing buffered and the data are complete aligned frames (e.g. one frame per BLE notification),
+        # the frames are a view of the received bytes (bytes() doesn't copy bytes, a bytearray could be reused by the caller)
+        data_len = len(data)
+        if not self.buffer and data_len and data_len % FRAME_LENGTH == 0:
+            if data_len == FRAME_LENGTH:
+                aligned = data[FRAME_CONTROL_INDEX] == FRAME_CONTROL_BYTE and data.find(b'\r', 0, FRAME_CONTROL_INDEX) < 0
+            else:
+                aligned = _aligned(data, data_len)
+            if aligned:
+                frame_count = data_len // FRAME_LENGTH
+                self.frames_decoded += frame_count
+                return np.frombuffer(bytes(data), FRAME_DTYPE, frame_count)
+
+        self.buffer += data
+        buffer_len = len(self.buffer)
+        if buffer_len < FRAME_LENGTH:
+            return _EMPTY_FRAMES
+
+        # fast path: all frames are back to back, every '\r' is at a control index
+        frame_count = buffer_len // FRAME_LENGTH
+        frames_end = frame_count * FRAME_LENGTH
+        if _aligned(self.buffer, frames_end):
+            # copy of the frames (the view of the buffer is released before the buffer is resized)
+            frames = np.frombuffer(self.buffer, dtype=FRAME_DTYPE, count=frame_count).copy()
+            del self.buffer[:frames_end]
+            self.frames_decoded += frame_count
+            return frames
+
+        if frame_count <= _SMALL_BUFFER_FRAMES:
+            frames, consumed = self._resync_small()
+        else:
+            frames, consumed = self._resync_large()
+        del self.buffer[:consumed]
+
+        # rest without '\r' is corrupt, if it is longer than a frame
+        if len(self.buffer) >= FRAME_LENGTH:
+            self._discard(len(self.buffer))
+
+        self.frames_decoded += frames.size
+        return frames
+
+    def _resync_small(self) -> tuple:
+        """
+        Resync for a few frames (a python loop is faster than the numpy setup here)
+        :return: frames, number of consumed bytes
+        """
+        frame_data = bytearray()
+        start = 0
+        while True:
+            control_index = self.buffer.find(b'\r', start)
+            if control_index == -1:
+                break
+            segment_len = control_index - start + 1
+            if segment_len != FRAME_LENGTH:
+                self.resync_events += 1
+                self.bytes_discarded += segment_len if segment_len < FRAME_LENGTH else segment_len - FRAME_LENGTH
+            if segment_len >= FRAME_LENGTH:
+                frame_data += self.buffer[control_index - FRAME_CONTROL_INDEX:control_index + 1]
+            start = control_index + 1
+        return np.frombuffer(bytes(frame_data), dtype=FRAME_DTYPE), start
+
+    def _resync_large(self) -> tuple:
+        """
+        Resync for many frames, all '\r' positions are evaluated at once
+        :return: frames, number of consumed bytes
+        """
+        raw = np.frombuffer(self.buffer, dtype=np.uint8)
+        control_index = np.flatnonzero(raw == FRAME_CONTROL_BYTE)
+        if not control_index.size:
+            return _EMPTY_FRAMES, 0
+
+        # bytes between the end of the previous frame (or buffer start) and each '\r' (inc. '\r')
+        segment_len = np.diff(control_index, prepend=-1)
+        valid = segment_len >= FRAME_LENGTH
+        self.resync_events += int(np.count_nonzero(segment_len != FRAME_LENGTH))
+        self.bytes_discarded += int(segment_len[~valid].sum() + (segment_len[valid] - FRAME_LENGTH).sum())
+        frame_end = control_index[valid]
+        frames = raw[frame_end[:, None] + _FRAME_OFFSETS].view(FRAME_DTYPE).reshape(-1)
+        return frames, int(control_index[-1]) + 1
+
+    def _discard(self, length: int) -> None:
+        self.resync_events += 1
+        self.bytes_discarded += length
+        del self.buffer[:length]
+
+
+def _aligned(data, end: int) -> bool:
+    """
+    :return: True if data[:end] are frames back to back (every '\r' is at a control index)
+    """
+    frame_count = end // FRAME_LENGTH
+    return data.count(b'\r', 0, end) == frame_count and data[FRAME_CONTROL_INDEX:end:FRAME_LENGTH].count(b'\r') == frame_count
+
+
+def frames_measured_value(frames: np.ndarray) -> np.ndarray:
+    """
+    Converts the measured_value of all frames to float
+    :param frames: structured array (FRAME_DTYPE)
+    :return: float64 array, values which can't be converted are nan
+    """
+    if frames.size == 1:
+        # numpy conversion is faster from 2 frames on
+        return np.array((_to_float(frames.tobytes()[1:7].rstrip(b'\x00')),))
+    try:
+        return frames['measured_value'].astype(np.float64)
+    except ValueError:
+        return np.array([_to_float(v) for v in frames['measured_value'].tolist()], dtype=np.float64)
+
+
+def frames_to_columns(frames: np.ndarray) -> tuple:
+    """
+    Converts all frames to python values (one list per field)
+    :param frames: structured array (FRAME_DTYPE)
+    :return: working_mode, measured_value, measure_mode, reference_zero, electric_quantity, unit_value, speed_value
+    """
+    if frames.size < _SCALAR_FRAMES:
+        raw = frames.tobytes()
+        frame_list = [raw[i:i + FRAME_LENGTH] for i in range(0, len(raw), FRAME_LENGTH)]
+        return (
+            [_to_str(f[0:1]) for f in frame_list],
+            [_to_str(f[1:7]) for f in frame_list],
+            [_to_str(f[7:8]) for f in frame_list],
+            [_to_str(f[8:14]) for f in frame_list],
+            [(f[14] - 32) * 2 for f in frame_list],
+            [_to_str(f[15:16]) for f in frame_list],
+            [_to_str(f[16:17]) for f in frame_list],
+        )
+    return (
+        frames['working_mode'].astype('U1').tolist(),
+        frames['measured_value'].astype('U6').tolist(),
+        frames['measure_mode'].astype('U1').tolist(),
+        frames['reference_zero'].astype('U6').tolist(),
+        ((frames['electric_quantity'].astype(np.int16) - 32) * 2).tolist(),
+        frames['unit_value'].astype('U1').tolist(),
+        frames['speed_value'].astype('U1').tolist(),
+    )
+
+
+def _to_str(value: bytes) -> str:
+    """ same as the numpy conversion of a 'S' field to 'U' (trailing null bytes are removed) """
+    return value.rstrip(b'\x00').decode('ascii')
+
+
+def _to_float(value: bytes) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+
+class LogReceiver:
+    """
+    Receives the answer of one ReadLog command (OnboardLogging).
+    The received bytes are split into lines as they arrive (only the incomplete last line is kept as bytes),
+    so the 'End' terminator is detected without decoding the whole log again.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.partial = bytes()
+        self.nbytes = 0
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self.done = asyncio.Event()
+
+    def feed(self, data: bytes) -> None:
+        if self.done.is_set():
+            return
+        self.nbytes += len(data)
+        lines = (self.partial + data).split(b'\r\n')
+        self.partial = lines.pop()
+        for line in lines:
+            line = line.decode('ASCII')
+            self.lines.append(line)
+            if line == 'End':
+                self.end_time = time.perf_counter()
+                self.done.set()
+                return
+
+    async def wait(self, idle_timeout: float) -> bool:
+        """
+        Wait for the 'End' line
+        :param idle_timeout: give up if no data is received for idle_timeout seconds
+        :return: True if the log is complete
+        """
+        while not self.done.is_set():
+            nbytes = self.nbytes
+            try:
+                await asyncio.wait_for(self.done.wait(), timeout=idle_timeout)
+            except asyncio.TimeoutError:
+                if self.nbytes == nbytes:
+                    return False
+        return True
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    @property
+    def byte_rate(self) -> float:
+        return self.nbytes / self.duration if self.duration else 0.0
+
+
+class LogManifest:
+    """
+    Record of the OnboardLogging logs already downloaded from one device (json file in the log folder of the device).
+    A log is identified by the MAC of the device and its header (No, Date, Time, Total), so a sync only saves new logs.
+    The manifest is written after every log, an interrupted sync (e.g. cable pulled) is resumed at the last log.
+    order is learned from the Date/Time of the first two logs:
+    - newest-first: a sync stops at the first known log
+    - oldest-first: a sync starts at the last log of the previous sync (if it's still the same log)
+    """
+
+    KEY_ROWS = ('No', 'Date', 'Time', 'Total')
+
+    def __init__(self, file: str, mac: str):
+        """
+        :param file: manifest file
+        :param mac: MAC of the device
+        """
+        self.file = file
+        self.mac = mac
+        self.logs = dict()          # key -> {'index', 'file', 'bytes', 'downloaded'}
+        self.order = None           # None (unknown) | 'newest-first' | 'oldest-first'
+        self.last_index = 0         # index (ReadLog<index>) of the last log of the last sync
+        self.complete = True        # False while a sync is running (or was interrupted)
+        if os.path.isfile(file):
+            with open(file, 'r') as infile:
+                manifest = json.load(infile)
+            if manifest.get('mac') == mac:
+                self.logs = manifest['logs']
+                self.order = manifest['order']
+                self.last_index = manifest['last_index']
+                self.complete = manifest['complete']
+
+    def log_key(self, header: dict) -> str:
+        """
+        :param header: log header (row name -> value)
+        """
+        return '|'.join([self.mac] + [str(header.get(row, '')) for row in self.KEY_ROWS])
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.logs
+
+    def start_index(self) -> int:
+        """
+        :return: first ReadLog index of the sync (if > 1, this log must be known, else the sync is started again at 1)
+        """
+        if self.last_index and (not self.complete or self.order == 'oldest-first'):
+            return self.last_index
+        return 1
+
+    def stop_at_known(self, start_index: int) -> bool:
+        """
+        :return: True if the sync could stop at the first known log
+        """
+        return start_index == 1 and self.complete and self.order == 'newest-first'
+
+    def add(self, key: str, index: int, file: str, nbytes: int) -> None:
+        self.logs[key] = {'index': index, 'file': file, 'bytes': nbytes, 'downloaded': datetime.now().isoformat(timespec='seconds')}
+
+    def progress(self, index: int) -> None:
+        """
+        Log <index> is done (saved or known)
+        """
+        self.last_index = index
+        self.complete = False
+        self.save()
+
+    def finish(self) -> None:
+        self.complete = True
+        self.save()
+
+    def save(self) -> None:
+        dir_name = os.path.dirname(self.file)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        tmp_file = f"{self.file}.tmp"
+        with open(tmp_file, 'w') as outfile:
+            json.dump({'mac': self.mac, 'order': self.order, 'last_index': self.last_index, 'complete': self.complete, 'logs': self.logs},
+                      outfile, indent=1)
+        os.replace(tmp_file, self.file)
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+import io
+import re
+import numpy as np
+import pandas as pd
+
+
+# digits are replaced for the layout signature of a header line (e.g. 'Speed=40Hz' -> 'Speed=00Hz')
+_DIGITS = str.maketrans('123456789', '000000000')
+LAYOUT_CACHE_SIZE = 256
+# the LS3 logs the values with 2 decimals
+VALUE_DECIMALS = 2
+
+
+def split_header_lines(text: str, count: int) -> tuple:
+    """
+    :param text: content of an onboard logging csv file
+    :param count: max. number of lines
+    :return: first lines (without line end, blank lines are skipped like pd.read_csv does) and the position of each line in text
+    """
+    lines = []
+    positions = []
+    pos = 0
+    while pos < len(text) and len(lines) < count:
+        end = text.find('\n', pos)
+        if end < 0:
+            end = len(text)
+        line = text[pos:end].rstrip('\r')
+        if line.strip():
+            lines.append(line)
+            positions.append(pos)
+        pos = end + 1
+    return lines, positions
+
+
+def read_data(text: str) -> np.ndarray:
+    """
+    :param text: numeric data block of an onboard logging csv file (one value per line)
+    :return: values (lines which are not a number are skipped)
+    """
+    values = pd.read_csv(io.StringIO(text), header=None, names=['value'])['value']
+    if not pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values, errors='coerce').dropna()
+    return values.to_numpy(dtype=np.float32)
+
+
+def to_float64(data: np.ndarray) -> np.ndarray:
+    """
+    :return: float32 values as float64 rounded to the decimals of the LS3 values (e.g. 2.82 and not 2.819999933242798)
+    """
+    return np.round(data.astype(np.float64), VALUE_DECIMALS)
+
+
+def scalar_to_float(value: np.float32) -> float:
+    """
+    :return: float32 value as float with its shortest decimal representation (e.g. for max and min)
+    """
+    return float(str(value))
+
+
+class LogFile:
+    """
+    Onboard logging csv file: the header record and the measured values as one contiguous float32 array
+    """
+
+    def __init__(self, file: str, header: dict, header_lines: list, data: np.ndarray):
+        """
+        :param file: onboard logging csv file
+        :param header: found index and value of each key (see HeaderParser.parse)
+        :param header_lines: lines before the data (index = row index of the header)
+        :param data: measured values
+        """
+        self.file = file
+        self.header = header
+        self.header_lines = header_lines
+        self.data = data
+
+    @property
+    def speed(self) -> int:
+        return self.header['Speed']['value']
+
+
+def read_log_file(file: str, parser: 'HeaderParser') -> LogFile:
+    """
+    :param file: onboard logging csv file
+    :param parser: HeaderParser of the row dict
+    :return: header and values of the file
+    :raises ValueError: if the header has no data_offset (no values) or neither Unit nor Trig
+    """
+    with open(file, 'r', encoding='utf-8', errors='replace') as infile:
+        text = infile.read()
+    lines, positions = split_header_lines(text, parser.line_count)
+    header = parser.parse(lines)
+    data_offset = header['data_offset']['index']
+    if data_offset is None:
+        raise ValueError(f'{file}: no data')
+    return LogFile(file, header, lines[:data_offset], read_data(text[positions[data_offset]:]))
+
+
+def _digit_invariant(regex: str) -> bool:
+    """
+    :return: True if the regex matches all digits alike (only [0-9] classes, no literal digits)
+    """
+    return not re.search('[0-9]', re.sub('0-9|\\{[0-9]+(,[0-9]*)?\\}', '', regex))
+
+
+class HeaderParser:
+    """
+    Detects the header rows of onboard logging files (row dict: PyLS3_AppCfg.yml LS3OS: Generic: OnboardLogging_row_dict).
+    The result is the same as searching every row key in its rows (min_index - max_index) one after the other,
+    but all keys are matched in one pass over the lines with a precompiled combined pattern of the keys still searched.
+    The layout of the header (which key is found in which line) depends on the LS3 firmware, it is cached by the
+    signature of the header lines (the lines with the digits replaced), a file with a known layout only extracts the values.
+    """
+
+    def __init__(self, row_dict: dict):
+        """
+        :param row_dict: key -> {'regex', 'regex_group', 'min_index', 'max_index', 'index', 'value', 'value_type'}
+        """
+        self.row_dict = row_dict
+        self.keys = tuple(row_dict)
+        self.regex = {k: re.compile(row_dict[k]['regex']) for k in self.keys}
+        self.line_count = max(row_dict[k]['max_index'] for k in self.keys) + 1
+        self.patterns = dict()      # keys -> (combined pattern, key of each alternative)
+        self.layouts = dict()       # (length, signature of the first length lines) -> key -> index
+        self.layout_lengths = []
+        self.layout_cache = all(_digit_invariant(row_dict[k]['regex']) for k in self.keys)
+        self.layout_hits = 0
+        self.layout_misses = 0
+
+    def pattern(self, keys: tuple):
+        """
+        :return: combined pattern of the keys and the key of each alternative (group name)
+        """
+        pattern = self.patterns.get(keys)
+        if pattern is None:
+            combined = re.compile('|'.join(f"(?P<k{i}>{self.row_dict[k]['regex']})" for i, k in enumerate(keys)))
+            pattern = self.patterns[keys] = (combined, {f"k{i}": k for i, k in enumerate(keys)})
+        return pattern
+
+    def scan(self, lines: list, start: int, found: dict) -> None:
+        """
+        Search the keys which are not found yet from line start on
+        :param lines: header lines
+        :param start: first line
+        :param found: key -> index, the found keys are added
+        """
+        pending = [k for k in self.keys if k not in found]
+        for index in range(start, min(len(lines), self.line_count)):
+            if not pending:
+                return
+            candidates = tuple(k for k in pending if self.row_dict[k]['min_index'] <= index <= self.row_dict[k]['max_index'])
+            # a line could contain several keys (e.g. date and time), search again without the found key
+            while candidates:
+                combined, group_key = self.pattern(candidates)
+                match = combined.search(lines[index])
+                if match is None:
+                    break
+                key = group_key[match.lastgroup]
+                found[key] = index
+                pending.remove(key)
+                candidates = tuple(k for k in candidates if k != key)
+
+    def layout(self, lines: list) -> tuple:
+        """
+        :return: cached layout (key -> index) and its length or None, 0 if the layout is unknown
+        """
+        for length in self.layout_lengths:
+            if len(lines) >= length:
+                layout = self.layouts.get((length, tuple(line.translate(_DIGITS) for line in lines[:length])))
+                if layout is not None:
+                    return layout, length
+        return None, 0
+
+    def parse(self, lines: list) -> dict:
+        """
+        :param lines: first lines of the file (see split_header_lines)
+        :return: copy of the row dict with the found index and value of each key
+        :raises ValueError: if neither Unit nor Trig is found
+        """
+        layout, length = self.layout(lines) if self.layout_cache else (None, 0)
+        if layout is not None:
+            self.layout_hits += 1
+            found = dict(layout)
+            self.scan(lines, length, found)
+        else:
+            self.layout_misses += 1
+            found = dict()
+            self.scan(lines, 0, found)
+            if self.layout_cache and found:
+                length = max(found.values()) + 1
+                if len(self.layouts) >= LAYOUT_CACHE_SIZE:
+                    self.layouts.clear()
+                    self.layout_lengths.clear()
+                self.layouts[(length, tuple(line.translate(_DIGITS) for line in lines[:length]))] = \
+                    {k: index for k, index in found.items() if index < length}
+                if length not in self.layout_lengths:
+                    self.layout_lengths.append(length)
+
+        ldict = {k: dict(v) for k, v in self.row_dict.items()}
+        for k, index in found.items():
+            value = self.regex[k].search(lines[index]).group(ldict[k]['regex_group'])
+            ldict[k]['index'] = index
+            ldict[k]['value'] = ldict[k]['value_type'](value)
+
+        # try to get Unit from Trigger file in old format
+        if 'Unit' in ldict and not ldict['Unit']['value']:
+            if ldict['Trig']['index'] is None:
+                raise ValueError('Unit and Trig not found')
+            ldict['Unit']['value'] = self.regex['Trig'].search(lines[ldict['Trig']['index']]).group(2)
+
+        # Default for device if not found
+        if 'Device' in ldict and not ldict['Device']['value']:
+            ldict['Device']['value'] = 'LS3'
+        return ldict
@@ -1,49 +1,20 @@
 #!/usr/bin/python3
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 import os
 import asyncio
-import re
 import argparse
 import glob
 from datetime import datetime, timedelta
 import warnings
-import copy
+from PyLS3_capturefile import CaptureFile, is_capture_file
+from PyLS3_logfile import HeaderParser, read_log_file, to_float64
+from PyLS3_overlap import find_overlap
 # import platform
 
 
-def autodetect_onboardlogging_headers(df: pd.DataFrame, odict):
-    """
-    This function searches for all available header values and indexes in the onboard logging files
-    :param df: Dataframe we are working
-    :param odict: original dictionary header information we are searching
-    :return ldict: dictionary with all found header values and indexes
-    """
-    ldict = copy.deepcopy(odict)
-    # check row_regex_dict
-    for k in ldict:
-        # index = None
-        index = df.loc[ldict[k]['min_index']:ldict[k]['max_index'], 'measured_value'][
-            df.loc[ldict[k]['min_index']:ldict[k]['max_index'], 'measured_value'].str.contains(ldict[k]['regex'], regex=True)].first_valid_index()
-        if index is not None:
-            value = re.search(ldict[k]['regex'], df.loc[index, 'measured_value']).group(ldict[k]['regex_group'])
-            value = ldict[k]['value_type'](value)
-            ldict[k]['index'] = index
-            ldict[k]['value'] = value
-            # print(k, index, value)
-
-    # try to get Unit from Trigger file in old format
-    if not ldict['Unit']['value']:
-        value = re.search(ldict['Trig']['regex'], df.loc[ldict['Trig']['index'], 'measured_value']).group(2)
-        ldict['Unit']['value'] = value
-
-    # Default for device if not found
-    if not ldict['Device']['value']:
-        ldict['Device']['value'] = 'LS3'
-    return ldict
-
-
 # def autodetect_pyls3_headers(df: pd.DataFrame, header_list: list):
 #     d = dict()
 #     # Add all Values from the first column to a dictionary
@@ -72,25 +43,6 @@ def create_filename_list(inlist):
     return outlist
 
 
-def find_overlap(last: list, current: list):
-    """
-    Compares the beginning of current and the end of last. When these are the same, returns the index till where current has the same values as last at the end.
-    If no overlapping data is found 0 is returned.
-    :param last: last list with data values
-    :param current: current list with data values
-    :return: the index for the overlapping data. current[overlap_index] will have the same value as last[-1] () same for df.loc[overlap_index:,]
-    """
-    min_list_len = min(len(last), len(current))
-    overlap_index = 0
-    for i in range(min_list_len, 0, -1):
-        last_index = len(last) - i
-        # print(f"{i} {current[0:i]} - {last[last_index:-1]}")
-        if current[0:i] == last[last_index:]:
-            overlap_index = i - 1
-            break
-    return overlap_index
-
-
 def generate_same_length_list(in_value, reference_list):
     """
     generates a list of same length as reference_list
@@ -174,7 +126,7 @@ async def main():
         description='PyLS3 Plot - create Plots of multiple csv files',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
         epilog="Have fun ;)")
-    parser.add_argument('-fp', '--filename_pyls3', default=None, action='append', help='pyls3 CSV File-Name (could be applied multiple times)')
+    parser.add_argument('-fp', '--filename_pyls3', default=None, action='append', help='pyls3 CSV or binary capture (.ls3cap) File-Name (could be applied multiple times)')
     parser.add_argument('-fo', '--filename_onboardlogging', default=None, action='append', help='onboardlogging CSV File-Name (could be applied multiple times)')
     parser.add_argument('-hl', '--header_list',
                         default=['device_name', 'present_time', 'rx_timestamp', 'rx_delays', 'measured_value', 'unit_value_parsed', 'reference_zero', 'measure_mode_parsed', 'speed_value_parsed', 'electric_quantity', 'working_mode_parsed'],
@@ -203,7 +155,8 @@ async def main():
                              '"1.5, 2.3 -1.3" the time is added or delete from the timestamp')
     parser.add_argument('-noa', '--not-autocorrect-offset', default=True, action="store_false", dest='autocorrect_offset', help='Disable auto correcetion of time an offset for onboardlogging (dest=autocorrect_offset)')
     parser.add_argument('-ot', '--overlap_tolerance', default=15, type=int, help='Max tolerance to detect overlapping measurements (Data is still compared)')
-    parser.add_argument('-pst', '--pyls3_smooth_timestamps', default=False, action="store_true", help='Smooth timestamps in pyls3. All timestamps will have the same difference. Do not use if different speeds are used, or data is partially interrupted.')
+    parser.add_argument('-ovt', '--overlap_value_tolerance', default=0.0, type=float, help='Compare the overlapping data rounded to multiples of this value (0: exact)')
+    parser.add_argument('-pst', '--pyls3_smooth_timestamps', default=False, action="store_true", help='Smooth timestamps in pyls3. All timestamps will have the same difference. Do not use if different speeds are used, or data is partially interrupted. (Not needed for newer captures, they have the reconstructed time of each frame)')
 
     parser.add_argument('-nc', '--no_color', default=False, action="store_true", help='Logging without color (e.g. for windows cmd)')
     parser.add_argument('-ca', '--appcfg', default='PyLS3_AppCfg.yml', help='PyLS3 App configuration File')
@@ -243,6 +196,7 @@ async def main():
 
     # Todo: replace row_dict / row_dict2 ...
     row_dict = PyLS3_Conf['LS3OS']['Generic']['OnboardLogging_row_dict'].copy()
+    header_parser = HeaderParser(row_dict)
 
     if not args.filename_pyls3 and not args.filename_onboardlogging:
         print(f"Error at least --filename_pyls3 or --filename_onboardlogging must be set. Use -h option to display help")
@@ -259,7 +213,8 @@ async def main():
     df = dict()
     date_obj = dict()
     date_list = list()
-    data_offset = dict()
+    seconds = dict()                                                                # x values of each file
+    values = dict()                                                                 # y values of each file
     time_shift = dict()
     header_dict = dict()
     color_dict = dict()
@@ -282,7 +237,14 @@ async def main():
     for f in filename_pyls3_list[:]:
         try:
             file_error = False
-            df[f] = pd.read_csv(f, names=args.header_list)
+            if is_capture_file(f):
+                # binary capture file, the file is memory mapped
+                capture = CaptureFile(f)
+                df[f] = capture.to_dataframe()
+                pyls3_start_time = capture.start_time
+            else:
+                df[f] = pd.read_csv(f, names=args.header_list)
+                pyls3_start_time = datetime.strptime(df[f].loc[0, 'present_time'], ' %Y-%m-%d %H:%M:%S.%f')
             speed_ok = df[f].loc[0, 'speed_value_parsed'].strip() in ['10Hz', '40Hz', '640Hz', '1280Hz']
         # except (pd.errors.UnsortedIndexError, AttributeError):
         except Exception:
@@ -293,7 +255,7 @@ async def main():
             filename_pyls3_list.remove(f)
             filename_list.remove(f)
             continue
-        date_obj[f] = datetime.strptime(df[f].loc[0, 'present_time'], ' %Y-%m-%d %H:%M:%S.%f') + timedelta(seconds=time_shift[f])
+        date_obj[f] = pyls3_start_time + timedelta(seconds=time_shift[f])
         date_list.append(date_obj[f].timestamp())
 
     # onboardlogging csv files
@@ -304,15 +266,16 @@ async def main():
                 print(f"WARNING> File:'{f}' already opened and will be skipped.")
                 filename_onboardlogging_list.remove(f)
                 continue
-            df[f] = pd.read_csv(f, names=['measured_value'])
-            header_dict[f] = autodetect_onboardlogging_headers(df[f], row_dict)
+            logfile = read_log_file(f, header_parser)
+            header_dict[f] = logfile.header
+            values[f] = to_float64(logfile.data)
         # except pd.errors.UnsortedIndexError:
         except Exception:
             file_error = True
         # check if cvs file has the correct format
         if file_error or not header_dict[f]['Speed']['value']:
             print(f"WARNING> File:'{f}' has wrong format and will be skipped.")
-            del df[f]
+            values.pop(f, None)
             filename_onboardlogging_list.remove(f)
             filename_list.remove(f)
             continue
@@ -336,7 +299,6 @@ async def main():
 
     #
     for f in filename_pyls3_list:
-        data_offset[f] = 0                                                          # Not used for pyls3 csv files
         overlap_offset[f] = 0                                                       # Not used for pyls3 csv files
         # Create adjusted seconds column
         second_value = (date_obj[f].timestamp() - date_min)                          # calculate start offset
@@ -374,12 +336,13 @@ async def main():
                 # use rx_timestamp                                                                      # rx_timestamps
                 second_value = round(df[f].loc[i, 'rx_timestamp'] - date_min + time_shift[f], 8)        # rx_timestamps
 
+        seconds[f] = df[f]['Seconds'].to_numpy(dtype=np.float64)
+        values[f] = df[f]['measured_value'].to_numpy(dtype=np.float64)
         print(f"Start:{start_timestamp} End:{end_timestamp} Dur:({end_timestamp - start_timestamp}) - (values include time_shift:{time_shift[f]}) - file:{f}")
 
     # prepare filename_onboardlogging_list
     last_end_time = 0
     for f in filename_onboardlogging_list:
-        data_offset[f] = header_dict[f]['data_offset']['index']
         # Converting Units
         if args.plot_force_unit == 'as_first_file':
             args.plot_force_unit = header_dict[f]['Unit']['value']
@@ -389,19 +352,19 @@ async def main():
         else:
             unit_convert_factor = get_unit_convert_factor(header_dict[f]['Unit']['value'], args.plot_force_unit)
             if unit_convert_factor != 1:
-                df[f].loc[data_offset[f]:, 'measured_value'] = round(df[f].loc[data_offset[f]:, 'measured_value'].astype('float') * unit_convert_factor, 2)
+                values[f] = np.round(values[f] * unit_convert_factor, 2)
 
         # check if is this measurement overlapping
         real_start_time = date_obj[f].timestamp() - header_dict[f]['Pre']['value']
         end_time = date_obj[f].timestamp() + header_dict[f]['Catch']['value']
-        onboardlogging_current_list = list(df[f].loc[data_offset[f]:, 'measured_value'])
+        onboardlogging_current_list = values[f]
         overlap_index = 0
         info_msg = "INFO   : time overlap outside tolerance & no data overlap "
         # if args.autocorrect_offset and real_start_time - args.overlap_tolerance <= last_end_time:
         if args.autocorrect_offset and -args.overlap_tolerance <= real_start_time - last_end_time <= args.overlap_tolerance:
             # for finding overlapping data
-            if onboardlogging_last_list:
-                overlap_index = find_overlap(onboardlogging_last_list, onboardlogging_current_list)
+            if onboardlogging_last_list is not None:
+                overlap_index = find_overlap(onboardlogging_last_list, onboardlogging_current_list, args.overlap_value_tolerance)
                 if overlap_index:
                     info_msg = "INFO   : time overlap in tolerance & data overlap found   "
                 else:
@@ -416,8 +379,6 @@ async def main():
         onboardlogging_last_list = onboardlogging_current_list
         overlap_offset[f] = overlap_index
 
-        # Create adjusted seconds column
-        df[f].reset_index(inplace=True)
         # timing_correction_factor for LS3
         try:
             args.timing_correction_factor = float(args.timing_correction_factor)
@@ -435,10 +396,11 @@ async def main():
                 timingcorrectionfactor = 0.9
         # print('DEBUG> timingcorrectionfactor', timingcorrectionfactor)  # Todo to remove, only for debugging
 
-        df[f]['index'] = (df[f]['index'] - data_offset[f] - overlap_offset[f]) / header_dict[f]['Speed']['value'] / timingcorrectionfactor + second_value    # -i Data Offset in csv
-        # without timingcorrectionfactor # df[f]['index'] = (df[f]['index'] - data_offset[f] - overlap_offset[f]) / header_dict[f]['Speed']['value'] + second_value    # -i Data Offset in csv
-        df[f].rename({'index': 'Seconds'}, axis=1, inplace=True)
-        last_second_value = df[f].loc[df[f].index[-1], 'Seconds']
+        # Create adjusted seconds (the overlapping values are not plotted again)
+        values[f] = values[f][overlap_offset[f]:]
+        seconds[f] = np.arange(values[f].size) / header_dict[f]['Speed']['value'] / timingcorrectionfactor + second_value
+        # without timingcorrectionfactor # seconds[f] = np.arange(values[f].size) / header_dict[f]['Speed']['value'] + second_value
+        last_second_value = seconds[f][-1] if seconds[f].size else second_value
 
         print(f"{info_msg} - overlap_offset:{overlap_offset[f]} - Start:{second_value} End:{last_second_value} Dur:({last_second_value - second_value}) - real_start_time:{real_start_time} end_time:{end_time} - file:{f}")
         last_end_time = end_time
@@ -451,18 +413,22 @@ async def main():
     for i, f in enumerate(filename_list):
         # plot df (with color support)
         if color_dict[f] in (list(mcolors.BASE_COLORS.keys()) + list(mcolors.TABLEAU_COLORS.keys()) + list(mcolors.CSS4_COLORS.keys())):
-            line_list += ax1.plot(df[f].loc[data_offset[f] + overlap_offset[f]:, 'Seconds'], df[f].loc[data_offset[f] + overlap_offset[f]:, 'measured_value'].astype('float'), label=f, color=color_dict[f])
+            line_list += ax1.plot(seconds[f], values[f], label=f, color=color_dict[f])
         else:
-            line_list += ax1.plot(df[f].loc[data_offset[f] + overlap_offset[f]:, 'Seconds'], df[f].loc[data_offset[f] + overlap_offset[f]:, 'measured_value'].astype('float'), label=f)
+            line_list += ax1.plot(seconds[f], values[f], label=f)
+        if not values[f].size:
+            continue
 
         # Plot min and max point
-        min_measured_value = df[f].loc[data_offset[f] + overlap_offset[f]:, 'measured_value'].astype('float').min()
+        min_position = int(np.argmin(values[f]))
+        max_position = int(np.argmax(values[f]))
+        min_measured_value = values[f][min_position]
         min_list.append(min_measured_value)
-        min_index = df[f].loc[data_offset[f] + overlap_offset[f]:, 'Seconds'][df[f].loc[data_offset[f] + overlap_offset[f]:, 'measured_value'].astype('float').idxmin()]
+        min_index = seconds[f][min_position]
         min_index_list.append(min_index)
-        max_measured_value = df[f].loc[data_offset[f] + overlap_offset[f]:, 'measured_value'].astype('float').max()
+        max_measured_value = values[f][max_position]
         max_list.append(max_measured_value)
-        max_index = df[f].loc[data_offset[f] + overlap_offset[f]:, 'Seconds'][df[f].loc[data_offset[f] + overlap_offset[f]:, 'measured_value'].astype('float').idxmax()]
+        max_index = seconds[f][max_position]
         max_index_list.append(max_index)
         # Print min max for each file
         if not args.plot_minmax_total_only:
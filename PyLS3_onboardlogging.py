@@ -1,63 +1,140 @@
 #!/usr/bin/python
 import argparse
+import hashlib
+import json
+import numpy as np
 import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
 import os
 import re
+import time
+import traceback
 import warnings
-import copy
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-
-
-def autodetect_onboardlogging_headers2(df: pd.DataFrame, column, odict):
-    """
-    This function searches for all available header values and indexes in the onboard logging files
-    :param column:
-    :param df: Dataframe we are working
-    :param odict: original dictionary header information we are searching
-    :return ldict: dictionary with all found header values and indexes
-    """
-    ldict = copy.deepcopy(odict)
-    # check row_regex_dict
-    for k in ldict:
-        # index = None
-        index = df.loc[ldict[k]['min_index']:ldict[k]['max_index'], column][
-            df.loc[ldict[k]['min_index']:ldict[k]['max_index'], column].str.contains(ldict[k]['regex'], regex=True)].first_valid_index()
-        # print(k, index)
-        if index is not None:
-            value = re.search(ldict[k]['regex'], df.loc[index, column]).group(ldict[k]['regex_group'])
-            value = ldict[k]['value_type'](value)
-            ldict[k]['index'] = index
-            ldict[k]['value'] = value
-
-    # try to get Unit from Trigger file in old format
-    if not ldict['Unit']['value']:
-        value = re.search(ldict['Trig']['regex'], df.loc[ldict['Trig']['index'], column]).group(2)
-        ldict['Unit']['value'] = value
-
-    # Default for device if not found
-    if not ldict['Device']['value']:
-        ldict['Device']['value'] = 'LS3'
-    return ldict
-
-
-def find_overlap(last: list, current: list):
-    """
-    Compares the beginning of current and the end of last. When these are the same, returns the index till where current has the same values as last at the end.
-    If no overlapping data is found 0 is returned.
-    :param last: last list with data values
-    :param current: current list with data values
-    :return: the index for the overlapping data. current[overlap_index] will have the same value as last[-1] () same for df.loc[overlap_index:,]
-    """
-    min_list_len = min(len(last), len(current))
-    overlap_index = 0
-    for i in range(min_list_len, 0, -1):
-        last_index = len(last) - i
-        # print(f"{i} {current[0:i]} - {last[last_index:-1]}")
-        if current[0:i] == last[last_index:]:
-            overlap_index = i - 1
-            break
-    return overlap_index
+from PyLS3_logfile import HeaderParser, LogFile, read_log_file, scalar_to_float, to_float64
+from PyLS3_overlap import find_overlap
+
+EXT = [".csv"]  # searching only for csv Files (could be changed later)
+EXCEL_MASTERFILE = 'master.xlsx'
+INDEX_FILE = 'master_index.json'  # processed files of the folder (see FolderIndex)
+SPEED_SHEETS = {10: '10Hz Measurements', 40: '40Hz Measurements', 640: '640Hz Measurements', 1280: '1280Hz Measurements'}
+HEADER_PREFIXES = re.compile('Speed=|Trig=|Stop=|Pre=|Catch=|Total=|Hz')   # removed from the header rows in the master excel file
+
+# header information searched in the onboard logging files (see PyLS3_logfile.HeaderParser)
+ROW_DICT = {
+    'Device': {
+        'regex': '(^[A-Z0-9]{2}:[A-Z0-9]{2}:[A-Z0-9]{2}$)',
+        'regex_group': 1,
+        'min_index': 0,
+        'max_index': 0,
+        'index': None,
+        'value': None,
+        'value_type': str,
+    },
+    'No': {
+        'regex': '^(LogNo=)?(No\\.)?([0-9]+)$',
+        'regex_group': 3,
+        'min_index': 0,
+        'max_index': 4,
+        'index': None,
+        'value': None,
+        'value_type': int,
+    },
+    'Date': {
+        'regex': '([0-9]{2}\\.[0-9]{2}\\.[0-9]{2})',
+        'regex_group': 1,
+        'min_index': 1,
+        'max_index': 25,
+        'index': None,
+        'value': None,
+        'value_type': str,
+    },
+    'Time': {
+        'regex': '([0-9]{2}:[0-9]{2}:[0-9]{2})',
+        'regex_group': 1,
+        'min_index': 1,
+        'max_index': 25,
+        'index': None,
+        'value': None,
+        'value_type': str,
+    },
+    'Unit': {
+        'regex': 'Unit=([a-zA-Z]+)',
+        'regex_group': 1,
+        'min_index': 1,
+        'max_index': 25,
+        'index': None,
+        'value': None,
+        'value_type': str,
+    },
+    'Speed': {
+        'regex': 'Speed=([0-9]+)',
+        'regex_group': 1,
+        'min_index': 1,
+        'max_index': 25,
+        'index': None,
+        'value': None,
+        'value_type': int,
+    },
+    'Trig': {
+        'regex': 'Trig=([0-9\\.]+)([a-zA-Z]*)',
+        'regex_group': 1,
+        'min_index': 1,
+        'max_index': 25,
+        'index': None,
+        'value': None,
+        'value_type': float,
+    },
+    'Stop': {
+        'regex': 'Stop=([0-9\\.]+)',
+        'regex_group': 1,
+        'min_index': 1,
+        'max_index': 25,
+        'index': None,
+        'value': None,
+        'value_type': float,
+    },
+    'Pre': {
+        'regex': 'Pre=([0-9\\.]+)',
+        'regex_group': 1,
+        'min_index': 1,
+        'max_index': 25,
+        'index': None,
+        'value': None,
+        'value_type': int,
+    },
+    'Catch': {
+        'regex': 'Catch=([0-9\\.]+)',
+        'regex_group': 1,
+        'min_index': 1,
+        'max_index': 25,
+        'index': None,
+        'value': None,
+        'value_type': int,
+    },
+    'Total': {
+        'regex': 'Total=([0-9\\.]+)',
+        'regex_group': 1,
+        'min_index': 1,
+        'max_index': 25,
+        'index': None,
+        'value': None,
+        'value_type': int,
+    },
+    'data_offset': {
+        'regex': '^((-)?[0-9]+(\\.[0-9]+)?)$',
+        'regex_group': 1,
+        'min_index': 5,
+        'max_index': 25,
+        'index': None,
+        'value': None,
+        'value_type': float,
+    },
+}
+
+HEADER_PARSER = HeaderParser(ROW_DICT)
 
 
 def time_to_sec(time_str):
@@ -79,96 +156,107 @@ def get_subfolders(dir: str) -> list:
     return subfolders
 
 
-def max_min_reading(df: pd.DataFrame, data_offset: int = 8):
+class Measurement:
     """
-    Insert max and min Reading to df
-    :param df: source dataframe
-    :param data_offset: offset where the measurement values start
-    :return: df_final returning dataframe
+    One column of the master excel file: an onboard logging file or the combined files of a continues logging
     """
-    # Raise error if starting_row is not an integer 
-    if (not isinstance(data_offset, int)):
-        raise ValueError('`starting_row` must be an integer')
-
-    maxmin = []
-    for i in df.columns:
-        max_reading = df.loc[data_offset:, i].dropna().max()
-        min_reading = df.loc[data_offset:, i].dropna().min()
-        maxmin.append((max_reading, min_reading))
-
-    df_maxmin = pd.DataFrame(maxmin, index=df.columns, columns=['Max', 'Min']).T
-
-    df_final = pd.concat([df_maxmin, df], )
 
-    return df_final
-
-
-def index_to_sec(df: pd.DataFrame, speed: int = 10, data_offset: int = 10):
+    def __init__(self, logfile: LogFile):
+        self.name = os.path.basename(logfile.file)
+        self.header = logfile.header
+        self.header_lines = [HEADER_PREFIXES.sub('', line) for line in logfile.header_lines]
+        self.data = logfile.data
+        self.speed = logfile.speed
+        self.total = float(logfile.header['Total']['value'])
+        self.catch = float(logfile.header['Catch']['value'])
+
+    def append(self, logfile: LogFile, overlap_index: int, start_overlap: float) -> None:
+        """
+        Combine the next file of a continues logging
+        :param logfile: next file
+        :param overlap_index: logfile.data[overlap_index] is the last value of this measurement (see find_overlap)
+        :param start_overlap: seconds the logfile starts before the end of this measurement
+        """
+        self.name = f'{self.name} + {os.path.basename(logfile.file)}'
+        self.data = np.concatenate([self.data, logfile.data[overlap_index + 1:]])
+        self.total = self.total + logfile.header['Total']['value'] - start_overlap
+        self.catch = self.catch + logfile.header['Catch']['value']
+        index_no = self.header['No']['index']
+        self.header_lines[index_no] = f"{self.header_lines[index_no]} + {HEADER_PREFIXES.sub('', logfile.header_lines[logfile.header['No']['index']])}"
+        self.header_lines[self.header['Total']['index']] = f'{self.total}sec'
+        self.header_lines[self.header['Catch']['index']] = f'{self.catch}sec'
+
+
+def measurement_frame(measurements: list, speed: int, row_dict: dict) -> pd.DataFrame:
     """
-    Take in dataframe and starting row to produce a maximum and minimum value for the readings
-    :param df: Dataframe we are working with
+    Sheet of the master excel file
+    :param measurements: measurements of the speed
     :param speed: speed in Hz
-    :param data_offset: offset to the first data value
-    :return: df_sec
+    :param row_dict: header row index -> row name
+    :return: column Seconds (Max, Min, row names, seconds of the values) and one column per measurement
     """
-    df_sec = df.copy()
-    df_sec.reset_index(inplace=True)
-    # Exception if data_offset index is not available
-    try:
-        df_sec.loc[data_offset:, 'index'] = (df_sec.loc[data_offset:, 'index'] - df_sec.loc[data_offset, 'index']) / speed
-    except KeyError:
-        pass
-    df_sec.rename({'index': 'Seconds'}, axis=1, inplace=True)
-    return df_sec
+    if not measurements:
+        return pd.DataFrame({'Seconds': []})
+    header_count = max(len(m.header_lines) for m in measurements)
+    value_count = max(m.data.size for m in measurements)
+    data_offset = 2 + header_count
+    seconds = np.empty(data_offset + value_count, dtype=object)
+    seconds[:data_offset] = ['Max', 'Min'] + [row_dict.get(i, i) for i in range(header_count)]
+    seconds[data_offset:] = np.arange(value_count) / speed
+    columns = {'Seconds': seconds}
+    for m in measurements:
+        column = np.full(data_offset + value_count, np.nan, dtype=object)
+        if m.data.size:
+            column[:2] = [scalar_to_float(m.data.max()), scalar_to_float(m.data.min())]
+        column[2:2 + len(m.header_lines)] = m.header_lines
+        column[data_offset:data_offset + m.data.size] = to_float64(m.data)
+        columns[m.name] = column
+    return pd.DataFrame(columns)
+
+
+def plot_filename(col) -> str:
+    """
+    :param col: column of the measurement (csv file name, combined measurements: 'file1 + file2')
+    :return: file name of the plot png image
+    """
+    filename = re.sub("(\\.CSV)|(\\.csv)", "", col)
+    filename = re.sub(" \\+ ", "_", filename)
+    return f"{filename}_oplot.png"
 
 
-def plot_df(df: pd.DataFrame, col, directory: str, data_offset: int = 10, show_plot: bool = False, no_image: bool = False):
+def plot_measurement(measurement: Measurement, directory: str, show_plot: bool = False, no_image: bool = False):
     """
-    Take in dataframe and column to produce graph of section
-    :param df: Source dataframe
-    :param col: current column in dataframe
-    :param directory: directory of the source cvs file of the df
-    :param data_offset: offset to the first data value
+    Produce the graph of a measurement
+    :param measurement: measurement (column of the master excel file)
+    :param directory: directory of the source cvs file of the measurement
     :param show_plot: if true the plot-window will be show
     :param no_image: if set the plot will not be saved as png
     :return:
     """
-    index_max = df[df['Seconds'].astype(str).str.contains('Max', regex=False)].first_valid_index()
-    index_min = df[df['Seconds'].astype(str).str.contains('Min', regex=False)].first_valid_index()
-    index_date = df[df['Seconds'].astype(str).str.contains('Date', regex=False)].first_valid_index()
-    index_time = df[df['Seconds'].astype(str).str.contains('Time', regex=False)].first_valid_index()
-    index_speed = df[df['Seconds'].astype(str).str.contains('Speed', regex=False)].first_valid_index()
-    index_trig = df[df['Seconds'].astype(str).str.contains('Trig', regex=False)].first_valid_index()
-
-    # index_mode = df[df['Seconds'].astype(str).str.contains('Mode', regex=False)].first_valid_index()
-    # if index_mode:
-    #     mode = re.match('Mode=([a-zA-Z]+)', df[col][index_mode]).group(1)
-
-    index_unit = df[df['Seconds'].astype(str).str.contains('Unit', regex=False)].first_valid_index()
-    if index_unit:
-        unit = re.match('Unit=([a-zA-Z]+)', df[col][index_unit]).group(1)
-    else:
-        unit = re.match('.*[0-9.]+([A-Za-z]+)', df[col][index_trig]).group(1)
-
+    data = measurement.data
+    if not data.size:
+        return ""
+    seconds = np.arange(data.size) / measurement.speed
+    header = measurement.header
+    unit = header['Unit']['value']
     device_name = 'LS3'
 
-    # min_value = df.loc[data_offset:, col].astype('float').min()
-    # max_value = df.loc[data_offset:, col].astype('float').max()
-
     # Plot values vs time
     fig = plt.figure(figsize=[20, 10])
     #fig = plt.figure(figsize=[19.2, 10.8])
     # fig = plt.figure(figsize=[16, 12])
     ax1 = fig.add_subplot(1, 1, 1)
-    ax1.plot(df.loc[data_offset:, 'Seconds'], df.loc[data_offset:, col].astype('float'))
+    ax1.plot(seconds, data)
 
     # Plot min and max point
-    ax1.plot(df.loc[data_offset:, 'Seconds'][df.loc[data_offset:, col].astype('float').idxmin()], df.loc[data_offset:, col].astype('float').min(), marker=(5, 2), color='y')
-    ax1.plot(df.loc[data_offset:, 'Seconds'][df.loc[data_offset:, col].astype('float').idxmax()], df.loc[data_offset:, col].astype('float').max(), marker=(5, 2), color='r')
+    index_min = data.argmin()
+    index_max = data.argmax()
+    ax1.plot(seconds[index_min], data[index_min], marker=(5, 2), color='y')
+    ax1.plot(seconds[index_max], data[index_max], marker=(5, 2), color='r')
 
     # Set Title
     ax1.set_title(
-        f"{df[col][index_date]} {df[col][index_time]} {device_name} Max:{df[col][index_max]} Min:{df[col][index_min]} Unit:{unit} Speed:{df[col][index_speed]}Hz",
+        f"{header['Date']['value']} {header['Time']['value']} {device_name} Max:{data[index_max]} Min:{data[index_min]} Unit:{unit} Speed:{measurement.speed}Hz",
         fontweight="bold", fontsize=17)
 
     # Set Axis
@@ -183,9 +271,7 @@ def plot_df(df: pd.DataFrame, col, directory: str, data_offset: int = 10, show_p
     plt.grid(False)
 
     if not no_image:
-        filename = re.sub("(\\.CSV)|(\\.csv)", "", col)
-        filename = re.sub(" \\+ ", "_", filename)
-        filename = f"{filename}_oplot.png"
+        filename = plot_filename(measurement.name)
         # if os.path.isfile(f'{directory}/{filename}'):
         #     os.remove(f'{directory}/{filename}')
         # on windows the timestamps of the pngs are not updated, but the files are overwritten
@@ -194,9 +280,381 @@ def plot_df(df: pd.DataFrame, col, directory: str, data_offset: int = 10, show_p
         # plt.show()
         # plt.draw()
         plt.show(block=False)
+    else:
+        # many folders are processed by one (worker) process
+        plt.close(fig)
     return ""
 
 
+def folder_csv_files(folder: str, debug: bool = False) -> list:
+    """
+    :param folder: folder with the onboard logging csv files
+    :param debug: debug output
+    :return: sorted csv files of the folder (the order of the files is the order of the columns and of the combine)
+    """
+    cvsfiles = []
+    for f in os.scandir(folder):
+        # only add csv files to cvsfiles list
+        if f.is_file():
+            if os.path.splitext(f.name)[1].lower() in EXT:
+                if debug: print(f'DEBUG> {f.path}')
+                cvsfiles.append(f.path)
+    return sorted(cvsfiles)
+
+
+def read_onboardlogging_file(cvsfile: str, debug: bool = False):
+    """
+    Read one onboard logging csv file: header and values (independent of the other files of the folder)
+    :param cvsfile: onboard logging csv file
+    :param debug: debug output
+    :return: LogFile or None if the file is empty or has a wrong format
+    """
+    if debug: print(f'DEBUG> {cvsfile}')
+    try:
+        logfile = read_log_file(cvsfile, HEADER_PARSER)
+    # except pandas.errors.EmptyDataError:
+    except Exception as e:
+        if debug: print(f'DEBUG> {os.path.basename(cvsfile)} is empty and has been skipped. Error: {e}')
+        return None
+
+    # Skipp if speed line is not found
+    if not logfile.speed:
+        if debug: print(f'DEBUG> {cvsfile} has wrong format and has been skipped.')
+        return None
+    return logfile
+
+
+class FolderIndex:
+    """
+    Record of the onboard logging files already processed in one folder (json file next to the master excel file).
+    A file is known by its name, size and mtime, the content hash is only calculated if size or mtime have changed
+    (e.g. a copied archive). For every file the detected headers and the min and max value are recorded.
+    A rerun only reads the new and changed files and the files with the same speed (the sheet of the speed is rewritten)
+    and only plots the measurements which contain a new or changed file.
+    """
+
+    VERSION = 1
+
+    def __init__(self, folder: str):
+        """
+        :param folder: folder with the onboard logging csv files
+        """
+        self.file = os.path.join(folder, INDEX_FILE)
+        self.files = dict()         # file name -> {'size', 'mtime_ns', 'sha1', 'speed', 'headers', 'data_offset', 'max', 'min', 'processed'}
+        self.exists = False
+        self.modified = False
+        if os.path.isfile(self.file):
+            try:
+                with open(self.file, 'r') as infile:
+                    index = json.load(infile)
+                if index.get('version') == self.VERSION:
+                    self.files = index['files']
+                    self.exists = True
+            except (OSError, ValueError):
+                pass
+
+    @staticmethod
+    def file_hash(cvsfile: str) -> str:
+        with open(cvsfile, 'rb') as infile:
+            return hashlib.sha1(infile.read()).hexdigest()
+
+    def changed(self, cvsfile: str) -> bool:
+        """
+        :return: True if the file is new or its content has changed
+        """
+        entry = self.files.get(os.path.basename(cvsfile))
+        if entry is None:
+            return True
+        stat = os.stat(cvsfile)
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return False
+        if entry['size'] == stat.st_size and entry['sha1'] == self.file_hash(cvsfile):
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self.modified = True
+            return False
+        return True
+
+    def speed(self, cvsfile: str):
+        """
+        :return: speed of the file (None: unknown file or wrong format)
+        """
+        entry = self.files.get(os.path.basename(cvsfile))
+        return entry['speed'] if entry else None
+
+    def add(self, cvsfile: str, logfile) -> None:
+        """
+        :param cvsfile: onboard logging csv file
+        :param logfile: result of read_onboardlogging_file
+        """
+        stat = os.stat(cvsfile)
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': self.file_hash(cvsfile), 'speed': None, 'headers': None,
+                 'data_offset': None, 'max': None, 'min': None, 'processed': datetime.now().isoformat(timespec='seconds')}
+        if logfile is not None:
+            data = logfile.data
+            entry.update(speed=logfile.speed, headers={k: v['value'] for k, v in logfile.header.items() if k != 'data_offset'},
+                         data_offset=logfile.header['data_offset']['index'],
+                         max=scalar_to_float(data.max()) if data.size else None, min=scalar_to_float(data.min()) if data.size else None)
+        self.files[os.path.basename(cvsfile)] = entry
+        self.modified = True
+
+    def remove(self, name: str) -> None:
+        del self.files[name]
+        self.modified = True
+
+    def save(self) -> None:
+        tmp_file = f"{self.file}.tmp"
+        with open(tmp_file, 'w') as outfile:
+            json.dump({'version': self.VERSION, 'files': self.files}, outfile, indent=1)
+        os.replace(tmp_file, self.file)
+        self.modified = False
+
+
+def master_columns(masterfile: str) -> set:
+    """
+    :return: csv file names in the columns of the master excel file
+    """
+    columns = set()
+    for sheet in pd.read_excel(masterfile, sheet_name=None, nrows=0).values():
+        for column in sheet.columns:
+            columns.update(str(column).split(' + '))
+    return columns
+
+
+def read_onboardlogging_files(cvsfiles: list, args: argparse.Namespace) -> dict:
+    """
+    :return: cvsfile -> result of read_onboardlogging_file (read in args.file_workers threads)
+    """
+    if args.file_workers > 1 and len(cvsfiles) > 1:
+        with ThreadPoolExecutor(max_workers=args.file_workers) as executor:
+            return dict(zip(cvsfiles, executor.map(read_onboardlogging_file, cvsfiles, [args.debug] * len(cvsfiles))))
+    return {cvsfile: read_onboardlogging_file(cvsfile, args.debug) for cvsfile in cvsfiles}
+
+
+def process_folder(folder: str, args: argparse.Namespace) -> dict:
+    """
+    Create the plots and the master excel file of one folder (only for the new or changed files, see FolderIndex).
+    The files are read in parallel if args.file_workers > 1, the combine (depends on the order of the files) is sequential.
+    :param folder: folder with the onboard logging csv files
+    :param args: cli arguments
+    :return: summary of the folder (status: processed, skipped, failed)
+    """
+    start = time.perf_counter()
+    summary = {'folder': folder, 'status': 'skipped', 'files': 0, 'files_new': 0, 'files_skipped': 0, 'plots': 0, 'error': None, 'duration': 0.0}
+    try:
+        process_folder_files(folder, args, summary)
+    except Exception as e:
+        summary['status'] = 'failed'
+        summary['error'] = f'{type(e).__name__}: {e}'
+        if args.debug: traceback.print_exc()
+    summary['duration'] = time.perf_counter() - start
+    return summary
+
+
+def process_folder_files(folder: str, args: argparse.Namespace, summary: dict) -> None:
+    # get all csv files in folder
+    if args.debug: print(f'\nDEBUG> folders={folder}')
+    cvsfiles = folder_csv_files(folder, args.debug)
+    if args.debug: print(f'DEBUG> {folder} - {cvsfiles}')
+    index = FolderIndex(folder)
+    masterfile = os.path.join(folder, EXCEL_MASTERFILE)
+    names = {os.path.basename(cvsfile) for cvsfile in cvsfiles}
+    removed = [name for name in index.files if name not in names]
+    logfiles = dict()
+
+    # skip empty folders
+    if not len(cvsfiles) and not removed:
+        if args.debug: print(f'DEBUG> Skip empty folder')
+        return
+
+    # new and changed files
+    if args.repeat:
+        changed = list(cvsfiles)
+    elif not index.exists and os.path.isfile(masterfile):
+        # processed without index: the files in the master excel file are added to the index, the others are new
+        known = master_columns(masterfile)
+        logfiles = read_onboardlogging_files([cvsfile for cvsfile in cvsfiles if os.path.basename(cvsfile) in known], args)
+        for cvsfile, logfile in logfiles.items():
+            index.add(cvsfile, logfile)
+        changed = [cvsfile for cvsfile in cvsfiles if cvsfile not in logfiles]
+    else:
+        changed = [cvsfile for cvsfile in cvsfiles if index.changed(cvsfile)]
+    if args.debug: print(f'DEBUG> new or changed: {changed} removed: {removed}')
+    summary['files_new'] = len(changed)
+
+    if not changed and not removed and (args.no_excel or os.path.isfile(masterfile)):
+        if index.modified:
+            index.save()
+        if args.debug: print(f'DEBUG> {folder} is up to date, skipped')
+        return
+
+    # speeds (sheets) to rewrite: of the new, changed (also the speed before the change) and removed files
+    speeds = {index.speed(cvsfile) for cvsfile in changed} | {index.files[name]['speed'] for name in removed}
+    for name in removed:
+        index.remove(name)
+    logfiles.update(read_onboardlogging_files([cvsfile for cvsfile in changed if cvsfile not in logfiles], args))
+    for cvsfile in changed:
+        index.add(cvsfile, logfiles[cvsfile])
+    speeds |= {index.speed(cvsfile) for cvsfile in changed}
+    if args.repeat or not os.path.isfile(masterfile):
+        speeds |= {index.speed(cvsfile) for cvsfile in cvsfiles}
+    speeds.discard(None)
+
+    # read the other files of these speeds (columns of the same sheets, could be combined with the new files)
+    logfiles.update(read_onboardlogging_files([cvsfile for cvsfile in cvsfiles if cvsfile not in logfiles and index.speed(cvsfile) in speeds], args))
+
+    # Make master measurements (columns)
+    measurements = []
+    row_dict = dict()
+    #
+    # for combine
+    last_speed = int()
+    last_endtime_sec = int()
+    onboardlogging_last_list = None
+    #
+    # add all files to measurements
+    for cvsfile in cvsfiles:
+        if cvsfile not in logfiles:
+            # file of a speed which is not rewritten (not read), but it separates the measurements for the combine
+            if index.speed(cvsfile) is not None:
+                last_speed = index.speed(cvsfile)
+            continue
+        logfile = logfiles[cvsfile]
+        if logfile is None:
+            summary['files_skipped'] += 1
+            continue
+        header_dict = logfile.header
+        summary['files'] += 1
+
+        # Create Row-Dict (row names of the master excel file, from the last file)
+        row_dict = {header_dict[k]['index']: k for k in header_dict if header_dict[k]['index'] is not None and k != 'data_offset'}
+
+        # for combine from here
+        #############################################################################
+        same_measurement = False
+        if args.combine:
+            speed = logfile.speed
+            catch = header_dict['Catch']['value']
+            pre = header_dict['Pre']['value']
+            date_obj = datetime.strptime(f"{header_dict['Date']['value']} {header_dict['Time']['value']}", '%d.%m.%y %H:%M:%S')
+            starttime_sec = date_obj.timestamp()
+            real_start_time_sec = starttime_sec - pre
+            endtime_sec = starttime_sec + catch
+            start_overlap = last_endtime_sec - real_start_time_sec
+
+            overlap_index = 0
+            onboardlogging_current_list = logfile.data
+            if speed == last_speed:
+                if real_start_time_sec <= last_endtime_sec + args.combine_tolerance:
+                    if onboardlogging_last_list is not None:
+                        overlap_index = find_overlap(onboardlogging_last_list, onboardlogging_current_list, args.overlap_value_tolerance)
+                    if overlap_index:
+                        same_measurement = True
+            last_endtime_sec = endtime_sec
+            last_speed = speed
+            onboardlogging_last_list = onboardlogging_current_list
+
+        if same_measurement:
+            if args.debug: print(f'DEBUG> Same measurement - append to column')
+            # the overlapping values (till overlap_index) are removed on merge
+            measurements[-1].append(logfile, overlap_index, start_overlap)
+        else:
+            if args.debug: print(f'DEBUG> Different measurement')
+            measurements.append(Measurement(logfile))
+
+        #######################################################################
+
+    # skip if there is no context
+    if not measurements:
+        if args.debug: print(f'DEBUG> no Files with context in {folder}, skipped.')
+        index.save()
+        return
+
+    # Use Speed to separate the measurements. Possible values are 10, 40, 640, 1280.
+    speed_measurements = {speed: [] for speed in SPEED_SHEETS}
+    for measurement in measurements:
+        if measurement.speed not in speed_measurements:
+            break
+        speed_measurements[measurement.speed].append(measurement)
+
+    # only plot the measurements with a new or changed file (or without plot)
+    changed_names = {os.path.basename(cvsfile) for cvsfile in changed}
+    for speed in SPEED_SHEETS:
+        for measurement in speed_measurements[speed]:
+            if changed_names.isdisjoint(measurement.name.split(' + ')) and (args.no_image or os.path.isfile(os.path.join(folder, plot_filename(measurement.name)))):
+                continue
+            plot_measurement(measurement, folder, args.show_plot, args.no_image)
+            summary['plots'] += 1
+
+    # Write to Excel file (only the sheets of the speeds which have been read, if the master excel file exists)
+    if not args.no_excel:
+        rewrite = [speed for speed in SPEED_SHEETS if speed in speeds]
+        if os.path.isfile(masterfile) and len(rewrite) < len(SPEED_SHEETS):
+            with pd.ExcelWriter(masterfile, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
+                for speed in rewrite:
+                    measurement_frame(speed_measurements[speed], speed, row_dict).to_excel(writer, sheet_name=SPEED_SHEETS[speed])
+        else:
+            with pd.ExcelWriter(masterfile) as writer:
+                for speed in SPEED_SHEETS:
+                    measurement_frame(speed_measurements[speed], speed, row_dict).to_excel(writer, sheet_name=SPEED_SHEETS[speed])
+    index.save()
+    summary['status'] = 'processed'
+
+
+def worker_init() -> None:
+    # the workers only save the plots (show_plot is processed sequentially)
+    matplotlib.use('Agg')
+    warnings.filterwarnings("ignore", 'This pattern has match groups')
+
+
+def process_folders(folders: list, args: argparse.Namespace) -> list:
+    """
+    Process the folders in args.workers processes (each folder is processed by one worker, so the output does not depend on the number of workers)
+    :param folders: folders with the onboard logging csv files
+    :param args: cli arguments
+    :return: summaries of the folders (same order as folders)
+    """
+    summaries = [None] * len(folders)
+    done = 0
+
+    def progress(index: int, summary: dict) -> None:
+        nonlocal done
+        done += 1
+        summaries[index] = summary
+        if summary['status'] == 'skipped' and not args.debug:
+            return
+        error = f" {summary['error']}" if summary['error'] else ''
+        print(f"[{done}/{len(folders)}] {summary['folder']}: {summary['status']} ({summary['files_new']} new/changed files, {summary['files']} read, {summary['plots']} plots, "
+              f"{summary['duration']:.1f}s){error}")
+
+    if args.workers <= 1 or args.show_plot or len(folders) <= 1:
+        for index, folder in enumerate(folders):
+            progress(index, process_folder(folder, args))
+        return summaries
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=worker_init) as executor:
+        futures = {executor.submit(process_folder, folder, args): index for index, folder in enumerate(folders)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                # e.g. worker process killed
+                summary = {'folder': folders[index], 'status': 'failed', 'files': 0, 'files_new': 0, 'files_skipped': 0, 'plots': 0,
+                           'error': f'{type(e).__name__}: {e}', 'duration': 0.0}
+            progress(index, summary)
+    return summaries
+
+
+def print_summary(summaries: list, duration: float) -> None:
+    count = {status: sum(1 for s in summaries if s['status'] == status) for status in ('processed', 'skipped', 'failed')}
+    print(f"{len(summaries)} folders: {count['processed']} processed, {count['skipped']} skipped, {count['failed']} failed - "
+          f"{sum(s['files_new'] for s in summaries)} new/changed files, {sum(s['files'] for s in summaries)} read ({sum(s['files_skipped'] for s in summaries)} skipped), "
+          f"{sum(s['plots'] for s in summaries)} plots in {duration:.1f}s")
+    for s in summaries:
+        if s['status'] == 'failed':
+            print(f"  failed: {s['folder']}: {s['error']}")
+
+
 if __name__ == "__main__":
     warnings.filterwarnings("ignore", 'This pattern has match groups')
 
@@ -210,12 +668,15 @@ if __name__ == "__main__":
 
     parser.add_argument('-d', '--directory', default='Data', help='Directory of the LinScale3 csv Files')
     parser.add_argument('-nr', '--non-recursive', default=False, action="store_true", help='Non Recursive (only execute in dir)')
-    parser.add_argument('-r', '--repeat', default=False, action="store_true", help='Repeat execution in folders which are containing the master excel file')
+    parser.add_argument('-r', '--repeat', default=False, action="store_true", help='Reprocess all files (also the files in the index of the processed files)')
     parser.add_argument('-ni', '--no-image', default=False, action="store_true", help='Don\'t save plot as image')
     parser.add_argument('-sp', '--show-plot', default=False, action="store_true", help='Open Plot for each csv file')
     parser.add_argument('-ne', '--no-excel', default=False, action="store_true", help='')
     parser.add_argument('-c', '--combine', default=False, action="store_true", help='Combine measurements')
     parser.add_argument('-ct', '--combine_tolerance', default=15, type=int, help='Max tolerance to detect combine measurements')
+    parser.add_argument('-ovt', '--overlap_value_tolerance', default=0.0, type=float, help='Compare the overlapping data of combined measurements rounded to multiples of this value (0: exact)')
+    parser.add_argument('-w', '--workers', default=os.cpu_count() or 1, type=int, help='Number of processes (folders processed in parallel, 1: sequential)')
+    parser.add_argument('-fw', '--file-workers', default=1, type=int, help='Number of threads reading the files of one folder')
     parser.add_argument('--debug', default=False, action="store_true", help=argparse.SUPPRESS)
     args = parser.parse_args()
 
@@ -223,136 +684,6 @@ if __name__ == "__main__":
     # Testing Values for debugging
     if args.debug: print(f'DEBUG> args={args}')  # Test Output
 
-    row_dict2 = {
-        'Device': {
-            'regex': '(^[A-Z0-9]{2}:[A-Z0-9]{2}:[A-Z0-9]{2}$)',
-            'regex_group': 1,
-            'min_index': 0,
-            'max_index': 0,
-            'index': None,
-            'value': None,
-            'value_type': str,
-        },
-        'No': {
-            'regex': '^(LogNo=)?(No\\.)?([0-9]+)$',
-            'regex_group': 3,
-            'min_index': 0,
-            'max_index': 4,
-            'index': None,
-            'value': None,
-            'value_type': int,
-        },
-        'Date': {
-            'regex': '([0-9]{2}\\.[0-9]{2}\\.[0-9]{2})',
-            'regex_group': 1,
-            'min_index': 1,
-            'max_index': 25,
-            'index': None,
-            'value': None,
-            'value_type': str,
-        },
-        'Time': {
-            'regex': '([0-9]{2}:[0-9]{2}:[0-9]{2})',
-            'regex_group': 1,
-            'min_index': 1,
-            'max_index': 25,
-            'index': None,
-            'value': None,
-            'value_type': str,
-        },
-        'Unit': {
-            'regex': 'Unit=([a-zA-Z]+)',
-            'regex_group': 1,
-            'min_index': 1,
-            'max_index': 25,
-            'index': None,
-            'value': None,
-            'value_type': str,
-        },
-        'Speed': {
-            'regex': 'Speed=([0-9]+)',
-            'regex_group': 1,
-            'min_index': 1,
-            'max_index': 25,
-            'index': None,
-            'value': None,
-            'value_type': int,
-        },
-        'Trig': {
-            'regex': 'Trig=([0-9\\.]+)([a-zA-Z]*)',
-            'regex_group': 1,
-            'min_index': 1,
-            'max_index': 25,
-            'index': None,
-            'value': None,
-            'value_type': float,
-        },
-        'Stop': {
-            'regex': 'Stop=([0-9\\.]+)',
-            'regex_group': 1,
-            'min_index': 1,
-            'max_index': 25,
-            'index': None,
-            'value': None,
-            'value_type': float,
-        },
-        'Pre': {
-            'regex': 'Pre=([0-9\\.]+)',
-            'regex_group': 1,
-            'min_index': 1,
-            'max_index': 25,
-            'index': None,
-            'value': None,
-            'value_type': int,
-        },
-        'Catch': {
-            'regex': 'Catch=([0-9\\.]+)',
-            'regex_group': 1,
-            'min_index': 1,
-            'max_index': 25,
-            'index': None,
-            'value': None,
-            'value_type': int,
-        },
-        'Total': {
-            'regex': 'Total=([0-9\\.]+)',
-            'regex_group': 1,
-            'min_index': 1,
-            'max_index': 25,
-            'index': None,
-            'value': None,
-            'value_type': int,
-        },
-        'data_offset': {
-            'regex': '^((-)?[0-9]+(\\.[0-9]+)?)$',
-            'regex_group': 1,
-            'min_index': 5,
-            'max_index': 25,
-            'index': None,
-            'value': None,
-            'value_type': float,
-        },
-    }
-
-    onboardlogging_last_list = None
-
-    # Todo to remove
-    # row_regex_dict = {
-    #     'Device': '^[A-Z0-9]{2}:[A-Z0-9]{2}:[A-Z0-9]{2}$',
-    #     'No': 'No.*|^[0-9]{3,3}$',
-    #     'Date': '[0-9]{2}\\.[0-9]{2}\\.[0-9]{2}',
-    #     'Time': '[0-9]{2}:[0-9]{2}:[0-9]{2}',
-    #     'Speed': 'Speed=',
-    #     'Trig': 'Trig=',
-    #     'Stop': 'Stop=',
-    #     'Pre': 'Pre=',
-    #     'Catch': 'Catch=',
-    #     'Total': 'Total=',
-    # }
-
-    ext = [".csv"]  # searching only for csv Files (could be changed later)
-    excelmasterfile = 'master.xlsx'
-
     # ## End Global Settings
 
     # Add Starting-Directory folders
@@ -360,234 +691,13 @@ if __name__ == "__main__":
 
     # Add all Subfolders to folders to list folders (if recursive)
     if not args.non_recursive:
-        folders.extend(get_subfolders(args.directory))
+        folders.extend(sorted(get_subfolders(args.directory)))
     if args.debug: print(f'DEBUG> folders={folders}')
 
     # loop through all folders
-    for folder in list(folders):
-        # get all csv files in folder
-        cvsfiles = []
-        if args.debug: print(f'\nDEBUG> folders={folder}')
-        for f in os.scandir(folder):
-
-            # Skip folders with existing masterfile if not args.repeat
-            if not args.repeat:
-                if f.name.lower() == excelmasterfile:
-                    if args.debug: print(f'DEBUG> found Masterfile, skipping folder')
-                    cvsfiles = []
-                    break
-
-            # only add csv files to cvsfiles list
-            if f.is_file():
-                if os.path.splitext(f.name)[1].lower() in ext:
-                    if args.debug: print(f'DEBUG> {f.path}')
-                    cvsfiles.append(f.path)
-        if args.debug: print(f'DEBUG> {folder} - {cvsfiles}')
-
-        # skip empty folders
-        if not len(cvsfiles):
-            if args.debug: print(f'DEBUG> Skip empty folder')
-            continue
-
-        # Make master dataframe
-        df = pd.DataFrame()
-        #
-        # for combine
-        last_speed = int()
-        last_endtime_sec = int()
-        #
-        # add all files to df
-        for i in range(0, len(cvsfiles)):
-            if args.debug: print(f'DEBUG> {cvsfiles[i]}')
-            try:
-                # df2 = pd.read_csv(f'{cvsfiles[i]}')
-                filename = os.path.basename(cvsfiles[i])
-                df2 = pd.read_csv(cvsfiles[i], names=[filename])
-                header_dict = autodetect_onboardlogging_headers2(df2, filename, row_dict2)
-            # except pandas.errors.EmptyDataError:
-            except Exception as e:
-                if args.debug: print(f'DEBUG> {filename} is empty and has been skipped. Error: {e}')
-                continue
-
-            # Skipp if speed line is not found
-            if not header_dict['Speed']['value']:
-                if args.debug: print(f'DEBUG> {cvsfiles[i]} has wrong format and has been skipped.')
-                continue
-
-
-            # Create Row-Dict
-            tmp_row_dict = dict()
-            for k in header_dict:
-                if header_dict[k]['index'] is not None and k is not 'data_offset':
-                    tmp_row_dict[header_dict[k]['index']] = k
-            row_dict = dict(sorted(tmp_row_dict.items()))
-
-            data_offset = int(header_dict['data_offset']['index'])
-
-            # Todo to replace / remove
-            # for k in row_regex_dict:
-            #     index = None
-            #     regex = row_regex_dict[k]
-            #     index = df2[df2[filename].str.contains(regex, regex=True)].first_valid_index()
-            #     tmp_row_dict[index] = k
-            #
-            # # Skipp if speed line is not found
-            # if "Speed (Hz)" not in tmp_row_dict.values():
-            #     if args.debug: print(f'DEBUG> {cvsfiles[i]} has wrong format and has been skipped.')
-            #     continue
-            # row_dict = dict(sorted(tmp_row_dict.items()))
-            # index_no = int(list(row_dict.keys())[list(row_dict.values()).index("No")])
-            # index_speed = int(list(row_dict.keys())[list(row_dict.values()).index("Speed (Hz)")])
-            # index_time = int(list(row_dict.keys())[list(row_dict.values()).index("Time")])
-            # index_pre = int(list(row_dict.keys())[list(row_dict.values()).index("Pre")])
-            # index_total = int(list(row_dict.keys())[list(row_dict.values()).index("Total")])
-            # index_catch = int(list(row_dict.keys())[list(row_dict.values()).index("Catch")])
-            # data_offset = int(index_total + 1)  # data starts after total
-
-            # for combine from here
-            #############################################################################
-            # Remove unnecessary wording from rows
-            df2.replace(to_replace=r'Speed=', value='', regex=True, inplace=True)
-            df2.replace(to_replace=r'Trig=', value='', regex=True, inplace=True)
-            df2.replace(to_replace=r'Stop=', value='', regex=True, inplace=True)
-            df2.replace(to_replace=r'Pre=', value='', regex=True, inplace=True)
-            df2.replace(to_replace=r'Catch=', value='', regex=True, inplace=True)
-            df2.replace(to_replace=r'Total=', value='', regex=True, inplace=True)
-            df2.replace(to_replace=r'Hz', value='', regex=True, inplace=True)
-
-            same_measurement = False
-            if args.combine:
-                speed = header_dict['Speed']['value']
-                total = header_dict['Total']['value']
-                catch = header_dict['Catch']['value']
-                pre = header_dict['Pre']['value']
-                date_obj = datetime.strptime(f"{header_dict['Date']['value']} {header_dict['Time']['value']}", '%d.%m.%y %H:%M:%S')
-                date_obj.timestamp() - header_dict['Pre']['value']
-                starttime_sec = date_obj.timestamp()
-                real_start_time_sec = starttime_sec - pre
-                endtime_sec = starttime_sec + catch
-                start_overlap = last_endtime_sec - real_start_time_sec
-                index_no = header_dict['No']['index']
-                index_total = header_dict['Total']['index']
-                index_catch = header_dict['Catch']['index']
-
-                overlap_index = 0
-                onboardlogging_current_list = list(df2.loc[data_offset:, filename])
-                if speed == last_speed:
-                    if real_start_time_sec <= last_endtime_sec + args.combine_tolerance:
-                        if onboardlogging_last_list:
-                            overlap_index = find_overlap(onboardlogging_last_list, onboardlogging_current_list)
-                        if overlap_index:
-                            same_measurement = True
-                            last_total = float(df[df.columns[-1]][header_dict['Total']['index']].replace("sec", ""))
-                            new_total = last_total + total - start_overlap
-                            last_catch = float(df[df.columns[-1]][header_dict['Catch']['index']].replace("sec", ""))
-                            new_catch = last_catch + catch
-                last_endtime_sec = endtime_sec
-                last_speed = speed
-                onboardlogging_last_list = onboardlogging_current_list
-
-            if same_measurement:
-                if args.debug: print(f'DEBUG> Same measurement - append to column')
-                # if start_overlap < 0:
-                #     start_overlap = 0
-                # offset_overlap = start_overlap * speed + data_offset        # calculate the overlapping data, which is removed on merge
-                dflastcolumn = df.columns[-1]
-                dflastno = df.iloc[index_no, -1]
-                lastandcurrent = df[df.columns[-1]].dropna().append(df2.iloc[overlap_index:, 0], ignore_index=True)
-                df = pd.concat([df.iloc[:, :-1], lastandcurrent], axis=1)
-                df = df.rename(columns={df.columns[-1]: f'{dflastcolumn} + {df2.columns[-1]}'})
-                df.iloc[index_no, -1] = f'{dflastno} + {df2.iloc[index_no, -1]}'
-                df[df.columns[-1]][index_total] = f'{new_total}sec'
-                df[df.columns[-1]][index_catch] = f'{new_catch}sec'
-                # import pdb; pdb.set_trace() # Breakpoint
-            else:
-                if args.debug: print(f'DEBUG> Different measurement')
-                # for combine from here
-                df = pd.concat([df, df2], axis=1)
-
-            #######################################################################
-
-        # skip if there is no context
-        if df.empty:
-            if args.debug: print(f'DEBUG> no Files with context in {folder}, skipped.')
-            continue
-        if args.debug: print(f'DEBUG> dataframe df in folder:{folder}\n------------------------------\n{df.head(10)}\n------------------------------')
-
-        # Rename rows to match description and parse out values
-        df.rename(row_dict, axis='index', inplace=True)
-
-        # Remove unnecessary wording from rows
-        df.replace(to_replace=r'Speed=', value='', regex=True, inplace=True)
-        df.replace(to_replace=r'Trig=', value='', regex=True, inplace=True)
-        df.replace(to_replace=r'Stop=', value='', regex=True, inplace=True)
-        df.replace(to_replace=r'Pre=', value='', regex=True, inplace=True)
-        df.replace(to_replace=r'Catch=', value='', regex=True, inplace=True)
-        df.replace(to_replace=r'Total=', value='', regex=True, inplace=True)
-        df.replace(to_replace=r'Hz', value='', regex=True, inplace=True)
-
-        if args.debug: print(f'DEBUG> dataframe df in folder:{folder} (after renaming and replacing)\n------------------------------\n{df.head(10)}\n------------------------------')
-
-        # Make min and max
-        df = max_min_reading(df, data_offset)
-        data_offset += 2
-        if args.debug: print(f'DEBUG> dataframe df in folder:{folder}\n------------------------------ \n{df.head(15)}\n------------------------------')
-
-        # Use Speed row to determine and separate based off of value. Possible values are 10, 40, 640, 1280.
-        # These are in object format and not string format and cannot be changed (easily).
-        hz_10_data = []
-        hz_40_data = []
-        hz_640_data = []
-        hz_1280_data = []
-
-        for i in df.columns:
-            if df[i]['Speed'] == '10':
-                hz_10_data.append(df[i].dropna())
-            elif df[i]['Speed'] == '40':
-                hz_40_data.append(df[i].dropna())
-            elif df[i]['Speed'] == '640':
-                hz_640_data.append(df[i].dropna())
-            elif df[i]['Speed'] == '1280':
-                hz_1280_data.append(df[i].dropna())
-            else:
-                break
-
-        # Do for all Hz.
-        df10 = pd.DataFrame(hz_10_data).T
-        df40 = pd.DataFrame(hz_40_data).T
-        df640 = pd.DataFrame(hz_640_data).T
-        df1280 = pd.DataFrame(hz_1280_data).T
-
-        # Do for all Hz.
-        df10 = index_to_sec(df10, 10, data_offset)
-        df40 = index_to_sec(df40, 40, data_offset)
-        df640 = index_to_sec(df640, 640, data_offset)
-        df1280 = index_to_sec(df1280, 1280, data_offset)
-        if args.debug: print(f'DEBUG> dataframe nums40 in folder:{folder} (after renaming and replacing)\n------------------------------\n{df10.head(10)} {df40.head(10)}\n------------------------------')
-
-        for i in df10.columns:
-            if i == 'Seconds': continue
-            plot_df(df10, i, folder, data_offset, args.show_plot, args.no_image)
-
-        for i in df40.columns:
-            if i == 'Seconds': continue
-            plot_df(df40, i, folder, data_offset, args.show_plot, args.no_image)
-
-        for i in df640.columns:
-            if i == 'Seconds': continue
-            plot_df(df640, i, folder, data_offset, args.show_plot, args.no_image)
-
-        for i in df1280.columns:
-            if i == 'Seconds': continue
-            plot_df(df1280, i, folder, data_offset, args.show_plot, args.no_image)
-
-        # Write to Excel file
-        if not args.no_excel:
-            with pd.ExcelWriter(f'{folder}/{excelmasterfile}') as writer:
-                df10.to_excel(writer, sheet_name='10Hz Measurements')
-                df40.to_excel(writer, sheet_name='40Hz Measurements')
-                df640.to_excel(writer, sheet_name='640Hz Measurements')
-                df1280.to_excel(writer, sheet_name='1280Hz Measurements')
+    start = time.perf_counter()
+    summaries = process_folders(folders, args)
+    print_summary(summaries, time.perf_counter() - start)
 
     # wait if plots are open
     if args.show_plot:
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+import numpy as np
+
+
+def quantize(values: np.ndarray, tolerance: float = 0.0) -> np.ndarray:
+    """
+    :param values: measured values
+    :param tolerance: 0: only equal values get the same code, else the values rounded to the same multiple of tolerance
+                      (round(value / tolerance), values close to the middle between two multiples could get different codes)
+    :return: integer code of each value
+    """
+    if tolerance:
+        return np.round(values / tolerance).astype(np.int64)
+    return np.unique(values, return_inverse=True)[1].reshape(-1)
+
+
+def prefix_function(pattern: list) -> list:
+    """
+    :return: for each position the length of the longest proper prefix of pattern[:position + 1] which is also its suffix (KMP)
+    """
+    prefix = [0] * len(pattern)
+    matched = 0
+    for i in range(1, len(pattern)):
+        while matched and pattern[i] != pattern[matched]:
+            matched = prefix[matched - 1]
+        if pattern[i] == pattern[matched]:
+            matched += 1
+        prefix[i] = matched
+    return prefix
+
+
+def find_overlap(last, current, tolerance: float = 0.0) -> int:
+    """
+    Compares the beginning of current and the end of last. When these are the same, returns the index till where current has the same values as last at the end.
+    If no overlapping data is found 0 is returned.
+    The longest overlap is found in linear time (KMP over the quantized values), only the candidates which start with the
+    first value of current and end with the last value of last are searched.
+    :param last: last list or array with data values
+    :param current: current list or array with data values
+    :param tolerance: the values are compared rounded to multiples of tolerance (see quantize), 0: exact
+    :return: the index for the overlapping data. current[overlap_index] will have the same value as last[-1]
+    """
+    last = np.asarray(last, dtype=np.float64)
+    current = np.asarray(current, dtype=np.float64)
+    length = min(last.size, current.size)
+    if not length:
+        return 0
+    codes = quantize(np.concatenate((last[last.size - length:], current[:length])), tolerance)
+    text, pattern = codes[:length], codes[length:]
+
+    # overlap lengths which end with the last value of last and start with the first value of current
+    lengths = np.flatnonzero(pattern == text[-1]) + 1
+    lengths = lengths[text[length - lengths] == pattern[0]]
+    if not lengths.size:
+        return 0
+    length = int(lengths[-1])
+    text = text[text.size - length:].tolist()
+    pattern = pattern[:length].tolist()
+
+    # longest prefix of pattern which is a suffix of text
+    prefix = prefix_function(pattern)
+    matched = 0
+    for value in text:
+        while matched and pattern[matched] != value:
+            matched = prefix[matched - 1]
+        if pattern[matched] == value:
+            matched += 1
+    return matched - 1 if matched else 0
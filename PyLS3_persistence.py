@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable
+
+
+logger = logging.getLogger("PyLS3")
+
+
+def _create_plot(filename: str, plot_kwargs: dict) -> str:
+    """
+    Runs in the plot worker process (matplotlib is imported there without gui backend)
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from PyLS3_plot import create_plot
+    create_plot(filename, **plot_kwargs)
+    return filename
+
+
+def _written_set(written: asyncio.Future, filename: str = None, exception: BaseException = None) -> None:
+    """
+    Result of the write for the submitter of a job (see PersistencePipeline.submit)
+    """
+    if written is None or written.done():
+        return
+    if exception is not None:
+        written.set_exception(exception)
+    else:
+        written.set_result(filename)
+
+
+class PersistencePipeline:
+    """
+    Saves captures in the background, so the receive path of the devices is never blocked.
+    Jobs are put into a bounded queue. The files are written in a thread pool and
+    the plots are created in a process pool.
+    """
+
+    def __init__(self, queue_size: int = 32, file_workers: int = 2, plot_workers: int = 1):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.file_workers = file_workers
+        self.plot_workers = plot_workers
+        self.file_executor = None
+        self.plot_executor = None
+        self.tasks = []
+        self.overflow_writes = set()        # writes of the jobs which didn't fit into the queue
+
+        self.jobs_submitted = 0
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.jobs_overflow = 0
+        self.plots_completed = 0
+        self.plots_failed = 0
+        self.last_file = None
+
+    async def start(self) -> None:
+        self.file_executor = ThreadPoolExecutor(max_workers=self.file_workers, thread_name_prefix='PyLS3_file')
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.file_workers)]
+        logger.debug(f"Persistence: started ({self.file_workers} file workers, {self.plot_workers} plot workers)")
+
+    async def close(self) -> None:
+        """
+        Wait till all jobs are done and stop the workers
+        """
+        await self.queue.join()
+        if self.overflow_writes:
+            await asyncio.gather(*self.overflow_writes, return_exceptions=True)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.file_executor:
+            self.file_executor.shutdown(wait=True)
+        if self.plot_executor:
+            self.plot_executor.shutdown(wait=True)
+        logger.debug(f"Persistence: closed {self.status()}")
+
+    def submit(self, description: str, write: Callable[..., str], write_args: tuple = (), plot_kwargs: dict = None,
+               written: asyncio.Future = None) -> bool:
+        """
+        Add a job (never blocks)
+        :param description: description for logging (e.g. device name)
+        :param write: function writing the file, returns the filename (executed in the thread pool)
+        :param write_args: arguments for write
+        :param plot_kwargs: if set, a plot of the file is created with these create_plot arguments
+        :param written: if set, gets the filename when the file is written (before the plot) or the exception of write
+        :return: True if the job was queued
+        """
+        self.jobs_submitted += 1
+        job = (description, write, write_args, plot_kwargs, written)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            # keep the data: write directly in the thread pool, but skip the plot
+            self.jobs_overflow += 1
+            logger.warning(f"Persistence: queue full ({self.queue.qsize()}), {description} is saved without plot")
+            future = asyncio.get_running_loop().run_in_executor(self.file_executor, write, *write_args)
+            self.overflow_writes.add(future)
+            future.add_done_callback(lambda f: self.overflow_done(description, f, written))
+            return False
+        logger.debug(f"Persistence: {description} queued (queue depth {self.queue.qsize()})")
+        return True
+
+    def overflow_done(self, description: str, future: asyncio.Future, written: asyncio.Future = None) -> None:
+        """
+        Result of a write started directly in the thread pool (queue full), counted like the jobs of the queue
+        """
+        self.overflow_writes.discard(future)
+        if future.cancelled():
+            self.jobs_failed += 1
+            logger.error(f"Persistence: {description} cancelled")
+            if written is not None:
+                written.cancel()
+        elif future.exception() is not None:
+            self.jobs_failed += 1
+            logger.error(f"Persistence: {description} failed: {future.exception()}")
+            _written_set(written, exception=future.exception())
+        else:
+            self.jobs_completed += 1
+            self.last_file = future.result()
+            logger.info(f"Persistence: {description} saved to {self.last_file}")
+            _written_set(written, self.last_file)
+
+    async def worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            description, write, write_args, plot_kwargs, written = await self.queue.get()
+            try:
+                filename = await loop.run_in_executor(self.file_executor, write, *write_args)
+                self.last_file = filename
+                logger.info(f"Persistence: {description} saved to {filename}")
+                _written_set(written, filename)
+                if plot_kwargs is not None:
+                    await self.plot(filename, plot_kwargs)
+                self.jobs_completed += 1
+            except Exception as e:
+                self.jobs_failed += 1
+                logger.error(f"Persistence: {description} failed: {e}")
+                _written_set(written, exception=e)
+            finally:
+                self.queue.task_done()
+
+    async def plot(self, filename: str, plot_kwargs: dict) -> None:
+        if not self.plot_executor:
+            self.plot_executor = ProcessPoolExecutor(max_workers=self.plot_workers)
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.plot_executor, _create_plot, filename, plot_kwargs)
+            self.plots_completed += 1
+        except Exception as e:
+            self.plots_failed += 1
+            logger.error(f"Persistence: plot of {filename} failed: {e}")
+
+    def status(self) -> dict:
+        return {
+            'queue_depth': self.queue.qsize(),
+            'submitted': self.jobs_submitted,
+            'completed': self.jobs_completed,
+            'failed': self.jobs_failed,
+            'overflow': self.jobs_overflow,
+            'plots_completed': self.plots_completed,
+            'plots_failed': self.plots_failed,
+            'last_file': self.last_file,
+        }
+
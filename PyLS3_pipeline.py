@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+import asyncio
+import logging
+import os
+import pickle
+import tempfile
+import time
+from collections import deque
+from typing import Callable
+
+
+logger = logging.getLogger("PyLS3")
+
+OVERFLOW_POLICIES = ('drop-oldest', 'block', 'spill')
+
+
+class StageQueue:
+    """
+    Bounded queue between two stages of the receive pipeline.
+    Overflow policy, if the queue is full:
+    - drop-oldest: the oldest item is dropped
+    - block: put() waits for space, put_nowait() keeps the item and calls pause (e.g. pause_reading of the serial transport),
+             resume is called when the queue is drained to the half
+    - spill: the items are written to a temporary file and read back in order, when the queue has space again
+    """
+
+    def __init__(self, name: str, maxsize: int = 256, policy: str = 'drop-oldest', pause: Callable = None, resume: Callable = None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}' (use {', '.join(OVERFLOW_POLICIES)})")
+        self.name = name
+        self.maxsize = max(maxsize, 1)
+        self.policy = policy
+        self.pause = pause
+        self.resume = resume
+        self.items = deque()
+        self.item_available = asyncio.Event()
+        self.space_available = asyncio.Event()
+        self.space_available.set()
+        self.paused = False
+        self.spill_file = None
+        self.spill_read_pos = 0
+        self.spill_count = 0
+
+        self.items_in = 0
+        self.items_out = 0
+        self.drops = 0
+        self.spilled = 0
+        self.pauses = 0
+        self.max_depth = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def __len__(self) -> int:
+        return len(self.items) + self.spill_count
+
+    def put_nowait(self, item) -> None:
+        self.items_in += 1
+        entry = (time.perf_counter(), item)
+        if self.spill_count or len(self.items) >= self.maxsize:
+            if self.policy == 'drop-oldest':
+                if self.items:
+                    self.items.popleft()
+                self.drops += 1
+            elif self.policy == 'spill':
+                self._spill(entry)
+                self.item_available.set()
+                return
+            elif not self.paused and self.pause:
+                self.paused = True
+                self.pauses += 1
+                self.pause()
+        self.items.append(entry)
+        self.max_depth = max(self.max_depth, len(self))
+        if len(self.items) >= self.maxsize:
+            self.space_available.clear()
+        self.item_available.set()
+
+    async def put(self, item) -> None:
+        if self.policy == 'block':
+            while len(self.items) >= self.maxsize:
+                await self.space_available.wait()
+        self.put_nowait(item)
+
+    async def get(self):
+        while not self.items and not self.spill_count:
+            self.item_available.clear()
+            await self.item_available.wait()
+        if not self.items:
+            self._unspill()
+        enqueued, item = self.items.popleft()
+        self.items_out += 1
+        latency = time.perf_counter() - enqueued
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        if len(self.items) < self.maxsize:
+            self.space_available.set()
+        if self.paused and len(self.items) <= self.maxsize // 2:
+            self.paused = False
+            if self.resume:
+                self.resume()
+        return item
+
+    def _spill(self, entry: tuple) -> None:
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix=f"PyLS3_{self.name}_")
+        self.spill_file.seek(0, os.SEEK_END)
+        pickle.dump(entry, self.spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spill_count += 1
+        self.spilled += 1
+        self.max_depth = max(self.max_depth, len(self))
+
+    def _unspill(self) -> None:
+        """
+        Move the spilled items back to the queue (max. maxsize items)
+        """
+        self.spill_file.seek(self.spill_read_pos)
+        while self.spill_count and len(self.items) < self.maxsize:
+            self.items.append(pickle.load(self.spill_file))
+            self.spill_count -= 1
+        self.spill_read_pos = self.spill_file.tell()
+        if not self.spill_count:
+            self.spill_file.seek(0)
+            self.spill_file.truncate()
+            self.spill_read_pos = 0
+
+    def close(self) -> None:
+        if self.spill_file:
+            self.spill_file.close()
+            self.spill_file = None
+
+    def status(self) -> dict:
+        return {
+            'depth': len(self),
+            'max_depth': self.max_depth,
+            'in': self.items_in,
+            'out': self.items_out,
+            'drops': self.drops,
+            'spilled': self.spilled,
+            'pauses': self.pauses,
+            'latency_avg_ms': round(self.latency_sum / self.items_out * 1000, 3) if self.items_out else 0.0,
+            'latency_max_ms': round(self.latency_max * 1000, 3),
+        }
+
+
+class ReceivePipeline:
+    """
+    Staged receive path of one device: ingest -> decode -> capture (-> persist, see PyLS3_persistence).
+    The stages run as own tasks and are joined by bounded StageQueues, so the receive callback only
+    timestamps and queues the received bytes.
+    """
+
+    def __init__(self, device_name: str, decode: Callable, capture: Callable, queue_size: int = 256, policy: str = 'drop-oldest',
+                 pause: Callable = None, resume: Callable = None):
+        """
+        :param device_name: name of the device
+        :param decode: decode(arrival_ns, data) -> item for capture or None
+        :param capture: capture(*item)
+        :param queue_size: max. items per queue
+        :param policy: overflow policy (see StageQueue)
+        :param pause: called when the ingest queue is full (policy block)
+        :param resume: called when the ingest queue is drained (policy block)
+        """
+        self.device_name = device_name
+        self.decode = decode
+        self.capture = capture
+        self.queues = {
+            'decode': StageQueue(f"{device_name}_decode", queue_size, policy, pause, resume),
+            'capture': StageQueue(f"{device_name}_capture", queue_size, policy),
+        }
+        self.stage_time = {'decode': 0.0, 'capture': 0.0}
+        self.stage_errors = {'decode': 0, 'capture': 0}
+        self.tasks = []
+
+    def start(self) -> None:
+        self.tasks = [
+            asyncio.create_task(self.stage('decode', self.queues['decode'], self.decode, self.queues['capture'])),
+            asyncio.create_task(self.stage('capture', self.queues['capture'], self.capture, None)),
+        ]
+        logger.debug(f"{self.device_name}: Receive pipeline started")
+
+    def ingest(self, arrival_ns: int, data: bytes) -> None:
+        """
+        Raw ingest stage (called from the receive callback, never blocks)
+        :param arrival_ns: receive time (perf_counter_ns)
+        :param data: received bytes
+        """
+        if not self.tasks:
+            self.start()
+        self.queues['decode'].put_nowait((arrival_ns, data))
+
+    async def stage(self, name: str, queue: StageQueue, function: Callable, output: StageQueue) -> None:
+        while True:
+            item = await queue.get()
+            start = time.perf_counter()
+            try:
+                result = function(*item)
+            except Exception as e:
+                self.stage_errors[name] += 1
+                logger.error(f"{self.device_name}: Receive pipeline stage {name} failed: {e}")
+                result = None
+            self.stage_time[name] += time.perf_counter() - start
+            if output is not None and result is not None:
+                await output.put(result)
+
+    async def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        for queue in self.queues.values():
+            queue.close()
+
+    def status(self) -> dict:
+        return {name: {**queue.status(), 'busy_s': round(self.stage_time[name], 3), 'errors': self.stage_errors[name]}
+                for name, queue in self.queues.items()}
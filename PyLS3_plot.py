@@ -6,16 +6,17 @@ import asyncio
 import re
 import argparse
 import warnings
+from PyLS3_capturefile import CaptureFile, is_capture_file
 
 
-async def plot_csv(filename: str,
-                   csv_type: str = "pyls3",
-                   header_list: list = ['device_name', 'present_time', 'rx_timestamp', 'rx_delays', 'measured_value', 'unit_value_parsed', 'reference_zero', 'measure_mode_parsed', 'speed_value_parsed', 'electric_quantity', 'working_mode_parsed'],
-                   row_index_list: list = ['No', 'Date', 'Time', 'Speed', 'Trig', 'Stop', 'Pre', 'Catch', 'Total', 'DataStart'],
-                   show_plot: bool = False,
-                   save_image: bool = False,
-                   override_image: bool = True,
-                   ):
+def create_plot(filename: str,
+                csv_type: str = "pyls3",
+                header_list: list = ['device_name', 'present_time', 'rx_timestamp', 'rx_delays', 'measured_value', 'unit_value_parsed', 'reference_zero', 'measure_mode_parsed', 'speed_value_parsed', 'electric_quantity', 'working_mode_parsed'],
+                row_index_list: list = ['No', 'Date', 'Time', 'Speed', 'Trig', 'Stop', 'Pre', 'Catch', 'Total', 'DataStart'],
+                show_plot: bool = False,
+                save_image: bool = False,
+                override_image: bool = True,
+                ):
     """
     Create a plot for a csv file with LS3 data
     :param filename: filename of the csv file
@@ -35,7 +36,18 @@ async def plot_csv(filename: str,
     d['speed_value_parsed'] = "NA"
     d['measure_mode_parsed'] = "NA"
 
-    if csv_type == 'pyls3':
+    if csv_type == 'pyls3' and is_capture_file(filename):
+        # Read binary capture file (memory mapped, nothing to parse)
+        capture = CaptureFile(filename)
+        df = capture.to_dataframe()
+        d.update(capture.info())
+        d['present_time'] = d['present_time'].split(".")[0]
+
+        # Create a 'Seconds' row
+        df['Seconds'] = (df['rx_timestamp'] - d['rx_timestamp'])
+        data_offset = 0
+
+    elif csv_type == 'pyls3':
         # Read CSV
         df = pd.read_csv(filename, names=header_list)
 
@@ -128,9 +140,18 @@ async def plot_csv(filename: str,
         # plt.show()
         # plt.draw()
         plt.show(block=False)
+    else:
+        plt.close(fig)
     return ""
 
 
+async def plot_csv(*args, **kwargs):
+    """
+    Async wrapper for create_plot (see create_plot for the parameters)
+    """
+    return create_plot(*args, **kwargs)
+
+
 async def main():
     # Parse CLI args
     parser = argparse.ArgumentParser(
@@ -0,0 +1,303 @@
+#!/usr/bin/python3
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import struct
+from collections import deque
+import numpy as np
+from PyLS3_capture import SAMPLE_DTYPE
+from PyLS3_pipeline import StageQueue
+
+
+logger = logging.getLogger("PyLS3")
+
+PROTOCOL_VERSION = 1
+
+# every message: payload length, message type, device index (little endian), then the payload
+MESSAGE_HEADER = struct.Struct('<IBB')
+MESSAGE_HELLO = 0           # json: version, devices (index -> name), dtype of the samples, message codes, decimation
+MESSAGE_SAMPLES = 1         # samples of one device as packed SAMPLE_DTYPE records
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WEBSOCKET_BINARY = 0x2
+WEBSOCKET_CLOSE = 0x8
+WEBSOCKET_PING = 0x9
+WEBSOCKET_PONG = 0xA
+
+
+def encode_message(message_type: int, device_index: int, payload: bytes) -> bytes:
+    return MESSAGE_HEADER.pack(len(payload), message_type, device_index) + payload
+
+
+def websocket_frame(payload: bytes, opcode: int = WEBSOCKET_BINARY) -> bytes:
+    """
+    :return: unmasked websocket frame (server -> client)
+    """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def websocket_read(reader: asyncio.StreamReader) -> tuple:
+    """
+    Read one frame of the client
+    :return: opcode, payload
+    """
+    b1, b2 = await reader.readexactly(2)
+    length = b2 & 0x7F
+    if length == 126:
+        length, = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', await reader.readexactly(8))
+    mask = await reader.readexactly(4) if b2 & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return b1 & 0x0F, payload
+
+
+async def websocket_handshake(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+    """
+    :return: True if the client requested a websocket
+    """
+    request = await reader.readuntil(b'\r\n\r\n')
+    headers = dict()
+    for line in request.decode('latin-1').split('\r\n')[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    key = headers.get('sec-websocket-key')
+    if not key:
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\n')
+        return False
+    accept = base64.b64encode(hashlib.sha1(f"{key}{WEBSOCKET_GUID}".encode('ascii')).digest()).decode('ascii')
+    writer.write(f"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode('ascii'))
+    return True
+
+
+class LiveClient:
+    """
+    One subscriber: the messages are queued (max. queue_size) and written by an own task,
+    a client which can't keep up is disconnected (the other clients and the receive path are not slowed down).
+    """
+
+    def __init__(self, name: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, websocket: bool, queue_size: int):
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+        self.websocket = websocket
+        self.queue_size = queue_size
+        self.messages = deque()
+        self.message_available = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.evicted = False
+        self.messages_sent = 0
+        self.bytes_sent = 0
+
+    def send(self, message: bytes) -> bool:
+        """
+        :return: False if the queue of the client is full (the client has to be evicted)
+        """
+        if len(self.messages) >= self.queue_size:
+            return False
+        self.messages.append(message)
+        self.message_available.set()
+        return True
+
+    async def write(self) -> None:
+        while True:
+            while not self.messages:
+                self.message_available.clear()
+                await self.message_available.wait()
+            message = self.messages.popleft()
+            if self.websocket:
+                message = websocket_frame(message)
+            self.writer.write(message)
+            await self.writer.drain()
+            self.messages_sent += 1
+            self.bytes_sent += len(message)
+
+    async def read(self) -> None:
+        # the clients don't send data, only websocket control frames (ping, close) are handled
+        if not self.websocket:
+            while await self.reader.read(4096):
+                pass
+            return
+        while True:
+            opcode, payload = await websocket_read(self.reader)
+            if opcode == WEBSOCKET_CLOSE:
+                self.writer.write(websocket_frame(payload[:2], WEBSOCKET_CLOSE))
+                return
+            if opcode == WEBSOCKET_PING:
+                self.writer.write(websocket_frame(payload, WEBSOCKET_PONG))
+
+    async def run(self) -> None:
+        tasks = [asyncio.create_task(self.write()), asyncio.create_task(self.read()), asyncio.create_task(self.closed.wait())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.writer.close()
+
+    def close(self) -> None:
+        self.closed.set()
+
+    def status(self) -> dict:
+        return {'queued': len(self.messages), 'messages': self.messages_sent, 'bytes': self.bytes_sent}
+
+
+class LiveServer:
+    """
+    Fan-out of the decoded samples of all devices to many subscribers (TCP and/or WebSocket).
+    The receive path only queues the batch (publish), an own task decimates and encodes it once
+    and hands the message to the queues of all clients.
+    TCP: a stream of messages (MESSAGE_HEADER + payload), WebSocket: one binary message per websocket frame.
+    The first message to a client is MESSAGE_HELLO.
+    """
+
+    def __init__(self, device_names: list, message_code: dict, host: str = '127.0.0.1', tcp_port: int = 8765, websocket_port: int = 0,
+                 client_queue_size: int = 256, decimation: int = 1, queue_size: int = 1024):
+        """
+        :param device_names: devices (index in the messages = index in this list)
+        :param message_code: PyLS3_Conf['MessageCode'] (sent in the hello message)
+        :param host: address of the server
+        :param tcp_port: TCP port (0: no TCP server)
+        :param websocket_port: WebSocket port (0: no WebSocket server)
+        :param client_queue_size: max. messages waiting per client, a slower client is disconnected
+        :param decimation: only every decimation-th sample is sent
+        :param queue_size: max. batches waiting for the fan-out (the oldest are dropped)
+        """
+        self.device_index = {device_name: index for index, device_name in enumerate(device_names)}
+        self.host = host
+        self.tcp_port = tcp_port
+        self.websocket_port = websocket_port
+        self.client_queue_size = client_queue_size
+        self.decimation = max(int(decimation), 1)
+        self.decimation_offset = [0] * len(device_names)
+        self.pending = StageQueue('live_server', queue_size, 'drop-oldest')
+        self.hello = encode_message(MESSAGE_HELLO, 0, json.dumps({
+            'version': PROTOCOL_VERSION,
+            'devices': device_names,
+            'dtype': [(name, SAMPLE_DTYPE[name].str) for name in SAMPLE_DTYPE.names],
+            'message_code': {section: dict(codes) for section, codes in message_code.items()},
+            'decimation': self.decimation,
+        }).encode('utf-8'))
+        self.clients = dict()       # LiveClient -> task
+        self.servers = []
+        self.broadcast_task = None
+        self.clients_total = 0
+        self.clients_evicted = 0
+
+    async def start(self) -> None:
+        if self.tcp_port:
+            self.servers.append(await asyncio.start_server(self.tcp_connected, self.host, self.tcp_port))
+            logger.info(f"Live server: TCP on {self.host}:{self.tcp_port}")
+        if self.websocket_port:
+            self.servers.append(await asyncio.start_server(self.websocket_connected, self.host, self.websocket_port))
+            logger.info(f"Live server: WebSocket on ws://{self.host}:{self.websocket_port}")
+        self.broadcast_task = asyncio.create_task(self.broadcast())
+
+    async def close(self) -> None:
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.servers = []
+        if self.broadcast_task is not None:
+            self.broadcast_task.cancel()
+            await asyncio.gather(self.broadcast_task, return_exceptions=True)
+            self.broadcast_task = None
+        for client in list(self.clients):
+            client.close()
+        await asyncio.gather(*self.clients.values(), return_exceptions=True)
+        self.pending.close()
+
+    def listener(self, device_name: str):
+        """
+        :return: sample listener of the device (see Connection.sample_listeners)
+        """
+        device_index = self.device_index.get(device_name)
+        if device_index is None:
+            device_index = self.device_index[device_name] = len(self.device_index)
+            self.decimation_offset.append(0)
+            logger.warning(f"Live server: {device_name} is not in the hello message of the clients (index {device_index})")
+        return lambda samples: self.publish(device_index, samples)
+
+    def publish(self, device_index: int, samples: np.ndarray) -> None:
+        """
+        Called in the receive path, only queues the batch
+        """
+        if self.clients:
+            self.pending.put_nowait((device_index, samples))
+
+    def encode(self, device_index: int, samples: np.ndarray):
+        """
+        :return: MESSAGE_SAMPLES with the (decimated) samples, None if no sample is left
+        """
+        if self.decimation > 1:
+            offset = self.decimation_offset[device_index]
+            self.decimation_offset[device_index] = (offset + samples.size) % self.decimation
+            samples = samples[(-offset) % self.decimation::self.decimation]
+        if not samples.size:
+            return None
+        return encode_message(MESSAGE_SAMPLES, device_index, np.ascontiguousarray(samples).tobytes())
+
+    async def broadcast(self) -> None:
+        while True:
+            device_index, samples = await self.pending.get()
+            message = self.encode(device_index, samples)
+            if message is None:
+                continue
+            for client in list(self.clients):
+                if client.evicted:
+                    continue
+                if not client.send(message):
+                    self.clients_evicted += 1
+                    logger.warning(f"Live server: {client.name} is too slow ({client.queue_size} messages queued), disconnected")
+                    client.evicted = True
+                    client.close()
+
+    async def tcp_connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await self.serve(reader, writer, False)
+
+    async def websocket_connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            websocket = await asyncio.wait_for(websocket_handshake(reader, writer), timeout=5.0)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            websocket = False
+        if not websocket:
+            writer.close()
+            return
+        await self.serve(reader, writer, True)
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, websocket: bool) -> None:
+        peer = writer.get_extra_info('peername')
+        client = LiveClient(f"{'WebSocket' if websocket else 'TCP'} {peer}", reader, writer, websocket, self.client_queue_size)
+        client.send(self.hello)
+        self.clients_total += 1
+        logger.info(f"Live server: {client.name} connected")
+        self.clients[client] = asyncio.current_task()
+        try:
+            await client.run()
+        except Exception as e:
+            logger.debug(f"Live server: {client.name}: {e}")
+        finally:
+            del self.clients[client]
+            logger.info(f"Live server: {client.name} disconnected")
+
+    def status(self) -> dict:
+        return {
+            'clients': len(self.clients),
+            'clients_total': self.clients_total,
+            'clients_evicted': self.clients_evicted,
+            'fan_out': self.pending.status(),
+        }
@@ -0,0 +1,264 @@
+#!/usr/bin/python3
+from dataclasses import dataclass, fields
+from types import MappingProxyType
+from typing import Mapping, Optional
+from PyLS3_pipeline import OVERFLOW_POLICIES
+
+
+FILE_FORMATS = ('csv', 'binary')
+CAPTURE_MODES = ('continuous', 'single')
+TRIGGER_MODES = ('single', 'combined')
+CONNECTION_TYPES = ('Bluetooth', 'USB', 'none')     # none: device is not used
+
+# MessageCode sections -> fields of the frames (PyLS3_frame.FRAME_DTYPE)
+MESSAGE_CODE_FIELDS = {
+    'WorkingMode': 'working_mode',
+    'MeasureMode': 'measure_mode',
+    'UnitValue': 'unit_value',
+    'SpeedValue': 'speed_value',
+}
+
+
+def _choice(section: str, key: str, value, choices: tuple):
+    if value not in choices:
+        raise ValueError(f"{section}: {key} '{value}' is not valid (use {', '.join(choices)})")
+    return value
+
+
+def freeze(value):
+    """
+    :return: read-only copy of a nested configuration (dict -> MappingProxyType, list -> tuple)
+    """
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def frozen_slots(cls):
+    """
+    Class decorator: frozen dataclass with __slots__ (like dataclass(frozen=True, slots=True) of Python 3.10)
+    """
+    cls = dataclass(frozen=True)(cls)
+    attributes = {k: v for k, v in cls.__dict__.items() if k not in ('__dict__', '__weakref__')}
+    attributes['__slots__'] = tuple(f.name for f in fields(cls))
+    return type(cls)(cls.__name__, cls.__bases__, attributes)
+
+
+def message_code_lookup(message_code: dict) -> tuple:
+    """
+    :param message_code: dict, e.g. PyLS3_Conf['MessageCode']['UnitValue']
+    :return: 256 entries indexed by the raw code byte (None for unknown codes)
+    """
+    lookup = [None] * 256
+    for code, value in message_code.items():
+        lookup[ord(code)] = str(value)
+    return tuple(lookup)
+
+
+@frozen_slots
+class MessageCodes:
+    working_mode: tuple         # raw code byte -> parsed value (see message_code_lookup)
+    measure_mode: tuple
+    unit_value: tuple
+    speed_value: tuple
+    speed_hz: tuple             # raw code byte -> speed in Hz (0 for unknown codes)
+    conf: Mapping               # PyLS3_Conf['MessageCode'] (file metadata, csv), read-only
+
+    @classmethod
+    def from_conf(cls, conf: dict) -> 'MessageCodes':
+        """
+        :param conf: PyLS3_Conf['MessageCode']
+        """
+        lookups = {name: message_code_lookup(conf[section]) for section, name in MESSAGE_CODE_FIELDS.items()}
+        speed_hz = tuple(int(speed) if speed is not None else 0 for speed in lookups['speed_value'])
+        return cls(speed_hz=speed_hz, conf=freeze(conf), **lookups)
+
+
+@frozen_slots
+class CaptureSettings:
+    file_format: str
+    capture_mode: str
+    trigger_mode: str
+    start_trigger: float
+    stop_trigger: float
+    min_capture_ns: int
+    max_capture_ns: int
+    min_capture_time_s: float
+    max_capture_time_s: float
+    precapture_time_s: float
+    auto_generate_plot: bool
+    streaming: bool
+    chunk_time_s: float
+    fsync: bool
+    max_pending_chunks: int
+    combined_trigger: Optional[Mapping]     # read-only
+
+    @classmethod
+    def from_conf(cls, conf: dict) -> 'CaptureSettings':
+        """
+        :param conf: PyLS3_Conf['Capture']
+        """
+        streaming = conf.get('Streaming') or {}
+        trigger_mode = _choice('Capture', 'TriggerMode', conf['TriggerMode'], TRIGGER_MODES)
+        if trigger_mode == 'combined' and not conf.get('CombinedTrigger'):
+            raise ValueError("Capture: TriggerMode 'combined' needs a CombinedTrigger")
+        return cls(
+            file_format=_choice('Capture', 'FileFormat', conf['FileFormat'], FILE_FORMATS),
+            capture_mode=_choice('Capture', 'CaptureMode', conf['CaptureMode'], CAPTURE_MODES),
+            trigger_mode=trigger_mode,
+            start_trigger=float(conf['StartTrigger']),
+            stop_trigger=float(conf['StopTrigger']),
+            min_capture_ns=int(float(conf['MinCaptureTime_s']) * 1e9),
+            max_capture_ns=int(float(conf['MaxCaptureTime_s']) * 1e9),
+            min_capture_time_s=float(conf['MinCaptureTime_s']),
+            max_capture_time_s=float(conf['MaxCaptureTime_s']),
+            precapture_time_s=float(conf['PreCaptureTime_s']),
+            auto_generate_plot=bool(conf['AutoGeneratePlot']),
+            streaming=bool(streaming.get('Enabled', False)),
+            chunk_time_s=float(streaming.get('ChunkTime_s', 1)),
+            fsync=bool(streaming.get('Fsync', True)),
+            max_pending_chunks=int(streaming.get('MaxPendingChunks', 8)),
+            combined_trigger=freeze(conf['CombinedTrigger']) if conf.get('CombinedTrigger') else None,
+        )
+
+
+@frozen_slots
+class PipelineSettings:
+    enabled: bool
+    queue_size: int
+    overflow_policy: str
+
+    @classmethod
+    def from_conf(cls, conf: dict) -> 'PipelineSettings':
+        """
+        :param conf: PyLS3_Conf['Pipeline']
+        """
+        return cls(bool(conf['Enabled']), int(conf['QueueSize']), _choice('Pipeline', 'OverflowPolicy', conf['OverflowPolicy'], OVERFLOW_POLICIES))
+
+
+@frozen_slots
+class CommandAckSettings:
+    timeout_s: float
+    retries: int
+    backoff: float
+    quiet_time_s: float
+    no_ack_delay_s: float
+
+    @classmethod
+    def from_conf(cls, conf: dict) -> 'CommandAckSettings':
+        """
+        :param conf: PyLS3_Conf['CommandAck']
+        """
+        return cls(conf['Timeout_s'], int(conf['Retries']), conf['Backoff'], conf['QuietTime_s'], conf['NoAckDelay_s'])
+
+
+@frozen_slots
+class ServerSettings:
+    enabled: bool
+    host: str
+    tcp_port: int
+    websocket_port: int
+    client_queue_size: int
+    decimation: int
+
+    @classmethod
+    def from_conf(cls, conf: dict) -> 'ServerSettings':
+        """
+        :param conf: PyLS3_Conf['Server']
+        """
+        decimation = int(conf['Decimation'])
+        if decimation < 1:
+            raise ValueError(f"Server: Decimation '{decimation}' is not valid (use 1 or more)")
+        return cls(bool(conf['Enabled']), str(conf['Host']), int(conf['TcpPort']), int(conf['WebSocketPort']), int(conf['ClientQueueSize']), decimation)
+
+
+@frozen_slots
+class DeviceSettings:
+    name: str
+    connection_type: str
+    version: float
+    mac: str
+    usb: Optional[str]
+    usb_speed: int
+    timing_correction_factor: float
+    initial_commands: tuple
+    onboardlogging_row_index_list: tuple
+    onboardlogging_folder: str          # folder of the OnboardLogging files (and the manifest) of this device
+
+    @classmethod
+    def from_conf(cls, conf: dict, device_name: str) -> 'DeviceSettings':
+        """
+        :param conf: PyLS3_Conf
+        :param device_name: name of the device (UseDevices)
+        """
+        use_device = conf['UseDevices'][device_name]
+        device = conf['Device'].get(device_name, {})
+        version_specific = conf['LS3OS']['VersionSpecific']
+        version = max((v for v in version_specific if v <= device.get('Version', 0)), default=None)
+        row_index_list = version_specific[version]['OnboardLogging_row_index_list'] if version is not None else []
+        mac = device.get('MAC', '')
+        return cls(
+            name=device_name,
+            connection_type=_choice(device_name, 'ConnectionType', use_device['ConnectionType'], CONNECTION_TYPES),
+            version=device.get('Version', 0),
+            mac=mac,
+            usb=device.get('USB'),
+            usb_speed=device.get('USB_Speed', 230400),
+            timing_correction_factor=device.get('TimingCorrectionFactor', 1.0),
+            initial_commands=tuple(use_device.get('InitialCommands') or ()),
+            onboardlogging_row_index_list=tuple(row_index_list),
+            onboardlogging_folder=f"{conf['Path']['OnboardLogging']}/LS{''.join(mac.split(':')[3:])}",
+        )
+
+
+@frozen_slots
+class Settings:
+    """
+    Validated settings, built once from PyLS3_Conf (see from_conf).
+    The connections read their settings from here instead of the nested PyLS3_Conf dicts,
+    conf is kept for the rarely used sections (OnboardLogging, LS3OS, Commands, ...).
+    Like the attributes, devices and conf are read-only (MappingProxyType, lists as tuples).
+    """
+    message_codes: MessageCodes
+    capture: CaptureSettings
+    pipeline: PipelineSettings
+    command_ack: CommandAckSettings
+    server: ServerSettings
+    statistics_window_s: float
+    statistics_rate_warning: float
+    reconnect_delay_s: float
+    devices: Mapping            # device_name -> DeviceSettings (UseDevices without ConnectionType none)
+    conf: Mapping               # PyLS3_Conf
+
+    @classmethod
+    def from_conf(cls, conf: dict) -> 'Settings':
+        """
+        :param conf: PyLS3_Conf
+        :raises ValueError: if a setting is not valid
+        """
+        conf = freeze(conf)
+        return cls(
+            message_codes=MessageCodes.from_conf(conf['MessageCode']),
+            capture=CaptureSettings.from_conf(conf['Capture']),
+            pipeline=PipelineSettings.from_conf(conf['Pipeline']),
+            command_ack=CommandAckSettings.from_conf(conf['CommandAck']),
+            server=ServerSettings.from_conf(conf['Server']),
+            statistics_window_s=conf['Statistics']['Window_s'],
+            statistics_rate_warning=conf['Statistics']['RateWarning'],
+            reconnect_delay_s=conf['Discovery']['ReconnectDelay_s'],
+            devices=MappingProxyType({device_name: device for device_name, device in
+                                      ((d, DeviceSettings.from_conf(conf, d)) for d in conf['UseDevices']) if device.connection_type != 'none'}),
+            conf=conf,
+        )
+
+    def device(self, device_name: str) -> DeviceSettings:
+        """
+        :return: settings of the device (also for devices which are not in UseDevices, e.g. a library client)
+        """
+        device = self.devices.get(device_name)
+        if device is None:
+            conf = {**self.conf, 'UseDevices': {device_name: {'ConnectionType': 'USB'}}}
+            device = DeviceSettings.from_conf(conf, device_name)
+        return device
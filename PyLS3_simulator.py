@@ -0,0 +1,405 @@
+#!/usr/bin/python3
+"""
+LS3 simulator: emits the live data of a LineScale 3 (20 byte frames) and answers the LS3 commands,
+e.g. to run PyLS3 and load tests of the receive path without hardware.
+Transports: PtyTransport (fake serial port, e.g. for PyLS3.py) and SimulatedBleakClient (in-process BLE stand-in).
+usage: python PyLS3_simulator.py [-s SPEED] [--replay FILE] (prints the serial port to use as Device USB)
+"""
+import argparse
+import asyncio
+import inspect
+import os
+import re
+import time
+from collections import deque
+from typing import Callable
+import numpy as np
+from PyLS3_frame import FRAME_DTYPE
+
+
+# device codes (see MessageCode in PyLS3_AppCfg.yml)
+SPEED_CODES = {10: b'S', 40: b'F', 640: b'M', 1280: b'Q'}
+UNIT_CODES = {'kN': b'N', 'kgf': b'G', 'lbf': b'B'}
+MEASURE_MODE_CODES = {'ABS': b'N', 'REL': b'Z'}
+
+
+def sine_signal(sample_index: np.ndarray, speed: int) -> np.ndarray:
+    """
+    Default signal: 0.5Hz sine with amplitude 1.0
+    """
+    return np.sin(np.pi * sample_index / speed)
+
+
+def encode_frames(values: np.ndarray, working_mode: bytes = b'R', measure_mode: bytes = b'N', reference_zero: float = 0.0,
+                  electric_quantity: int = 90, unit_value: bytes = b'N', speed_value: bytes = b'Q') -> bytes:
+    """
+    Encodes the values to LS3 frames (PyLS3_frame.FRAME_DTYPE)
+    :param values: measured values (formatted like the LS3: 6 characters, e.g. 012.34, -01.50)
+    :param electric_quantity: battery in % (the LS3 sends 32 + % / 2)
+    :return: frames (20 bytes per value)
+    """
+    frames = np.empty(len(values), dtype=FRAME_DTYPE)
+    frames['working_mode'] = working_mode
+    frames['measured_value'] = np.char.encode(np.char.mod('%06.2f', np.asarray(values, dtype=np.float64)), 'ascii')
+    frames['measure_mode'] = measure_mode
+    frames['reference_zero'] = f"{reference_zero:06.2f}".encode('ascii')
+    frames['electric_quantity'] = 32 + electric_quantity // 2
+    frames['unit_value'] = unit_value
+    frames['speed_value'] = speed_value
+    frames['check_value'] = b'00'       # not evaluated by PyLS3
+    frames['control'] = b'\r'
+    return frames.tobytes()
+
+
+class ReplaySignal:
+    """
+    Replays the measured values of a PyLS3 capture csv or an OnboardLogging csv (repeated at the end)
+    """
+
+    def __init__(self, file: str, data_start: int = None):
+        """
+        :param file: csv file
+        :param data_start: first data row of an OnboardLogging file (default: trailing rows with a number)
+        """
+        self.file = file
+        self.speed = None
+        values = []
+        with open(file, 'r') as infile:
+            lines = [line.strip() for line in infile if line.strip()]
+        if lines and len(lines[0].split(',')) >= 11:
+            # PyLS3 capture: device, time, timestamp, delay, value, unit, reference zero, mode, speed, battery, working mode
+            for line in lines:
+                row = [c.strip() for c in line.split(',')]
+                values.append(float(row[4]))
+            self.speed = int(lines[0].split(',')[8].strip().replace('Hz', ''))
+        else:
+            # OnboardLogging: header rows, one value per row
+            if data_start is None:
+                data_start = len(lines)
+                while data_start and re.fullmatch(r'-?[0-9]+(\.[0-9]+)?', lines[data_start - 1]):
+                    data_start -= 1
+            values = [float(line) for line in lines[data_start:]]
+            for line in lines[:data_start]:
+                match = re.search(r'Speed=([0-9]+)|([0-9]+)HZ', line, re.IGNORECASE)
+                if match:
+                    self.speed = int(match.group(1) or match.group(2))
+        if not values:
+            raise ValueError(f"Replay: no values in {file}")
+        self.values = np.array(values, dtype=np.float64)
+
+    def __call__(self, sample_index: np.ndarray, speed: int) -> np.ndarray:
+        return self.values[sample_index % self.values.size]
+
+
+class SimulatedLS3:
+    """
+    Behaves like a LS3 on the wire: the live data is sent after ActivateLogging (at the speed of the device),
+    the commands (unit, speed, mode, ReadLog) change the state like the device does.
+    Optional: noise, corrupted frames (bytes lost, flipped or garbage inserted) and burst delivery.
+    """
+
+    def __init__(self, speed: int = 40, signal: Callable = None, noise: float = 0.0, corruption: float = 0.0, burst_frames: int = 0,
+                 unit: str = 'kN', measure_mode: str = 'ABS', electric_quantity: int = 90, onboard_logs: list = None, seed: int = None):
+        """
+        :param speed: 10 40 640 1280 (Hz)
+        :param signal: signal(sample_index, speed) -> values (default: sine_signal, ReplaySignal to replay a file)
+        :param noise: standard deviation of the gaussian noise added to the values
+        :param corruption: probability of a corrupted frame
+        :param burst_frames: frames per write (0: 10ms of data per write)
+        :param onboard_logs: logs for ReadLog1..n (list of lines without 'End', see PyLS3_onboardlogging)
+        :param seed: seed of the random generator (noise, corruption)
+        """
+        if speed not in SPEED_CODES:
+            raise ValueError(f"Simulator: speed {speed} is not valid (use {', '.join(map(str, SPEED_CODES))})")
+        self.speed = speed
+        self.signal = signal or sine_signal
+        self.noise = noise
+        self.corruption = corruption
+        self.burst_frames = burst_frames
+        self.unit_value = UNIT_CODES[unit]
+        self.measure_mode = MEASURE_MODE_CODES[measure_mode]
+        self.electric_quantity = electric_quantity
+        self.reference_zero = 0.0
+        self.onboard_logs = onboard_logs or []
+        self.random = np.random.default_rng(seed)
+        self.logging = False
+        self.sample_index = 0
+        self.replies = deque()
+        self.reply_available = asyncio.Event()
+        self.commands = b''
+
+        self.frames_sent = 0
+        self.frames_corrupted = 0
+        self.bytes_sent = 0
+
+    def receive(self, data: bytes) -> None:
+        """
+        Commands from PyLS3 (<letter>[<2 digits>] CR LF <crc>)
+        """
+        self.commands += data
+        while True:
+            end = self.commands.find(b'\r\n')
+            if end == -1 or len(self.commands) < end + 3:
+                break
+            command = self.commands[:end]
+            self.commands = self.commands[end + 3:]
+            self.command(command.decode('ascii', errors='replace'))
+
+    def command(self, command: str) -> None:
+        letter = command[:1]
+        if letter == 'A':
+            self.logging = True
+        elif letter == 'E':
+            self.logging = False
+        elif letter in ('N', 'G', 'B'):
+            self.unit_value = letter.encode('ascii')
+        elif letter in ('S', 'F', 'M', 'Q'):
+            self.speed = {code: speed for speed, code in SPEED_CODES.items()}[letter.encode('ascii')]
+        elif letter == 'Y':
+            self.measure_mode = MEASURE_MODE_CODES['ABS']
+        elif letter == 'X':
+            self.measure_mode = MEASURE_MODE_CODES['REL']
+        elif letter == 'L':
+            self.measure_mode = MEASURE_MODE_CODES['REL'] if self.measure_mode == MEASURE_MODE_CODES['ABS'] else MEASURE_MODE_CODES['ABS']
+        elif letter == 'R' and command[1:3].isdigit():
+            self.reply(self.read_log(int(command[1:3])))
+
+    def read_log(self, index: int) -> bytes:
+        """
+        :param index: 0 for ReadLog1
+        :return: answer of the ReadLog command
+        """
+        lines = [f"R{index:02d}"]
+        if index < len(self.onboard_logs):
+            lines += self.onboard_logs[index]
+        lines.append('End')
+        return ''.join(f"{line}\r\n" for line in lines).encode('ascii')
+
+    def reply(self, data: bytes) -> None:
+        self.replies.append(data)
+        self.reply_available.set()
+
+    def frames(self, count: int) -> bytes:
+        """
+        :return: the next count frames (with noise and corruption)
+        """
+        index = np.arange(self.sample_index, self.sample_index + count)
+        self.sample_index += count
+        values = self.signal(index, self.speed)
+        if self.noise:
+            values = values + self.random.normal(0.0, self.noise, count)
+        data = encode_frames(values, b'R', self.measure_mode, self.reference_zero, self.electric_quantity, self.unit_value, SPEED_CODES[self.speed])
+        self.frames_sent += count
+        if self.corruption:
+            data = self.corrupt(data, count)
+        return data
+
+    def corrupt(self, data: bytes, count: int) -> bytes:
+        corrupt = np.flatnonzero(self.random.random(count) < self.corruption)
+        if not corrupt.size:
+            return data
+        self.frames_corrupted += corrupt.size
+        data = bytearray(data)
+        for frame in corrupt[::-1].tolist():
+            position = frame * 20 + int(self.random.integers(0, 19))
+            kind = int(self.random.integers(0, 3))
+            if kind == 0:
+                del data[position]                  # byte lost
+            elif kind == 1:
+                data[position] = 0x3F               # byte changed
+            else:
+                data[position:position] = b'X\r12'  # garbage inserted
+        return bytes(data)
+
+    async def run(self, write: Callable) -> None:
+        """
+        Send the data till cancelled
+        :param write: write(data) (could be a coroutine function)
+        """
+        loop = asyncio.get_running_loop()
+        is_coroutine = inspect.iscoroutinefunction(write)
+        start = loop.time()
+        due_sent = 0        # frames sent since start (logging active)
+        while True:
+            while self.replies:
+                data = self.replies.popleft()
+                await write(data) if is_coroutine else write(data)
+            if not self.logging:
+                self.reply_available.clear()
+                try:
+                    await asyncio.wait_for(self.reply_available.wait(), timeout=0.01)
+                except asyncio.TimeoutError:
+                    pass
+                start = loop.time()
+                due_sent = 0
+                continue
+            burst = self.burst_frames or max(self.speed // 100, 1)
+            due = int((loop.time() - start) * self.speed) - due_sent
+            if due >= burst:
+                due -= due % burst
+                data = self.frames(due)
+                due_sent += due
+                self.bytes_sent += len(data)
+                await write(data) if is_coroutine else write(data)
+            await asyncio.sleep(burst / self.speed / 2)
+
+    def status(self) -> dict:
+        return {'speed': self.speed, 'logging': self.logging, 'frames': self.frames_sent, 'corrupted': self.frames_corrupted, 'bytes': self.bytes_sent}
+
+
+class PtyTransport:
+    """
+    Fake serial port (pseudo terminal) for a SimulatedLS3, the port could be opened like a USB serial port (Linux, macOS)
+    """
+
+    def __init__(self, simulator: SimulatedLS3):
+        import tty
+        self.simulator = simulator
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)          # no echo, no CR/LF translation
+        self.port = os.ttyname(self.slave)
+        os.set_blocking(self.master, False)
+        self.buffer = bytearray()
+        self.task = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.master, self.readable)
+        self.task = asyncio.create_task(self.simulator.run(self.write))
+
+    def readable(self) -> None:
+        try:
+            self.simulator.receive(os.read(self.master, 4096))
+        except OSError:
+            pass
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        self.writable()
+
+    def writable(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            written = os.write(self.master, self.buffer)
+        except BlockingIOError:
+            written = 0
+        except OSError:
+            # no reader: the data is lost like on the device
+            written = len(self.buffer)
+        del self.buffer[:written]
+        if self.buffer:
+            loop.add_writer(self.master, self.writable)
+        else:
+            loop.remove_writer(self.master)
+
+    async def close(self) -> None:
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self.master)
+        loop.remove_writer(self.master)
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class SimulatedDevice:
+    """
+    BLE device found by SimulatedDiscovery (like bleak's BLEDevice)
+    """
+
+    def __init__(self, address: str, simulator: SimulatedLS3):
+        self.address = address
+        self.name = 'LineScale3 (simulated)'
+        self.simulator = simulator
+
+
+class SimulatedBleakClient:
+    """
+    In-process stand-in for bleak.BleakClient (see BluetoothConnection.ble_client_factory)
+    """
+
+    def __init__(self, device: SimulatedDevice, disconnected_callback: Callable = None):
+        self.device = device
+        self.simulator = device.simulator
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self.task = None
+
+    async def connect(self) -> bool:
+        self.is_connected = True
+        return True
+
+    async def start_notify(self, characteristic: str, callback: Callable) -> None:
+        self.task = asyncio.create_task(self.simulator.run(lambda data: callback(characteristic, bytearray(data))))
+
+    async def stop_notify(self, characteristic: str) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def write_gatt_char(self, characteristic: str, data: bytes, response: bool = False) -> None:
+        self.simulator.receive(bytes(data))
+
+    async def disconnect(self) -> bool:
+        if not self.is_connected:
+            return True
+        await self.stop_notify('')
+        self.is_connected = False
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+        return True
+
+
+class SimulatedDiscovery:
+    """
+    Stand-in for PyLS3_discovery.DeviceDiscovery: the simulated devices are found at once
+    """
+
+    def __init__(self, devices: dict):
+        """
+        :param devices: device_name -> SimulatedDevice (BLE) | serial port (e.g. PtyTransport.port)
+        """
+        self.devices = devices
+
+    def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def wait_ble(self, device_name: str, address: str) -> SimulatedDevice:
+        return self.devices[device_name]
+
+    async def wait_port(self, device_name: str, port: str) -> str:
+        return self.devices[device_name]
+
+
+async def main(args) -> None:
+    signal = ReplaySignal(args.replay) if args.replay else None
+    speed = args.speed or (signal.speed if signal and signal.speed in SPEED_CODES else 40)
+    simulator = SimulatedLS3(speed, signal, args.noise, args.corruption, args.burst_frames, seed=args.seed)
+    transport = PtyTransport(simulator)
+    await transport.start()
+    print(f"Simulated LS3 on serial port {transport.port} (Device: USB: {transport.port}), Ctrl+C to stop")
+    try:
+        while True:
+            await asyncio.sleep(5)
+            print(f"{time.strftime('%H:%M:%S')} {simulator.status()}")
+    finally:
+        await transport.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='PyLS3 - LS3 simulator (fake serial port)', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-s', '--speed', default=0, type=int, help='Start speed 10 40 640 1280 (Hz, default: speed of the replay file or 40)')
+    parser.add_argument('-r', '--replay', default=None, help='Replay the values of a PyLS3 capture or OnboardLogging csv file')
+    parser.add_argument('-n', '--noise', default=0.0, type=float, help='Standard deviation of the noise')
+    parser.add_argument('-c', '--corruption', default=0.0, type=float, help='Probability of a corrupted frame')
+    parser.add_argument('-b', '--burst_frames', default=0, type=int, help='Frames per write (0: 10ms of data)')
+    parser.add_argument('--seed', default=None, type=int, help='Seed of the random generator')
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+from bisect import bisect_right
+
+# upper bounds of the inter-arrival histogram bins (ms), the last bin is everything above
+JITTER_BINS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class RxStatistics:
+    """
+    Live receive statistics of one device, all accumulators are updated in constant time per received packet:
+    - effective sample rate and bytes/s (per window and as exponential moving average)
+    - estimated lost frames (expected frames at the configured speed - received frames)
+    - inter-arrival time of the packets (mean, std, histogram)
+    """
+
+    def __init__(self, window_s: float = 5.0, rate_warning: float = 0.9, ema_alpha: float = 0.3):
+        """
+        :param window_s: length of a rate window in seconds
+        :param rate_warning: warn if the sample rate of a window is below rate_warning * configured speed (0 = off)
+        :param ema_alpha: weight of the last window for the moving averages
+        """
+        self.window_s = window_s
+        self.rate_warning = rate_warning
+        self.ema_alpha = ema_alpha
+        self.reset()
+
+    def reset(self, speed: int = 0) -> None:
+        self.speed = speed
+        self.start_time = None
+        self.last_time = None
+        self.frames_total = 0
+        self.bytes_total = 0
+        self.packets_total = 0
+        # frames received after the first packet (the expected frames are counted from the first packet)
+        self.frames_since_start = 0
+        # window
+        self.window_start = None
+        self.window_frames = 0
+        self.window_bytes = 0
+        self.sample_rate = 0.0
+        self.byte_rate = 0.0
+        self.sample_rate_ema = 0.0
+        self.byte_rate_ema = 0.0
+        self.windows_low_rate = 0
+        # inter-arrival (Welford)
+        self.interval_count = 0
+        self.interval_mean = 0.0
+        self.interval_m2 = 0.0
+        self.interval_max = 0.0
+        self.jitter_histogram = [0] * (len(JITTER_BINS_MS) + 1)
+
+    def update(self, timestamp: float, nbytes: int, frames: int, speed: int = 0) -> bool:
+        """
+        :param timestamp: receive time of the packet (s)
+        :param nbytes: received bytes
+        :param frames: decoded frames
+        :param speed: configured speed (Hz) of the device, the statistics are reset if it changes
+        :return: True if a window was closed with a sample rate below rate_warning * speed
+        """
+        if speed != self.speed:
+            self.reset(speed)
+        self.packets_total += 1
+        self.frames_total += frames
+        self.bytes_total += nbytes
+        if self.start_time is None:
+            self.start_time = self.window_start = timestamp
+            self.last_time = timestamp
+            return False
+        self.frames_since_start += frames
+
+        interval = timestamp - self.last_time
+        self.last_time = timestamp
+        self.interval_count += 1
+        delta = interval - self.interval_mean
+        self.interval_mean += delta / self.interval_count
+        self.interval_m2 += delta * (interval - self.interval_mean)
+        self.interval_max = max(self.interval_max, interval)
+        self.jitter_histogram[bisect_right(JITTER_BINS_MS, interval * 1000)] += 1
+
+        self.window_frames += frames
+        self.window_bytes += nbytes
+        window_duration = timestamp - self.window_start
+        if window_duration < self.window_s:
+            return False
+        self.window_start = timestamp
+        return self.window_close(window_duration)
+
+    def window_close(self, duration: float) -> bool:
+        self.sample_rate = self.window_frames / duration
+        self.byte_rate = self.window_bytes / duration
+        if self.sample_rate_ema:
+            self.sample_rate_ema += self.ema_alpha * (self.sample_rate - self.sample_rate_ema)
+            self.byte_rate_ema += self.ema_alpha * (self.byte_rate - self.byte_rate_ema)
+        else:
+            self.sample_rate_ema = self.sample_rate
+            self.byte_rate_ema = self.byte_rate
+        self.window_frames = 0
+        self.window_bytes = 0
+        if self.rate_warning and self.speed and self.sample_rate < self.rate_warning * self.speed:
+            self.windows_low_rate += 1
+            return True
+        return False
+
+    @property
+    def lost_frames(self) -> int:
+        if not self.speed or self.last_time is None:
+            return 0
+        expected = round(self.speed * (self.last_time - self.start_time))
+        return max(expected - self.frames_since_start, 0)
+
+    @property
+    def interval_std(self) -> float:
+        return (self.interval_m2 / (self.interval_count - 1)) ** 0.5 if self.interval_count > 1 else 0.0
+
+    def status(self) -> dict:
+        histogram = {f"<{b}ms": n for b, n in zip(JITTER_BINS_MS, self.jitter_histogram)}
+        histogram[f">={JITTER_BINS_MS[-1]}ms"] = self.jitter_histogram[-1]
+        return {
+            'speed_Hz': self.speed,
+            'sample_rate_Hz': round(self.sample_rate, 1),
+            'sample_rate_avg_Hz': round(self.sample_rate_ema, 1),
+            'bytes_per_s': round(self.byte_rate, 1),
+            'bytes_per_s_avg': round(self.byte_rate_ema, 1),
+            'frames': self.frames_total,
+            'bytes': self.bytes_total,
+            'packets': self.packets_total,
+            'lost_frames_est': self.lost_frames,
+            'windows_low_rate': self.windows_low_rate,
+            'interval_mean_ms': round(self.interval_mean * 1000, 3),
+            'interval_std_ms': round(self.interval_std * 1000, 3),
+            'interval_max_ms': round(self.interval_max * 1000, 3),
+            'interval_histogram': histogram,
+        }
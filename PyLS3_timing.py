@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+import time
+import numpy as np
+
+
+class ClockAnchor:
+    """
+    Relation between the monotonic high resolution clock (perf_counter_ns) and the wall clock.
+    All receive times are taken from the monotonic clock, they are converted to wall clock time with one anchor
+    (set again at the start of each capture), so steps of the system clock don't affect a capture.
+    """
+
+    def __init__(self):
+        self.anchor()
+
+    def anchor(self) -> None:
+        self.mono_ns = time.perf_counter_ns()
+        self.wall_ns = time.time_ns()
+
+    def to_wall(self, mono_ns):
+        """
+        :param mono_ns: perf_counter_ns value(s), int or int64 array
+        :return: wall clock time in seconds (float or float64 array)
+        """
+        return (self.wall_ns + (mono_ns - self.mono_ns)) / 1e9
+
+
+class FrameClock:
+    """
+    Reconstructs the time of each frame of a received packet from the nominal device rate.
+    The frames of a packet are spaced by the estimated frame period, the last frame of a packet can't be
+    later than the arrival of the packet and the first frame can't be earlier than the last frame of the
+    previous packet (the frames are spaced closer if both can't be met with the period). The period is estimated online from the arrival times over a
+    long baseline (drift estimator), factor = measured rate / nominal rate is the live equivalent of
+    the TimingCorrectionFactor of the devices.
+    """
+
+    def __init__(self, gain: float = 0.05, baseline_s: float = 2.0, resync_s: float = 0.25, max_drift: float = 0.2):
+        """
+        :param gain: fraction of the arrival latency which is corrected per packet (phase)
+        :param baseline_s: min. time span for the period estimation
+        :param resync_s: the frame times are anchored again to the arrival time, if they are off more than this (gap, lost data)
+        :param max_drift: max. deviation of the estimated rate from the nominal rate
+        """
+        self.gain = gain
+        self.baseline_ns = int(baseline_s * 1e9)
+        self.resync_ns = int(resync_s * 1e9)
+        self.max_drift = max_drift
+        self.reset()
+
+    def reset(self, speed: int = 0, factor: float = 1.0) -> None:
+        """
+        :param speed: nominal rate of the device (Hz)
+        :param factor: initial rate correction (e.g. TimingCorrectionFactor)
+        """
+        self.speed = speed
+        self.factor = factor
+        self.nominal_period_ns = 1e9 / speed if speed else 0.0
+        self.period_ns = self.nominal_period_ns / factor if speed else 0.0
+        self.next_ns = None
+        self.last_ns = None
+        self.reference_ns = None
+        self.reference_frames = 0
+        self.resyncs = 0
+
+    def timestamps(self, arrival_ns: int, frames: int) -> np.ndarray:
+        """
+        :param arrival_ns: arrival time of the packet (perf_counter_ns)
+        :param frames: number of frames in the packet
+        :return: int64 array with the time of each frame (perf_counter_ns)
+        """
+        if not self.speed:
+            return np.full(frames, arrival_ns, dtype=np.int64)
+        offsets = np.arange(frames, dtype=np.float64) * self.period_ns
+        error = None if self.next_ns is None else arrival_ns - (self.next_ns + offsets[-1])
+        if error is None or abs(error) > self.resync_ns:
+            # (re)anchor: the last frame arrived with the packet
+            if error is not None:
+                self.resyncs += 1
+            start = arrival_ns - offsets[-1]
+            self.reference_ns = arrival_ns
+            self.reference_frames = 0
+        else:
+            # frames can't be received before they are measured
+            start = self.next_ns + min(error, self.gain * error)
+            self.estimate(arrival_ns, frames)
+        if self.last_ns is not None and start < self.last_ns:
+            # monotonic: the frames are spaced between the last frame of the previous packet and the arrival
+            start = self.last_ns
+            if frames > 1:
+                offsets *= min(1.0, max(arrival_ns - start, 0) / offsets[-1])
+        self.last_ns = start + offsets[-1]
+        self.next_ns = self.last_ns + self.period_ns
+        return (start + offsets).astype(np.int64)
+
+    def estimate(self, arrival_ns: int, frames: int) -> None:
+        """
+        Drift estimator: frames per time since the reference packet (first packet after a (re)anchor)
+        """
+        self.reference_frames += frames
+        elapsed_ns = arrival_ns - self.reference_ns
+        if elapsed_ns < self.baseline_ns:
+            return
+        factor = self.nominal_period_ns * self.reference_frames / elapsed_ns
+        if abs(factor - 1.0) <= self.max_drift:
+            self.factor = factor
+            self.period_ns = self.nominal_period_ns / factor
@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+import ast
+import logging
+from collections import deque
+import numpy as np
+
+
+logger = logging.getLogger("PyLS3")
+
+# nodes allowed in the Start/Stop expressions (condition names combined with and/or/not)
+_EXPRESSION_NODES = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.Name, ast.Load, ast.Constant)
+
+
+class ThresholdCondition:
+    """
+    rising: True when value >= Value, False again when value < Value - Hysteresis
+    falling: True when value <= Value, False again when value > Value + Hysteresis
+    """
+
+    def __init__(self, value: float, rising: bool = True, hysteresis: float = 0.0):
+        self.value = value
+        self.rising = rising
+        self.hysteresis = abs(hysteresis)
+        self.state = False
+
+    def update(self, value: float) -> bool:
+        if self.rising:
+            if value >= self.value:
+                self.state = True
+            elif value < self.value - self.hysteresis:
+                self.state = False
+        else:
+            if value <= self.value:
+                self.state = True
+            elif value > self.value + self.hysteresis:
+                self.state = False
+        return self.state
+
+
+class SlopeCondition:
+    """
+    Rate of change: the measured value changed by Value (or more) within the last Samples samples
+    (negative Value: decreased by Value or more). The last samples are kept in a ring buffer.
+    """
+
+    def __init__(self, value: float, samples: int):
+        self.value = value
+        self.history = deque(maxlen=max(int(samples), 1))
+        self.state = False
+
+    def update(self, value: float) -> bool:
+        if len(self.history) == self.history.maxlen:
+            change = value - self.history[0]
+            self.state = change >= self.value if self.value >= 0 else change <= self.value
+        self.history.append(value)
+        return self.state
+
+
+class PeakCondition:
+    """
+    Windowed peak: the maximum of the last Samples samples is >= Value (negative Value: the minimum is <= Value).
+    A monotonic deque keeps the window extreme, every sample is added and removed once.
+    """
+
+    def __init__(self, value: float, samples: int):
+        self.value = value
+        self.samples = max(int(samples), 1)
+        self.sign = 1.0 if value >= 0 else -1.0
+        self.window = deque()   # (index, sign * value), values are decreasing
+        self.index = 0
+        self.state = False
+
+    def update(self, value: float) -> bool:
+        self.index += 1
+        if value == value:  # skip nan
+            value *= self.sign
+            while self.window and self.window[-1][1] <= value:
+                self.window.pop()
+            self.window.append((self.index, value))
+        while self.window and self.window[0][0] <= self.index - self.samples:
+            self.window.popleft()
+        self.state = bool(self.window) and self.window[0][1] >= self.sign * self.value
+        return self.state
+
+
+def create_condition(conf: dict):
+    """
+    :param conf: condition configuration (see CombinedTrigger in PyLS3_UserCfg.yml)
+    :return: condition object
+    """
+    condition_type = conf['Type']
+    if condition_type in ('rising', 'falling'):
+        return ThresholdCondition(float(conf['Value']), condition_type == 'rising', float(conf.get('Hysteresis', 0.0)))
+    elif condition_type == 'slope':
+        return SlopeCondition(float(conf['Value']), conf['Samples'])
+    elif condition_type == 'peak':
+        return PeakCondition(float(conf['Value']), conf['Samples'])
+    raise ValueError(f"Unknown trigger condition type '{condition_type}'")
+
+
+def compile_expression(expression: str, names) -> object:
+    """
+    Compiles a boolean expression of condition names, e.g. 'LS3_1_high or LS3_2_high'
+    :param expression: and/or/not combination of condition names
+    :param names: valid condition names
+    :return: code object (eval with the condition states as namespace)
+    """
+    tree = ast.parse(str(expression), mode='eval')
+    for node in ast.walk(tree):
+        if not isinstance(node, _EXPRESSION_NODES):
+            raise ValueError(f"Trigger expression '{expression}': '{type(node).__name__}' is not allowed (use and, or, not)")
+        if isinstance(node, ast.Name) and node.id not in names:
+            raise ValueError(f"Trigger expression '{expression}': unknown condition '{node.id}'")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, bool):
+            raise ValueError(f"Trigger expression '{expression}': only True/False are allowed as constant")
+    return compile(tree, '<trigger>', 'eval')
+
+
+class TriggerEngine:
+    """
+    Multi-condition trigger (TriggerMode: combined), shared by all devices.
+    Conditions with a Device are only fed by this device, their state is visible to the expressions of every device.
+    Conditions without Device are evaluated for each device with its own samples.
+    All conditions are updated incrementally (constant time per sample).
+    """
+
+    def __init__(self, conf: dict):
+        """
+        :param conf: PyLS3_Conf['Capture']['CombinedTrigger']
+        """
+        self.condition_conf = conf['Conditions']
+        for name, condition_conf in self.condition_conf.items():
+            create_condition(condition_conf)  # validate
+        self.start_expression = compile_expression(conf['Start'], self.condition_conf)
+        self.stop_expression = compile_expression(conf['Stop'], self.condition_conf)
+        self.devices = {}       # device_name -> list of (name, condition, namespaces to update)
+        self.namespaces = {}    # device_name -> condition states for the expressions
+
+    def device_register(self, device_name: str) -> list:
+        namespace = {name: False for name in self.condition_conf}
+        self.namespaces[device_name] = namespace
+        conditions = []
+        for name, condition_conf in self.condition_conf.items():
+            device = condition_conf.get('Device')
+            if device is None:
+                conditions.append((name, create_condition(condition_conf), (namespace,)))
+            elif device == device_name:
+                conditions.append((name, create_condition(condition_conf), None))  # None: all namespaces
+        self.devices[device_name] = conditions
+        # states of already known device conditions
+        for other in self.devices.values():
+            for name, condition, namespaces in other:
+                if namespaces is None:
+                    namespace[name] = condition.state
+        logger.debug(f"Trigger: {device_name} registered ({len(conditions)} conditions)")
+        return conditions
+
+    def update(self, device_name: str, values: np.ndarray) -> tuple:
+        """
+        Feed the measured values of one device
+        :param device_name: name of the device
+        :param values: measured values (float array)
+        :return: start mask, stop mask (bool arrays, one value per sample)
+        """
+        conditions = self.devices.get(device_name)
+        if conditions is None:
+            conditions = self.device_register(device_name)
+        namespace = self.namespaces[device_name]
+        all_namespaces = tuple(self.namespaces.values())
+        start_expression = self.start_expression
+        stop_expression = self.stop_expression
+        start = np.zeros(values.size, dtype=bool)
+        stop = np.zeros(values.size, dtype=bool)
+        for i, value in enumerate(values.tolist()):
+            for name, condition, namespaces in conditions:
+                state = condition.update(value)
+                for n in namespaces or all_namespaces:
+                    n[name] = state
+            start[i] = eval(start_expression, {'__builtins__': {}}, namespace)
+            stop[i] = eval(stop_expression, {'__builtins__': {}}, namespace)
+        return start, stop
+
+    def reset(self) -> None:
+        self.devices.clear()
+        self.namespaces.clear()
@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark: LS3 frame decoding (former rx_data_handler loop vs. PyLS3_frame.FrameDecoder)
+usage: python misc/benchmark_frame_decoder.py [-n FRAMES] [-cs 20 40 244 4096] [-r 3]
+The batch decoder returns arrays (frames and float values) for the receive path, the former loop returned strings,
+"+float" is the former loop with the float() conversion of the measured value which the former capture did per frame,
+"samples" is the batch decoder with the conversion to samples (PyLS3_capture.frames_to_samples) like the decode stage.
+With one or two frames per chunk the numpy setup per chunk costs more than the former loop.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from PyLS3_capture import frames_to_samples  # noqa: E402
+from PyLS3_frame import FrameDecoder, frames_measured_value, frames_to_columns  # noqa: E402
+
+
+def generate_stream(frames: int, corrupt_every: int = 0) -> bytes:
+    stream = bytearray()
+    for i in range(frames):
+        value = f"{random.uniform(-9.99, 99.99):06.2f}"
+        stream += f"R{value}N000.00".encode("ASCII") + bytes([32 + 45]) + b"NQ00\r"
+        if corrupt_every and i % corrupt_every == 0:
+            stream += b"X\r12"
+    return bytes(stream)
+
+
+def legacy_decode(chunks: list, to_float: bool = False) -> list:
+    """
+    Copy of the former rx_data_handler parsing loop
+    :param to_float: also convert the measured value to float (as the trigger checks of the former capture)
+    """
+    result = []
+    rx_dataq = bytes()
+    for chunk in chunks:
+        rx_dataq += chunk
+        while True:
+            if len(rx_dataq) >= 20:
+                control_index = rx_dataq.find(b'\r')
+                if control_index == -1:
+                    rx_dataq = bytes()
+                    break
+                elif control_index < 19:
+                    rx_dataq = rx_dataq[control_index + 1:]
+                    continue
+                elif control_index > 19:
+                    rx_dataq = rx_dataq[control_index - 19:]
+                    continue
+                else:
+                    data = rx_dataq[0:20]
+                    rx_dataq = rx_dataq[20:]
+                    if to_float:
+                        try:
+                            float(data.decode("ASCII")[1:7])
+                        except ValueError:
+                            pass
+                    result.append((
+                        data.decode("ASCII")[0],
+                        data.decode("ASCII")[1:7],
+                        data.decode("ASCII")[7],
+                        data.decode("ASCII")[8:14],
+                        (data[14] - 32) * 2,
+                        data.decode("ASCII")[15],
+                        data.decode("ASCII")[16],
+                    ))
+            else:
+                break
+    return result
+
+
+def batch_decode(chunks: list) -> list:
+    """ Decodes to typed arrays (frame records and float values), like the receive path """
+    result = []
+    decoder = FrameDecoder()
+    for chunk in chunks:
+        frames = decoder.feed(chunk)
+        if frames.size:
+            result.append((frames, frames_measured_value(frames)))
+    return result
+
+
+def samples_decode(chunks: list) -> list:
+    """ Decodes to samples, like the decode stage of the receive path """
+    result = []
+    decoder = FrameDecoder()
+    for i, chunk in enumerate(chunks):
+        frames = decoder.feed(chunk)
+        if frames.size:
+            result.append(frames_to_samples(frames, float(i), 0, frames_measured_value(frames)))
+    return result
+
+
+def batch_to_tuples(result: list) -> list:
+    tuples = []
+    for frames, measured_value in result:
+        tuples.extend(zip(*frames_to_columns(frames)))
+    return tuples
+
+
+def run(function, chunks: list, repeat: int = 1) -> tuple:
+    """
+    :return: shortest duration of repeat runs, result
+    """
+    durations = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = function(chunks)
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='PyLS3 - frame decoder micro-benchmark', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-n', '--frames', default=200000, type=int, help='Number of frames')
+    parser.add_argument('-cs', '--chunk_size', default=[20, 40, 244, 4096], type=int, nargs='+',
+                        help='Bytes per received chunk (one run per value, 20: one frame per BLE notification, 244: BLE MTU, 4096: serial read size)')
+    parser.add_argument('-ce', '--corrupt_every', default=0, type=int, help='Insert corrupt bytes every n frames (0 = off)')
+    parser.add_argument('-r', '--repeat', default=3, type=int, help='Runs per decoder and chunk size (the fastest is reported)')
+    args = parser.parse_args()
+
+    random.seed(0)
+    stream = generate_stream(args.frames, args.corrupt_every)
+    print(f"{'chunk':>6s} {'frm/chunk':>9s} {'legacy':>15s} {'+float':>15s} {'batch':>15s} {'samples':>15s} {'speedup':>8s} {'+float':>7s}")
+    for chunk_size in args.chunk_size:
+        chunks = [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+        legacy_duration, legacy_result = run(legacy_decode, chunks, args.repeat)
+        float_duration, _ = run(lambda c: legacy_decode(c, to_float=True), chunks, args.repeat)
+        batch_duration, batch_result = run(batch_decode, chunks, args.repeat)
+        samples_duration, _ = run(samples_decode, chunks, args.repeat)
+        if legacy_result != batch_to_tuples(batch_result):
+            print(f"ERROR> decoded frames are different (chunk size {chunk_size})")
+            sys.exit(1)
+        print(f"{chunk_size:6d} {chunk_size / 20:9.1f} {legacy_duration / args.frames * 1e6:9.3f}us/frm {float_duration / args.frames * 1e6:9.3f}us/frm "
+              f"{batch_duration / args.frames * 1e6:9.3f}us/frm {samples_duration / args.frames * 1e6:9.3f}us/frm {legacy_duration / batch_duration:7.2f}x {float_duration / batch_duration:6.2f}x")
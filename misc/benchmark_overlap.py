@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+"""
+Benchmark: overlap detection of consecutive OnboardLogging files (PyLS3_overlap.find_overlap) with simulated logs
+usage: python misc/benchmark_overlap.py [-m 1 2 5] [-s 1280] [-p 2] [-rm 20]
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from PyLS3_overlap import find_overlap  # noqa: E402
+
+
+def find_overlap_slices(last: list, current: list) -> int:
+    """ previous implementation: compares list slices for every overlap length (reference) """
+    for i in range(min(len(last), len(current)), 0, -1):
+        if current[0:i] == last[len(last) - i:]:
+            return i - 1
+    return 0
+
+
+def simulated_logs(minutes: float, speed: int, pre: float, seed: int) -> tuple:
+    """
+    :return: two consecutive logs (float32 like the LS3 values with 2 decimals), the second repeats the last pre seconds
+    """
+    rng = np.random.default_rng(seed)
+    count = int(minutes * 60 * speed)
+    overlap = int(pre * speed)
+    values = np.round(np.cumsum(rng.normal(0, 0.05, 2 * count - overlap)), 2).astype(np.float32)
+    return values[:count], values[count - overlap:]
+
+
+def timed(function, *args) -> tuple:
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(args) -> None:
+    print(f"{'minutes':>8s} {'samples':>9s} {'overlap':>9s} {'expected':>9s} {'found':>9s} {'linear_ms':>10s} {'slices_ms':>10s}")
+    for minutes in args.minutes:
+        for pre in (args.pre, 0.0):
+            last, current = simulated_logs(minutes, args.speed, pre, args.seed)
+            if not pre:
+                current = current[::-1].copy()      # no overlap
+            expected = max(int(pre * args.speed) - 1, 0)
+            found, linear = timed(find_overlap, last, current, args.tolerance)
+            slices = '-'
+            if minutes * 60 <= args.reference_max:
+                reference, seconds = timed(find_overlap_slices, last.tolist(), current.tolist())
+                slices = f"{seconds * 1000:.1f}"
+                if reference != found:
+                    print(f"ERROR> reference: {reference} found: {found}")
+            print(f"{minutes:8g} {last.size:9d} {int(pre * args.speed):9d} {expected:9d} {found:9d} {linear * 1000:10.1f} {slices:>10s}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='PyLS3 - overlap detection benchmark with simulated OnboardLogging files', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-m', '--minutes', default=[1, 2, 5, 10], type=float, nargs='+', help='Length of the logs (one run per value)')
+    parser.add_argument('-s', '--speed', default=1280, type=int, help='Speed of the logs 10 40 640 1280 (Hz)')
+    parser.add_argument('-p', '--pre', default=2.0, type=float, help='Seconds repeated at the beginning of the second log')
+    parser.add_argument('-t', '--tolerance', default=0.0, type=float, help='Value tolerance of find_overlap (values rounded to multiples of it)')
+    parser.add_argument('-rm', '--reference_max', default=20.0, type=float, help='Max. seconds of the logs to run the previous implementation (quadratic)')
+    parser.add_argument('--seed', default=0, type=int, help='Seed of the simulated values')
+    main(parser.parse_args())
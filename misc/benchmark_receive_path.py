@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+"""
+Load test: receive path (rx_data_handler, decode and capture stages) with simulated LS3 devices (PyLS3_simulator)
+usage: python misc/benchmark_receive_path.py [-d 1 4 16] [-s 1280] [-t 5] [--pty]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import PyLS3  # noqa: E402
+from PyLS3_settings import Settings  # noqa: E402
+from PyLS3_simulator import PtyTransport, SimulatedLS3  # noqa: E402
+
+
+class SimulatedConnection(PyLS3.Connection):
+    """ Connection fed in-process by a SimulatedLS3 """
+
+    def __init__(self, device_name: str, simulator: SimulatedLS3):
+        super().__init__(device_name)
+        self.simulator = simulator
+        self.init_defaults()
+
+    def connection_lost(self) -> None:
+        pass
+
+    def data_received(self, data: bytes) -> None:
+        self.rx_data_handler(data)
+
+    async def data_send(self, data: bytes) -> None:
+        self.simulator.receive(data)
+
+
+async def open_devices(count: int, args) -> tuple:
+    """
+    :return: connections, simulators, tasks, close functions
+    """
+    connections, simulators, tasks, closers = [], [], [], []
+    for i in range(count):
+        simulator = SimulatedLS3(args.speed, noise=args.noise, corruption=args.corruption, burst_frames=args.burst_frames, seed=i)
+        simulators.append(simulator)
+        device_name = f"SIM_{i}"
+        if args.pty:
+            import serial_asyncio
+            transport = PtyTransport(simulator)
+            await transport.start()
+            serial_transport, connection = await serial_asyncio.create_serial_connection(
+                asyncio.get_running_loop(), lambda device_name=device_name: PyLS3.SerialConnection(device_name), transport.port, 460800)
+            closers += [serial_transport.close, transport.close]
+        else:
+            connection = SimulatedConnection(device_name, simulator)
+            tasks.append(asyncio.create_task(simulator.run(connection.data_received)))
+        connections.append(connection)
+    await asyncio.sleep(0)
+    await asyncio.gather(*(c.cmd_send('ActivateLogging') for c in connections))
+    return connections, simulators, tasks, closers
+
+
+async def run(count: int, args) -> dict:
+    connections, simulators, tasks, closers = await open_devices(count, args)
+    await asyncio.sleep(0.5)    # warm up
+    frames_start = [c.rx_data_counter for c in connections]
+    sent_start = [s.frames_sent for s in simulators]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    await asyncio.sleep(args.time)
+    duration = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    received = sum(c.rx_data_counter for c in connections) - sum(frames_start)
+    sent = sum(s.frames_sent for s in simulators) - sum(sent_start)
+    latency = [c.receive_pipeline.status()['capture']['latency_avg_ms'] for c in connections if c.receive_pipeline is not None]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for connection in connections:
+        await connection.receive_pipeline_close()
+    for close in closers:
+        result = close()
+        if asyncio.iscoroutine(result):
+            await result
+    PyLS3.Connection.device_object_list.clear()
+    return {
+        'devices': count,
+        'expected_hz': count * args.speed,
+        'received_hz': received / duration,
+        'received_pct': 100.0 * received / sent if sent else 0.0,
+        'cpu_pct': 100.0 * cpu / duration,
+        'latency_ms': max(latency) if latency else 0.0,
+    }
+
+
+async def main(args) -> None:
+    conf = PyLS3.deep_merge(PyLS3.yaml_load(args.appcfg), PyLS3.yaml_load(args.usercfg))
+    conf['Pipeline']['Enabled'] = not args.no_pipeline
+    PyLS3.Connection.settings = Settings.from_conf(conf)
+    print(f"{'devices':>8s} {'expected':>10s} {'received':>10s} {'recv%':>7s} {'cpu%':>7s} {'lat_ms':>7s}")
+    for count in args.devices:
+        result = await run(count, args)
+        print(f"{result['devices']:8d} {result['expected_hz']:8d}Hz {result['received_hz']:8.0f}Hz {result['received_pct']:7.2f} "
+              f"{result['cpu_pct']:7.1f} {result['latency_ms']:7.3f}")
+
+
+if __name__ == "__main__":
+    base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    parser = argparse.ArgumentParser(description='PyLS3 - receive path load test with simulated devices', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-d', '--devices', default=[1, 2, 4, 8], type=int, nargs='+', help='Number of simulated devices (one run per value)')
+    parser.add_argument('-s', '--speed', default=1280, type=int, help='Speed of the devices 10 40 640 1280 (Hz)')
+    parser.add_argument('-t', '--time', default=5.0, type=float, help='Seconds per run')
+    parser.add_argument('-n', '--noise', default=0.01, type=float, help='Standard deviation of the noise')
+    parser.add_argument('-c', '--corruption', default=0.0, type=float, help='Probability of a corrupted frame')
+    parser.add_argument('-b', '--burst_frames', default=0, type=int, help='Frames per write (0: 10ms of data)')
+    parser.add_argument('--pty', default=False, action='store_true', help='Use the serial path (pseudo terminal + SerialConnection) instead of in-process')
+    parser.add_argument('--no_pipeline', default=False, action='store_true', help='Decode and capture in the receive callback (Pipeline: Enabled: False)')
+    parser.add_argument('-ca', '--appcfg', default=os.path.join(base_dir, 'PyLS3_AppCfg.yml'), help='PyLS3 App configuration File')
+    parser.add_argument('-cu', '--usercfg', default=os.path.join(base_dir, 'PyLS3_UserCfg.yml'), help='PyLS3 User configuration File')
+    asyncio.run(main(parser.parse_args()))
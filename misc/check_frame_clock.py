@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+"""
+Check: frame times of PyLS3_timing.FrameClock with jittered packet arrivals (monotonic, not later than the arrival)
+usage: python misc/check_frame_clock.py [-s 1280] [-f 12] [-p 10000] [-j 5]
+"""
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from PyLS3_timing import FrameClock  # noqa: E402
+
+
+def stamp(clock: FrameClock, arrivals, frames) -> tuple:
+    """
+    :return: frame times, arrival time of the packet of each frame
+    """
+    times = [clock.timestamps(int(arrival), int(count)) for arrival, count in zip(arrivals, frames)]
+    return np.concatenate(times), np.repeat(np.asarray(arrivals, dtype=np.int64), frames)
+
+
+def check(name: str, speed: int, arrivals, frames) -> bool:
+    clock = FrameClock()
+    clock.reset(speed)
+    times, arrival = stamp(clock, arrivals, frames)
+    steps = np.diff(times)
+    late = times - arrival
+    ok = not (steps < 0).any() and not (late > 0).any()
+    print(f"{name:>10s} {len(arrivals):8d} {times.size:9d} {steps.min() / 1e3:10.1f} {late.max() / 1e3:10.1f} {clock.resyncs:8d} {'ok' if ok else 'ERROR'}")
+    return ok
+
+
+def main(args) -> None:
+    rng = np.random.default_rng(args.seed)
+    packet_ns = args.frames * 1e9 / args.speed
+    frames = np.full(args.packets, args.frames)
+    print(f"{'arrivals':>10s} {'packets':>8s} {'frames':>9s} {'min_step_us':>10s} {'max_late_us':>10s} {'resyncs':>8s}")
+    ok = check('early', args.speed, [0, 9_375_000, 17_000_000, 28_125_000], frames[:4])
+    ideal = np.arange(1, args.packets + 1) * packet_ns
+    jitter = np.maximum.accumulate(ideal + rng.exponential(args.jitter_ms * 1e6, args.packets))
+    ok &= check('jitter', args.speed, jitter, frames)
+    bursts = np.maximum.accumulate(ideal + rng.choice([0.0, 4 * packet_ns], args.packets, p=[0.9, 0.1]))
+    ok &= check('bursts', args.speed, bursts, frames)
+    gaps = ideal + np.where(np.arange(args.packets) >= args.packets // 2, 0.5e9, 0.0)
+    ok &= check('gap', args.speed, gaps, frames)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='PyLS3 - frame time reconstruction check with simulated packet arrivals', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-s', '--speed', default=1280, type=int, help='Speed of the device 10 40 640 1280 (Hz)')
+    parser.add_argument('-f', '--frames', default=12, type=int, help='Frames per packet')
+    parser.add_argument('-p', '--packets', default=10000, type=int, help='Packets per run')
+    parser.add_argument('-j', '--jitter_ms', default=5.0, type=float, help='Mean of the (exponential) arrival delay')
+    parser.add_argument('--seed', default=0, type=int, help='Seed of the simulated arrivals')
+    main(parser.parse_args())